@@ -1,10 +1,13 @@
+import json
 import logging
-from flask import Flask, session, render_template, flash, request, redirect, url_for, jsonify
+from flask import Flask, Response, session, render_template, flash, request, redirect, url_for, jsonify, stream_with_context
 from helpers.utility import init_app
-from helpers.params import get_params, get_flashes
+from helpers.params import get_params, get_flashes, is_cache_bypassed
 from helpers.validators.form_validator import validate_form_params
-from helpers.generators.output_generator import generate_output_text
-from helpers.validators.api_key_validator_storer import validate_store_api_key
+from helpers.generators.output_generator import generate_output_text, stream_output_text, get_generation_settings
+from helpers.generators.batch_generator import rewrite_batch
+from helpers.validators.api_key_validator_storer import validate_store_api_key, validate_api_key
+from helpers.metrics import render_metrics, require_scrape_access
 
 log = logging.getLogger(__name__)
 
@@ -15,37 +18,33 @@ init_app(app)
 @app.route('/log', methods=['POST'])
 def receive_log():
     try:
-        data = request.json
-        message = data.get('message', 'No message provided')
-        level = data.get('level', 'info').lower()
-        if level == 'debug':
-            log.debug(message)
-        elif level == 'info':
-            log.info(message)
-        elif level in {'warn', 'warning'}:
-            log.warning(message)
-        elif level == 'error':
-            log.error(message)
-        elif level == 'critical':
-            log.critical(message)
-        else:
-            log.info(f"Unknown log level '{level}': {message}")
-        return jsonify({"status": "success", "message": "Log received"}), 200
+        data = request.get_json(force=True, silent=True)
+        if data is None:
+            return jsonify({"status": "error", "message": "Invalid log payload"}), 400
+        entries = data.get('entries', data) if isinstance(data, dict) else data
+        client_id = (data.get('client_id') if isinstance(data, dict) else None) or request.remote_addr or 'unknown'
+        queued = app.extensions['client_log_ingestor'].submit(entries, str(client_id))
+        return jsonify({"status": "success", "message": "Log received", "queued": queued}), 202
     except Exception as e:
-        log.error(f"Error processing log: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        log.error("Error processing log: %s", e)
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@app.route('/metrics')
+def metrics():
+    require_scrape_access()
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
     parameters = get_params()
-    log.debug(f"Index route accessed. Parameters: {parameters}")
+    log.debug("Index route accessed. Parameters: %s", parameters)
     excluded_keys = {'api_key', 'input_text', 'output_texts'}
     missing_params = {k: v for k, v in parameters.items() if k not in request.args and k not in excluded_keys}
     if missing_params:
-        log.info(f"Missing parameters detected: {missing_params}. Redirecting to include them in the URL.")
+        log.info("Missing parameters detected: %s. Redirecting to include them in the URL.", missing_params)
         updated_url = url_for('index', **{**request.args, **missing_params})
         return redirect(updated_url)
-    log.info(f"Rendering index page with parameters: {parameters}")
+    log.info("Rendering index page.")
     return render_template('index.html', **parameters, **get_flashes())
 
 @app.route('/submit', methods=['POST'])
@@ -53,36 +52,37 @@ def submit_text():
     log.debug("Submit route accessed via POST request.")
     session['output_success'] = False
     parameters = get_params()
-    log.debug(f"Form parameters received: {parameters}")
+    log.debug("Form parameters received: %s", parameters)
     log.info("Starting API key validation...")
     error_messages = validate_store_api_key(parameters['api_key'])
     if error_messages:
         flash(error_messages, 'api_key')
-        log.error(f"API key validation failed with error: {error_messages}")
+        log.error("API key validation failed with error: %s", error_messages)
         return render_template('index.html', **parameters, **get_flashes())
     log.info("API key validation passed. Proceeding to form validation.")
     parameters, validation_errors = validate_form_params(parameters)
     num_outputs_warning = validation_errors.pop('num_outputs', None)
     if any(validation_errors.values()):
-        log.warning(f"Form validation returned errors: {validation_errors}")
+        log.warning("Form validation returned errors: %s", validation_errors)
         for category, message in validation_errors.items():
             flash(message, category)
         return render_template('index.html', **parameters, **get_flashes())
     if num_outputs_warning:
         flash(num_outputs_warning, 'num_outputs')
-        log.info(f"Issue with number of outputs: {num_outputs_warning}")
+        log.info("Issue with number of outputs: %s", num_outputs_warning)
     log.info("Proceeding to output generation.")
+    parameters['cache_bypass'] = is_cache_bypassed()
     try:
         parameters, output_texts, error_messages = generate_output_text(parameters)
     except Exception as e:
         fallback_error_message = "The OpenAI service is currently experiencing issues. Please try again later."
-        log.error(f"Critical error during output generation: {str(e)}")
+        log.error("Critical error during output generation: %s", e)
         flash(fallback_error_message, 'output_error')
         return render_template('index.html', **parameters, **get_flashes())
     if error_messages:
         for message in error_messages:
             flash(message, 'output_error')
-        log.error(f"Errors during output generation: {error_messages}")
+        log.error("Errors during output generation: %s", error_messages)
     filtered_outputs = [text if text else "" for text in output_texts]
     parameters['output_texts'] = filtered_outputs
     if not any(filtered_outputs):
@@ -90,8 +90,61 @@ def submit_text():
         return render_template('index.html', **parameters, **get_flashes())
     session['output_success'] = True
     log.debug("Session flag 'output_success' set to True.")
-    log.info(f"Rendering result with generated output and error messages. Parameters: {parameters}")
+    log.info("Rendering result with generated output and error messages.")
+    log.debug("Result parameters: %s", parameters)
     return render_template('index.html', **parameters, **get_flashes())
 
+def format_sse(event):
+    event = dict(event)
+    event_type = event.pop('event')
+    return f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/submit/stream', methods=['POST'])
+def submit_text_stream():
+    log.debug("Streaming submit route accessed via POST request.")
+    parameters = get_params()
+    error_messages = validate_store_api_key(parameters['api_key'])
+    if error_messages:
+        log.error("API key validation failed with error: %s", error_messages)
+        return jsonify({"status": "error", "errors": {'api_key': error_messages}}), 400
+    parameters, validation_errors = validate_form_params(parameters)
+    validation_errors.pop('num_outputs', None)
+    if any(validation_errors.values()):
+        log.warning("Form validation returned errors: %s", validation_errors)
+        return jsonify({"status": "error", "errors": validation_errors}), 400
+    log.info("Proceeding to streamed output generation.")
+    parameters['cache_bypass'] = is_cache_bypassed()
+
+    def generate():
+        for event in stream_output_text(parameters):
+            yield format_sse(event)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/rewrite', methods=['POST'])
+def rewrite_api():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list) or not data['jobs']:
+        return jsonify({"status": "error", "message": "Expected a JSON object with a non-empty 'jobs' array."}), 400
+    max_jobs = app.config['BATCH_MAX_JOBS']
+    if len(data['jobs']) > max_jobs:
+        return jsonify({"status": "error", "message": f"A batch may contain at most {max_jobs} jobs."}), 413
+    authorization = request.headers.get('Authorization', '')
+    api_key = authorization[len('Bearer '):].strip() if authorization.startswith('Bearer ') else str(data.get('api_key', ''))
+    error_message = validate_api_key(api_key)
+    if error_message:
+        return jsonify({"status": "error", "errors": {'api_key': error_message}}), 401
+    result = rewrite_batch(
+        data['jobs'], api_key, get_generation_settings(), app.config['BATCH_MAX_CONCURRENCY'], is_cache_bypassed()
+    )
+    succeeded = sum(job['status'] == 'success' for job in result['jobs'])
+    log.info("Batch rewrite finished: %s of %s jobs succeeded.", succeeded, len(result['jobs']))
+    status = "success" if succeeded == len(result['jobs']) else "partial" if succeeded else "error"
+    return jsonify({"status": status, **result})
+
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,94 @@
+import json
+import os
+import random
+
+STATIC_JSON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'json')
+RECORDED_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'recorded.jsonl')
+
+DIALECTS = ['american', 'british', 'australian']
+FORMALITIES = ['neutral', 'formal', 'casual']
+CHANNELS = ['chat', 'email']
+GREETINGS = ['include', 'exclude']
+
+# Sentences per synthetic text for each length bucket.
+LENGTHS = {'short': 1, 'medium': 4, 'long': 16}
+
+_FILLER = [
+    'the', 'team', 'will', 'review', 'our', 'plan', 'and', 'send', 'notes', 'about', 'next', 'week',
+    'we', 'should', 'meet', 'soon', 'to', 'discuss', 'details', 'with', 'everyone', 'on', 'project',
+]
+_CONTRACTIONS = ["I'm", "we've", "don't", "it's", "you'll", "can't", "that's"]
+_PUNCTUATION = ['.', '.', '.', '!', '?']
+
+def _load_json(name):
+    with open(os.path.join(STATIC_JSON, name), 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def all_parameter_combinations():
+    """
+    Returns every dialect, formality, channel and greetings combination as a
+    parameters dict that get_processing_plan accepts.
+    """
+    return [
+        {'dialect': dialect, 'formality': formality, 'channel': channel, 'greetings': greetings}
+        for dialect in DIALECTS
+        for formality in FORMALITIES
+        for channel in CHANNELS
+        for greetings in GREETINGS
+    ]
+
+def combination_id(parameters):
+    return '/'.join(parameters[key] for key in ('dialect', 'formality', 'channel', 'greetings'))
+
+def load_recorded_corpus():
+    """
+    Returns the recorded model outputs as a list of {'channel', 'text'} dicts.
+    """
+    with open(RECORDED_CORPUS, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def synthetic_text(sentences, seed):
+    """
+    Builds a deterministic text that exercises every post-processing stage: a
+    greeting, US spellings and vocabulary, slang phrases, contractions, dashes,
+    commas and a sign-off.
+
+    Args:
+        sentences (int): Number of body sentences.
+        seed (int): Seed for the random generator, so runs are reproducible.
+
+    Returns:
+        str: The text.
+    """
+    rng = random.Random(seed)
+    greetings = _load_json('greeting_patterns.json')
+    signoffs = _load_json('signoff_patterns.json')
+    us_words = list(_load_json('us_gb_spelling.json')) + list(_load_json('us_gb_vocabulary.json'))
+    slang_phrases = list(_load_json('text_slang.json'))
+
+    body = []
+    for _ in range(sentences):
+        words = rng.sample(_FILLER, 6)
+        words.insert(rng.randrange(len(words)), rng.choice(us_words))
+        words.insert(rng.randrange(len(words)), rng.choice(_CONTRACTIONS))
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(slang_phrases))
+        if rng.random() < 0.4:
+            words.insert(rng.randrange(1, len(words)), '-')
+        if rng.random() < 0.5:
+            words[rng.randrange(len(words))] += ','
+        sentence = ' '.join(words)
+        body.append(sentence[0].upper() + sentence[1:] + rng.choice(_PUNCTUATION))
+
+    greeting = rng.choice(greetings).capitalize()
+    signoff = rng.choice(signoffs).capitalize()
+    return f"{greeting} Sam, {' '.join(body)} {signoff}, Alex"
+
+def synthetic_corpus(seed=1234, per_length=3):
+    """
+    Returns {length_bucket: [texts]} with per_length texts for each bucket in LENGTHS.
+    """
+    return {
+        bucket: [synthetic_text(sentences, seed + index * 101 + sentences) for index in range(per_length)]
+        for bucket, sentences in LENGTHS.items()
+    }
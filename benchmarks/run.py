@@ -0,0 +1,325 @@
+"""
+Offline micro-benchmarks for the post-processing and validation hot paths.
+
+Usage:
+    python -m benchmarks.run                       # run and print latency and allocations
+    python -m benchmarks.run --compare             # also compare against benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline       # store this run as the new baseline
+    python -m benchmarks.run --check-equivalence   # prove outputs match benchmarks/golden.json
+    python -m benchmarks.run --save-golden         # record the current outputs as the reference
+
+No network access or API key is needed.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from flask import Flask
+from benchmarks.corpora import (
+    LENGTHS, all_parameter_combinations, combination_id, load_recorded_corpus, synthetic_corpus
+)
+from helpers.processors.process_output_text import process_output_text, process_output_texts
+from helpers.processors._word_mapper import map_words
+from helpers.processors._pattern_remover import remove_patterns
+from helpers.processors._text_processor import process_text
+from helpers.processors._processing_plan import (
+    GREETING_PATTERNS, SIGNOFF_PATTERNS, DIALECT_MAPPINGS, SLANG_MAPPING, CASUAL_PROCESSING_RULES, get_processing_plan
+)
+from helpers.validators.output_validator import check_and_update_uniqueness, create_uniqueness_index
+from helpers.validators.form_validator import is_input_gibberish
+
+log = logging.getLogger(__name__)
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+GOLDEN_PATH = os.path.join(BENCHMARK_DIR, 'golden.json')
+STATIC_FOLDER = os.path.join(os.path.dirname(BENCHMARK_DIR), 'static')
+
+HEAVY_PARAMETERS = {'dialect': 'british', 'formality': 'casual', 'channel': 'chat', 'greetings': 'exclude'}
+NUM_OUTPUTS = [1, 5, 10]
+
+def create_app():
+    # Mapping files are resolved through current_app.static_folder
+    return Flask(__name__, static_folder=STATIC_FOLDER)
+
+def _cycle(calls):
+    # Rotates through a list of zero-argument calls so one benchmark covers a whole corpus
+    state = {'index': 0}
+
+    def run():
+        call = calls[state['index']]
+        state['index'] = (state['index'] + 1) % len(calls)
+        return call()
+    return run
+
+def build_benchmarks(corpus, recorded):
+    """
+    Returns [(name, call)] where call runs the measured operation once.
+    """
+    benchmarks = []
+    recorded_texts = [entry['text'] for entry in recorded]
+
+    for parameters in all_parameter_combinations():
+        texts = [entry['text'] for entry in recorded if entry['channel'] == parameters['channel']]
+        benchmarks.append((
+            f"process_output_text[{combination_id(parameters)}]",
+            _cycle([lambda text=text, parameters=parameters: process_output_text(text, parameters) for text in texts])
+        ))
+
+    for bucket in LENGTHS:
+        texts = corpus[bucket]
+        for num_outputs in NUM_OUTPUTS:
+            batch = [texts[index % len(texts)] for index in range(num_outputs)]
+            benchmarks.append((
+                f"process_output_texts[{bucket},n={num_outputs}]",
+                lambda batch=batch: process_output_texts(batch, HEAVY_PARAMETERS)
+            ))
+        benchmarks.append((
+            f"map_words[dialect,{bucket}]",
+            _cycle([lambda text=text: map_words(text, DIALECT_MAPPINGS) for text in texts])
+        ))
+        benchmarks.append((
+            f"map_words[dialect+slang,{bucket}]",
+            _cycle([lambda text=text: map_words(text, DIALECT_MAPPINGS + [SLANG_MAPPING]) for text in texts])
+        ))
+        benchmarks.append((
+            f"remove_patterns[greetings+signoffs,{bucket}]",
+            _cycle([
+                lambda text=text: remove_patterns(remove_patterns(text, GREETING_PATTERNS), SIGNOFF_PATTERNS)
+                for text in texts
+            ])
+        ))
+        benchmarks.append((
+            f"process_text[casual,{bucket}]",
+            _cycle([lambda text=text: process_text(text, CASUAL_PROCESSING_RULES) for text in texts])
+        ))
+        benchmarks.append((
+            f"is_input_gibberish[{bucket}]",
+            _cycle([lambda text=text: is_input_gibberish(text) for text in texts])
+        ))
+
+    for num_outputs in NUM_OUTPUTS:
+        candidates = [recorded_texts[index % len(recorded_texts)] for index in range(num_outputs)]
+
+        def check_uniqueness(candidates=candidates, num_outputs=num_outputs):
+            output_texts = [''] * num_outputs
+            tokens_tracker = [0] * num_outputs
+            check_and_update_uniqueness(
+                candidates, [0] * num_outputs, list(range(num_outputs)), output_texts, tokens_tracker,
+                create_uniqueness_index(), {'sentence_limit': '∞'}
+            )
+        benchmarks.append((f"check_and_update_uniqueness[n={num_outputs}]", check_uniqueness))
+
+    return benchmarks
+
+def _calibrate(call, min_sample_seconds):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample_seconds or number >= 1 << 20:
+            return number
+        number *= 2
+
+def measure_latency(call, repeat, min_sample_seconds):
+    """
+    Times call in repeat samples of an auto-calibrated number of calls each.
+
+    Returns:
+        dict: Per-call latency statistics in microseconds.
+    """
+    for _ in range(3):
+        call()
+    number = _calibrate(call, min_sample_seconds)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    samples.sort()
+    return {
+        'calls_per_sample': number,
+        'p50_us': statistics.median(samples),
+        'p90_us': samples[min(len(samples) - 1, int(len(samples) * 0.9))],
+        'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        'mean_us': statistics.fmean(samples),
+        'stdev_us': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+def measure_allocations(call, calls=20):
+    """
+    Traces memory over a few calls, after warm-up so caches are already populated.
+
+    Returns:
+        dict: Peak traced bytes during a call and bytes still held per call afterwards.
+    """
+    call()
+    tracemalloc.start()
+    try:
+        peak = 0
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            call()
+            _, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak - start)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes': peak, 'retained_bytes_per_call': max(0, after - before) / calls}
+
+def run_benchmarks(benchmarks, repeat, min_sample_seconds, name_filter=None):
+    results = {}
+    for name, call in benchmarks:
+        if name_filter and name_filter not in name:
+            continue
+        result = measure_latency(call, repeat, min_sample_seconds)
+        result.update(measure_allocations(call))
+        results[name] = result
+        print(
+            f"{name:<60} p50 {result['p50_us']:>10.2f}us  p90 {result['p90_us']:>10.2f}us  "
+            f"p99 {result['p99_us']:>10.2f}us  peak {result['peak_bytes']:>9}B"
+        )
+    return results
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Prints the p50 ratio of each benchmark to the baseline.
+
+    Returns:
+        list: Names of benchmarks whose p50 grew by more than tolerance.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<60} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            print(f"{name:<60} {'-':>12} {result['p50_us']:>10.2f}us {'new':>7}")
+            continue
+        ratio = result['p50_us'] / previous['p50_us'] if previous['p50_us'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = '  faster'
+        print(f"{name:<60} {previous['p50_us']:>10.2f}us {result['p50_us']:>10.2f}us {ratio:>6.2f}x{flag}")
+    return regressions
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def compute_equivalence_outputs(corpus, recorded):
+    """
+    Runs every parameter combination over the recorded and synthetic corpora and
+    returns {case_id: (sha256, output)}. Only the digests are stored in golden.json.
+    """
+    texts = [(f"recorded/{index}", entry['text']) for index, entry in enumerate(recorded)]
+    for bucket, bucket_texts in corpus.items():
+        texts += [(f"synthetic/{bucket}/{index}", text) for index, text in enumerate(bucket_texts)]
+
+    outputs = {}
+    for parameters in all_parameter_combinations():
+        combination = combination_id(parameters)
+        for text_id, text in texts:
+            output = process_output_text(text, parameters)
+            outputs[f"process_output_text/{combination}/{text_id}"] = (_digest(output), output)
+    for text_id, text in texts:
+        output = is_input_gibberish(text)
+        outputs[f"is_input_gibberish/{text_id}"] = (_digest(output), output)
+    candidates = [text for _, text in texts] + [text.upper() for _, text in texts[:4]]
+    output_texts = [''] * len(candidates)
+    rejected = check_and_update_uniqueness(
+        candidates, [0] * len(candidates), list(range(len(candidates))), output_texts, [0] * len(candidates),
+        create_uniqueness_index(), {'sentence_limit': '∞'}
+    )
+    outputs["check_and_update_uniqueness/all"] = (_digest([output_texts, rejected]), [output_texts, rejected])
+    return outputs
+
+def check_equivalence(outputs, golden):
+    mismatches = []
+    for case_id, (digest, output) in outputs.items():
+        expected = golden.get('cases', {}).get(case_id)
+        if expected is None:
+            print(f"MISSING  {case_id}")
+            mismatches.append(case_id)
+        elif expected != digest:
+            print(f"CHANGED  {case_id}: {output!r}")
+            mismatches.append(case_id)
+    print(f"\n{len(outputs) - len(mismatches)}/{len(outputs)} cases identical to {os.path.relpath(GOLDEN_PATH)}.")
+    return mismatches
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=2, sort_keys=True, ensure_ascii=False)
+        file.write('\n')
+    print(f"Wrote {os.path.relpath(path)}.")
+
+def _read_json(path):
+    if not os.path.exists(path):
+        sys.exit(f"{os.path.relpath(path)} does not exist yet; create it with --save-baseline or --save-golden.")
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for output post-processing and validation.")
+    parser.add_argument('--filter', help="Only run benchmarks whose name contains this text.")
+    parser.add_argument('--repeat', type=int, default=15, help="Timed samples per benchmark.")
+    parser.add_argument('--min-sample-ms', type=float, default=20, help="Minimum duration of one timed sample.")
+    parser.add_argument('--seed', type=int, default=1234, help="Seed for the synthetic corpus.")
+    parser.add_argument('--compare', action='store_true', help="Compare against the stored baseline.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p50 slowdown before flagging a regression.")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline.")
+    parser.add_argument('--check-equivalence', action='store_true', help="Check outputs against the golden digests and skip timing.")
+    parser.add_argument('--save-golden', action='store_true', help="Record current outputs as the golden digests and skip timing.")
+    parser.add_argument('--log-level', default='INFO', help="Level the helpers log at while measured, as in production.")
+    args = parser.parse_args(argv)
+
+    # Records are created and filtered as in production, but not written anywhere
+    logging.basicConfig(level=args.log_level.upper(), handlers=[logging.NullHandler()])
+
+    corpus = synthetic_corpus(seed=args.seed)
+    recorded = load_recorded_corpus()
+    with create_app().app_context():
+        for parameters in all_parameter_combinations():
+            get_processing_plan(parameters)
+
+        if args.check_equivalence or args.save_golden:
+            outputs = compute_equivalence_outputs(corpus, recorded)
+            if args.save_golden:
+                _write_json(GOLDEN_PATH, {
+                    'seed': args.seed,
+                    'cases': {case_id: digest for case_id, (digest, _) in outputs.items()},
+                })
+                return 0
+            return 1 if check_equivalence(outputs, _read_json(GOLDEN_PATH)) else 0
+
+        results = run_benchmarks(build_benchmarks(corpus, recorded), args.repeat, args.min_sample_ms / 1000, args.filter)
+
+    exit_code = 0
+    if args.compare:
+        regressions = compare_with_baseline(results, _read_json(BASELINE_PATH), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+            exit_code = 1
+    if args.save_baseline:
+        _write_json(BASELINE_PATH, {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'results': results,
+        })
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,18 @@
+# Gunicorn picks this file up automatically from the working directory.
+#
+# The default gevent worker makes the blocking OpenAI calls cooperative, so one
+# worker can keep hundreds of rewrites in flight while still serving pages.
+# Set GUNICORN_WORKER_CLASS=sync to fall back to one request per worker.
+import os
+from helpers.metrics import clear_snapshots
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 500))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+def on_starting(server):
+    # Worker snapshots from a previous run would otherwise be added to the new totals
+    clear_snapshots()
@@ -0,0 +1,273 @@
+"""
+Rewrites every record of a JSONL or CSV file without going through the web app.
+
+Usage:
+    python -m helpers.bulk_rewriter profiles.jsonl rewritten.jsonl --processes 4 --concurrency 8
+    python -m helpers.bulk_rewriter profiles.csv rewritten.jsonl --resume
+
+Each record holds the form's fields (input_text, dialect, formality, tone, channel,
+greetings, creativity, sentence_limit, num_outputs, uniqueness_attempts,
+responder_name) and an optional id. Results are appended to the output as JSON lines.
+A checkpoint is saved next to the output, so --resume skips the records that are
+already finished.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from multiprocessing import get_context
+from dotenv import load_dotenv
+from flask import Flask
+from helpers.utility import init_logging
+from helpers.requestors._http_client import configure_http_client
+from helpers.requestors._rate_limiter import configure_rate_limiter
+from helpers.requestors.openai_api_requestor import configure_openai_base_url
+from helpers.generators._response_cache import configure_response_cache
+from helpers.generators.batch_generator import build_job_result, rewrite_batch
+from helpers.validators.api_key_validator_storer import validate_api_key
+
+log = logging.getLogger(__name__)
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+def read_records(path):
+    """
+    Yields (record_id, job) for each JSONL line or CSV row; records without an
+    id are identified by their line or row number.
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            for number, row in enumerate(csv.DictReader(file), start=1):
+                yield str(row.pop('id', None) or number), row
+        return
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                log.error("Skipping line %s of %s: %s", number, path, e)
+                continue
+            record_id = job.pop('id', None) if isinstance(job, dict) else None
+            yield str(record_id if record_id is not None else number), job
+
+def _checkpoint_path(output_path):
+    return f"{output_path}.checkpoint.json"
+
+def load_checkpoint(output_path, retry_failed=False):
+    """
+    Truncates the output to the last checkpoint, dropping results that may not have
+    reached the disk, and returns the ids of records not to redo. With retry_failed,
+    failed results are also removed from the output, so each id appears once.
+
+    Raises:
+        FileNotFoundError: If the output has no checkpoint to resume from.
+    """
+    checkpoint_path = _checkpoint_path(output_path)
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"No checkpoint at {checkpoint_path}; run without --resume to start over.")
+    with open(checkpoint_path, 'r', encoding='utf-8') as file:
+        checkpoint = json.load(file)
+    # The output can only be shorter if it was rewritten without its failed results
+    # and the run stopped before the checkpoint was updated
+    os.truncate(output_path, min(checkpoint['output_offset'], os.path.getsize(output_path)))
+    with open(output_path, 'r', encoding='utf-8') as file:
+        lines = file.readlines()
+    results = [json.loads(line) for line in lines]
+    failed = [index for index, result in enumerate(results) if result['status'] != 'success']
+    if retry_failed and failed:
+        kept = [index for index, result in enumerate(results) if result['status'] == 'success']
+        _rewrite_output(output_path, [lines[index] for index in kept])
+        with open(output_path, 'a', encoding='utf-8') as output_file:
+            save_checkpoint(output_path, output_file, {key: value for key, value in checkpoint.items()
+                                                       if key not in ('output_offset', 'saved_at')})
+        results = [results[index] for index in kept]
+        log.warning("Removed %s failed results from %s to retry them.", len(failed), output_path)
+    return {result['id'] for result in results}
+
+def _rewrite_output(output_path, lines):
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, output_path)
+
+def save_checkpoint(output_path, output_file, stats):
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    checkpoint_path = _checkpoint_path(output_path)
+    temporary_path = f"{checkpoint_path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        json.dump({**stats, 'output_offset': output_file.tell(), 'saved_at': time.time()}, file)
+    os.replace(temporary_path, checkpoint_path)
+
+_worker_app_context = None
+
+def init_worker(log_level, processes):
+    """
+    Prepares one pool process: each gets an even share of the rate budget and an
+    app context so mapping files resolve against the static folder.
+    """
+    global _worker_app_context
+    load_dotenv()
+    init_logging(level=log_level)
+    configure_http_client()
+    configure_openai_base_url()
+    configure_rate_limiter(
+        requests_per_minute=max(1, int(os.getenv('OPENAI_RPM_LIMIT', 500)) // processes),
+        tokens_per_minute=max(1, int(os.getenv('OPENAI_TPM_LIMIT', 10000)) // processes),
+    )
+    configure_response_cache()
+    _worker_app_context = Flask(__name__, static_folder=STATIC_FOLDER).app_context()
+    _worker_app_context.push()
+
+def rewrite_chunk(chunk, api_key, settings, concurrency, cache_bypass):
+    # Upstream calls overlap on the process's event loop; post-processing uses its own CPU
+    record_ids, jobs = zip(*chunk)
+    result = rewrite_batch(list(jobs), api_key, settings, concurrency, cache_bypass)
+    results = []
+    for record_id, job_result in zip(record_ids, result['jobs']):
+        job_result.pop('index')
+        results.append({'id': record_id, **job_result})
+    return results
+
+def _failed_chunk_results(chunk, exception):
+    # Written like any failed record, so --retry-failed picks the chunk up again
+    results = []
+    for record_id, _ in chunk:
+        result = build_job_result(None, {}, [], {'job': f"Rewriting failed: {exception}"}, {})
+        result.pop('index')
+        results.append({'id': record_id, **result})
+    return results
+
+def _start_pool(processes, log_level):
+    return ProcessPoolExecutor(
+        max_workers=processes, mp_context=get_context('spawn'), initializer=init_worker, initargs=(log_level, processes)
+    )
+
+def _unfinished(records, finished, stats):
+    for record in records:
+        if record[0] in finished:
+            stats['skipped'] += 1
+            continue
+        yield record
+
+def _chunks(records, chunk_size):
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def run_bulk_rewrite(input_path, output_path, api_key, processes=2, concurrency=4, chunk_size=10, checkpoint_every=50,
+                     resume=False, retry_failed=False, cache_bypass=False, log_level=logging.WARNING):
+    """
+    Rewrites every record of input_path into output_path.
+
+    Returns:
+        dict: This run's counts of written, failed and skipped records, with its total tokens and cost.
+    """
+    finished = load_checkpoint(output_path, retry_failed) if resume else set()
+    if not resume and os.path.exists(_checkpoint_path(output_path)):
+        os.remove(_checkpoint_path(output_path))
+    stats = {'written': 0, 'failed': 0, 'skipped': 0, 'total_tokens_used': 0, 'total_estimated_cost': 0.0}
+    if finished:
+        log.warning("Resuming: %s records are already finished.", len(finished))
+    settings = {
+        'speculative_outputs': int(os.getenv('SPECULATIVE_OUTPUTS', 1)),
+        'batch_size': int(os.getenv('GENERATION_BATCH_SIZE', 5)),
+        'max_concurrency': int(os.getenv('GENERATION_MAX_CONCURRENCY', 4)),
+    }
+    chunks = _chunks(_unfinished(read_records(input_path), finished, stats), chunk_size)
+    started_at = time.monotonic()
+    since_checkpoint = 0
+    pool = _start_pool(processes, log_level)
+    try:
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as output_file:
+            # Each pending future with the chunk it is rewriting and the pool running it
+            futures = {}
+            while True:
+                # Keep every process busy without reading the whole input into memory
+                for chunk in islice(chunks, processes * 2 - len(futures)):
+                    futures[pool.submit(rewrite_chunk, chunk, api_key, settings, concurrency, cache_bypass)] = (chunk, pool)
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                pool_broken = False
+                for future in done:
+                    chunk, owner = futures.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        log.error("Failed to rewrite the %s records from id %s: %s", len(chunk), chunk[0][0], e)
+                        results = _failed_chunk_results(chunk, e)
+                        pool_broken = pool_broken or (isinstance(e, BrokenProcessPool) and owner is pool)
+                    for result in results:
+                        output_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                        stats['written'] += 1
+                        stats['failed'] += result['status'] != 'success'
+                        stats['total_tokens_used'] += result['total_tokens_used']
+                        stats['total_estimated_cost'] += result['total_estimated_cost']
+                        since_checkpoint += 1
+                if pool_broken:
+                    # A process died, which fails every chunk the pool still had; carry on with new processes
+                    log.error("A worker process stopped unexpectedly; starting new ones.")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = _start_pool(processes, log_level)
+                if since_checkpoint >= checkpoint_every:
+                    save_checkpoint(output_path, output_file, stats)
+                    since_checkpoint = 0
+                    elapsed = time.monotonic() - started_at
+                    print(f"{stats['written']} written ({stats['failed']} failed, {stats['skipped']} skipped), "
+                          f"{stats['total_tokens_used']} tokens, ${stats['total_estimated_cost']:.4f}, {elapsed:.0f}s", file=sys.stderr)
+            save_checkpoint(output_path, output_file, stats)
+    finally:
+        pool.shutdown()
+    return stats
+
+def main(argv=None):
+    # Before the parser, whose defaults come from the environment
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rewrite every record of a JSONL or CSV file.")
+    parser.add_argument('input', help="JSONL or CSV file of rewrite jobs.")
+    parser.add_argument('output', help="JSONL file the results are appended to.")
+    parser.add_argument('--api-key', default=os.getenv('OPENAI_API_KEY', ''), help="OpenAI key (defaults to OPENAI_API_KEY).")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2, help="Worker processes for generation and post-processing.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Records generated at once by each process.")
+    parser.add_argument('--chunk-size', type=int, default=10, help="Records sent to a process at a time.")
+    parser.add_argument('--checkpoint-every', type=int, default=50, help="Records written between checkpoints.")
+    parser.add_argument('--resume', action='store_true', help="Continue from the output's last checkpoint.")
+    parser.add_argument('--retry-failed', action='store_true', help="With --resume, also redo records that failed.")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the response cache.")
+    parser.add_argument('--log-level', default='WARNING', help="Log level for the rewrite pipeline.")
+    args = parser.parse_args(argv)
+
+    if args.resume and not os.path.exists(_checkpoint_path(args.output)):
+        print(f"No checkpoint at {_checkpoint_path(args.output)}; run without --resume to start over.", file=sys.stderr)
+        return 2
+    log_level = getattr(logging, args.log_level.upper(), logging.WARNING)
+    init_logging(level=log_level)
+    configure_http_client()
+    configure_openai_base_url()
+    error_message = validate_api_key(args.api_key)
+    if error_message:
+        print(f"API key rejected: {error_message}", file=sys.stderr)
+        return 2
+    stats = run_bulk_rewrite(
+        args.input, args.output, args.api_key, processes=args.processes, concurrency=args.concurrency,
+        chunk_size=args.chunk_size, checkpoint_every=args.checkpoint_every, resume=args.resume,
+        retry_failed=args.retry_failed, cache_bypass=args.no_cache, log_level=log_level,
+    )
+    print(json.dumps(stats, indent=2))
+    return 0 if not stats['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
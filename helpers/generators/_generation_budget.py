@@ -0,0 +1,86 @@
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Matches the sentence boundaries output_validator.count_sentences counts.
+_SENTENCE_END = re.compile(r'[.!?](?:\s|$)')
+
+MAX_TOKENS_CEILING = 300
+MIN_TOKENS_FLOOR = 48
+# Rough completion tokens per sentence, and the allowance for a greeting and sign-off.
+TOKENS_PER_SENTENCE = {'chat': 30, 'email': 40}
+GREETING_ALLOWANCE = {'chat': 15, 'email': 45}
+# Without a sentence limit, room for at least this many sentences, since rewrites of
+# short texts (especially emails) often come back with a few sentences added.
+MIN_SENTENCES_WITHOUT_LIMIT = 4
+# Headroom so the model usually finishes its last sentence before the cap.
+BUDGET_MARGIN = 1.5
+
+def estimate_text_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text or '') // 4 + 1
+
+def plan_max_tokens(parameters):
+    """
+    Derives the completion budget for one output from the sentence limit, the
+    channel and the length of the input text.
+
+    Args:
+        parameters (dict): Validated form parameters.
+
+    Returns:
+        int: A max_tokens value between MIN_TOKENS_FLOOR and MAX_TOKENS_CEILING.
+    """
+    channel = parameters.get('channel', 'chat')
+    per_sentence = TOKENS_PER_SENTENCE.get(channel, TOKENS_PER_SENTENCE['email'])
+    allowance = GREETING_ALLOWANCE.get(channel, GREETING_ALLOWANCE['email'])
+    sentence_limit = parameters.get('sentence_limit', '∞')
+    if isinstance(sentence_limit, int):
+        budget = sentence_limit * per_sentence + allowance
+    else:
+        # A rewrite rarely needs much more room than the text it rewrites, or than a short message on its channel
+        input_tokens = estimate_text_tokens(parameters.get('input_text'))
+        budget = max(input_tokens * 2, MIN_SENTENCES_WITHOUT_LIMIT * per_sentence) + allowance
+    max_tokens = max(MIN_TOKENS_FLOOR, min(MAX_TOKENS_CEILING, int(budget * BUDGET_MARGIN)))
+    log.debug("Planned max_tokens %s for channel %s and sentence limit %s.", max_tokens, channel, sentence_limit)
+    return max_tokens
+
+def drop_unfinished_sentence(text):
+    """
+    Cuts a completion that stopped at max_tokens back to its last complete sentence.
+    The text is returned unchanged if it has no complete sentence to fall back to.
+    """
+    last_end = None
+    for match in _SENTENCE_END.finditer(text):
+        last_end = match.start() + 1
+    if last_end is None:
+        return text
+    return text[:last_end]
+
+def trim_to_sentence_limit(text, sentence_limit):
+    """
+    Keeps the first sentence_limit sentences of text, counting sentences the same
+    way output_validator.count_sentences does.
+
+    Args:
+        text (str): A processed output.
+        sentence_limit (int | str): The limit, or '∞' for none.
+
+    Returns:
+        str: The text, trimmed at a sentence boundary if it was over the limit.
+    """
+    if not isinstance(sentence_limit, int) or not text:
+        return text
+    count = 0
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if text[start:match.start()].strip():
+            count += 1
+            if count == sentence_limit:
+                trimmed = text[:match.start() + 1]
+                if text[match.end():].strip():
+                    log.info("Trimmed an output to its first %s sentences.", sentence_limit)
+                return trimmed
+        start = match.end()
+    return text
@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import logging
+import sys
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+log = logging.getLogger(__name__)
+
+_inflight_limit = None
+_inflight_semaphore = None
+_async_semaphores = weakref.WeakKeyDictionary()
+
+def configure_inflight_limit(limit):
+    """
+    Caps how many generations one worker process runs at once; further requests wait
+    for a free slot. A limit of 0 or None disables the cap.
+    """
+    global _inflight_limit, _inflight_semaphore
+    _inflight_limit = limit or None
+    _inflight_semaphore = threading.BoundedSemaphore(limit) if limit else None
+    _async_semaphores.clear()
+    log.info("Generation in-flight limit per process: %s.", _inflight_limit or 'unlimited')
+
+def threads_are_greenlets():
+    """
+    Returns:
+        bool: True when gevent has patched threading, as in gunicorn's gevent worker.
+            Threads are then greenlets that share one OS thread.
+    """
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+@contextmanager
+def generation_slot():
+    if _inflight_semaphore is None:
+        yield
+        return
+    with _inflight_semaphore:
+        yield
+
+@asynccontextmanager
+async def async_generation_slot():
+    if _inflight_limit is None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(_inflight_limit)
+    async with semaphore:
+        yield
+
+def split_batches(num_candidates, batch_size):
+    if not batch_size or batch_size >= num_candidates:
+        return [num_candidates]
+    full_batches, remainder = divmod(num_candidates, batch_size)
+    return [batch_size] * full_batches + ([remainder] if remainder else [])
+
+def _merge_batches(results):
+    outputs, tokens_per_output, failures = [], [], []
+    for result in results:
+        if isinstance(result, Exception):
+            log.error("Generation batch failed: %s", result)
+            failures.append(result)
+            continue
+        batch_outputs, batch_tokens = result
+        outputs.extend(batch_outputs)
+        tokens_per_output.extend(batch_tokens)
+    if failures and not outputs:
+        raise failures[0]
+    return outputs, tokens_per_output
+
+def fan_out(request_batch, num_candidates, batch_size=None, max_concurrency=4):
+    """
+    Requests candidates in concurrent batches and merges the results in batch order.
+
+    Args:
+        request_batch (callable): Takes a batch size n and returns (outputs, tokens_per_output).
+        num_candidates (int): Total number of candidates to request.
+        batch_size (int, optional): Maximum candidates per request. None or 0 sends one request.
+        max_concurrency (int): Maximum requests in flight at once.
+
+    Returns:
+        tuple: The merged (outputs, tokens_per_output) lists.
+
+    Raises:
+        Exception: The first batch error, if every batch failed.
+    """
+    batches = split_batches(num_candidates, batch_size)
+    if len(batches) == 1:
+        return request_batch(batches[0])
+
+    log.info("Fanning out %s candidates as %s concurrent requests: %s", num_candidates, len(batches), batches)
+    results = []
+    with ThreadPoolExecutor(max_workers=min(len(batches), max_concurrency)) as executor:
+        # Each batch runs in a copy of the caller's context so its spans join the request's trace
+        futures = [executor.submit(contextvars.copy_context().run, request_batch, batch) for batch in batches]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return _merge_batches(results)
+
+async def async_fan_out(request_batch, num_candidates, batch_size=None, max_concurrency=4):
+    """
+    The asyncio counterpart of fan_out; request_batch is a coroutine function.
+    """
+    batches = split_batches(num_candidates, batch_size)
+    if len(batches) == 1:
+        return await request_batch(batches[0])
+
+    log.info("Fanning out %s candidates as %s concurrent requests: %s", num_candidates, len(batches), batches)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(batch):
+        async with semaphore:
+            return await request_batch(batch)
+
+    results = await asyncio.gather(*(run(batch) for batch in batches), return_exceptions=True)
+    return _merge_batches(results)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+def make_cache_key(prompt, settings):
+    """
+    Builds a stable content hash for a prompt and the settings that shape its outputs.
+
+    Args:
+        prompt (str): The prompt returned by construct_prompt.
+        settings (dict): JSON-serialisable generation and post-processing settings.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    payload = json.dumps({'prompt': prompt, 'settings': settings}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    A two-tier cache of generated outputs: a per-process LRU with TTL in front of an
+    optional SQLite file that every worker on the host can share.
+
+    Args:
+        max_entries (int): Maximum entries kept in memory.
+        ttl (float): Seconds an entry stays valid in either tier.
+        db_path (str, optional): SQLite file for the shared tier. Disabled if empty.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'bypassed': 0}
+        if db_path:
+            with self._connect() as connection:
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as connection:
+                    row = connection.execute(
+                        'SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?', (key, now)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                log.error("Response cache read failed: %s", e)
+                row = None
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, value, expires_at)
+        self._count('stores')
+        if self.db_path:
+            try:
+                with self._connect() as connection:
+                    connection.execute(
+                        'INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, json.dumps(value), expires_at)
+                    )
+                    connection.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),))
+            except sqlite3.Error as e:
+                log.error("Response cache write failed: %s", e)
+
+    def record_bypass(self):
+        self._count('bypassed')
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM responses')
+
+_cache = None
+
+def configure_response_cache(enabled=None, max_entries=None, ttl=None, db_path=None):
+    """
+    Replaces the shared response cache, reading unset options from RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL and RESPONSE_CACHE_PATH.
+    """
+    global _cache
+    if enabled is None:
+        enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    if not enabled:
+        _cache = None
+        log.info("Response cache disabled.")
+        return None
+    _cache = ResponseCache(
+        max_entries=max_entries or int(os.getenv('RESPONSE_CACHE_SIZE', 256)),
+        ttl=ttl or float(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+        db_path=db_path if db_path is not None else os.getenv('RESPONSE_CACHE_PATH', ''),
+    )
+    log.info("Response cache configured with %s entries, %ss TTL, shared tier: %s.", _cache.max_entries, _cache.ttl, _cache.db_path or 'none')
+    return _cache
+
+def get_response_cache():
+    return _cache
@@ -0,0 +1,145 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from helpers.generators._generation_scheduler import threads_are_greenlets
+from helpers.generators.output_generator import generate_output_text, generate_output_text_async
+from helpers.requestors._async_api_requestor import close_async_connections
+from helpers.validators.form_validator import validate_rewrite_params, validate_style_choices
+
+log = logging.getLogger(__name__)
+
+# Same defaults as the form (see helpers/params.get_params)
+JOB_DEFAULTS = {
+    'responder_name': '',
+    'dialect': 'american',
+    'formality': 'neutral',
+    'tone': 'neutral',
+    'channel': 'chat',
+    'greetings': 'include',
+    'creativity': 'med',
+    'sentence_limit': 'none',
+    'num_outputs': 1,
+    'uniqueness_attempts': 5,
+    'input_text': '',
+}
+
+def build_job_parameters(job, api_key, cache_bypass=False):
+    """
+    Builds generation parameters for one job, filling unset fields with the form's
+    defaults. Values are passed as strings, as a form would submit them.
+    """
+    parameters = {
+        name: str(job[name]) if job.get(name) is not None else default
+        for name, default in JOB_DEFAULTS.items()
+    }
+    parameters.update({'api_key': api_key, 'output_texts': [], 'cache_bypass': cache_bypass})
+    return parameters
+
+def validate_job(job, api_key, cache_bypass=False):
+    """
+    Returns:
+        tuple: (parameters, errors, warnings); errors and warnings are keyed by parameter.
+    """
+    if not isinstance(job, dict):
+        return None, {'job': "Each job must be a JSON object."}, {}
+    parameters = build_job_parameters(job, api_key, cache_bypass)
+    errors = validate_style_choices(parameters)
+    parameters, validation_errors = validate_rewrite_params(parameters)
+    # As in the form, an out-of-range output count is clamped rather than rejected
+    warnings = {}
+    if 'num_outputs' in validation_errors:
+        warnings['num_outputs'] = validation_errors.pop('num_outputs')
+    errors.update(validation_errors)
+    return parameters, errors, warnings
+
+def build_job_result(index, parameters, output_texts, errors, warnings):
+    return {
+        'index': index,
+        'status': 'success' if any(output_texts) else 'error',
+        'outputs': output_texts,
+        'output_statuses': parameters.get('output_statuses', []),
+        'tokens_used': parameters.get('tokens_used', []),
+        'estimated_cost': parameters.get('estimated_cost', []),
+        'total_tokens_used': parameters.get('total_tokens_used', 0),
+        'total_estimated_cost': parameters.get('total_estimated_cost', 0.0),
+        'errors': errors,
+        'warnings': warnings,
+    }
+
+async def run_rewrite_jobs(jobs, settings, max_concurrency):
+    """
+    Generates outputs for validated jobs, at most max_concurrency at a time.
+
+    Args:
+        jobs (list): (index, parameters, warnings) tuples.
+        settings (dict): Generation settings, see get_generation_settings.
+        max_concurrency (int): Jobs generated at once.
+
+    Returns:
+        list: One result dict per job, in the given order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_job(index, parameters, warnings):
+        async with semaphore:
+            log.info("Running batch job %s.", index)
+            parameters, output_texts, errors = await generate_output_text_async(parameters, settings)
+        return build_job_result(index, parameters, output_texts, {'output': errors} if errors else {}, warnings)
+
+    try:
+        return await asyncio.gather(*(run_job(*job) for job in jobs))
+    finally:
+        await close_async_connections()
+
+def run_rewrite_jobs_in_threads(jobs, settings, max_concurrency):
+    """
+    The blocking counterpart of run_rewrite_jobs, for gevent workers, where each
+    thread is a greenlet and blocking calls only suspend the greenlet making them.
+    """
+    def run_job(index, parameters, warnings):
+        log.info("Running batch job %s.", index)
+        parameters, output_texts, errors = generate_output_text(parameters, settings)
+        return build_job_result(index, parameters, output_texts, {'output': errors} if errors else {}, warnings)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        # Each job runs in a copy of the caller's context so it keeps the app context
+        futures = [executor.submit(contextvars.copy_context().run, run_job, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+def rewrite_batch(jobs, api_key, settings, max_concurrency, cache_bypass=False):
+    """
+    Validates every job with the form validators, generates the valid ones
+    concurrently and returns per-job results, with rejected jobs reported
+    alongside in input order.
+
+    Runs its own event loop with asyncio.run, so it must not be called from a
+    coroutine. Under gunicorn's gevent worker, asyncio cannot run a loop per
+    greenlet (it tracks the running loop per OS thread), so jobs run in greenlets
+    instead. Needs an app context, as post-processing reads mapping files from the
+    static folder.
+
+    Returns:
+        dict: 'jobs' results plus the batch's total tokens and estimated cost.
+    """
+    results = [None] * len(jobs)
+    runnable = []
+    for index, job in enumerate(jobs):
+        parameters, errors, warnings = validate_job(job, api_key, cache_bypass)
+        if errors:
+            log.warning("Batch job %s failed validation: %s", index, errors)
+            results[index] = build_job_result(index, {}, [], errors, warnings)
+        else:
+            runnable.append((index, parameters, warnings))
+    log.info("Running %s of %s batch jobs with concurrency %s.", len(runnable), len(jobs), max_concurrency)
+    if runnable and threads_are_greenlets():
+        for result in run_rewrite_jobs_in_threads(runnable, settings, max_concurrency):
+            results[result['index']] = result
+    elif runnable:
+        for result in asyncio.run(run_rewrite_jobs(runnable, settings, max_concurrency)):
+            results[result['index']] = result
+    return {
+        'jobs': results,
+        'total_tokens_used': sum(result['total_tokens_used'] for result in results),
+        'total_estimated_cost': sum(result['total_estimated_cost'] for result in results),
+    }
@@ -1,11 +1,18 @@
 import logging
-from helpers.requestors.openai_api_requestor import make_openai_request
-from helpers.calculators.token_cost_estimator import distribute_tokens, calculate_individual_cost, calculate_total_cost
-from helpers.validators.output_validator import check_and_update_uniqueness, validate_output_texts
-from helpers.processors.process_output_text import process_output_text
+from flask import current_app
+from helpers.generators._generation_scheduler import fan_out, async_fan_out, generation_slot, async_generation_slot
+from helpers.generators._response_cache import get_response_cache, make_cache_key
+from helpers.generators._generation_budget import plan_max_tokens, drop_unfinished_sentence, trim_to_sentence_limit
+from helpers.requestors.openai_api_requestor import make_openai_request, make_async_openai_request, make_openai_stream_request, openai_url
+from helpers.calculators.token_cost_estimator import distribute_tokens, increment_tokens, calculate_individual_cost, calculate_total_cost
+from helpers.validators.output_validator import check_and_update_uniqueness, fill_unique_slots, create_uniqueness_index, SLOT_PENDING, SLOT_ACCEPTED, SLOT_EMPTY
+from helpers.processors.process_output_text import process_output_text, process_output_texts
+from helpers.processors._processing_plan import plan_key
+from helpers.metrics import inc, observe, timed_stage
 
 log = logging.getLogger(__name__)
 
+@timed_stage('prompt_construction')
 def construct_prompt(parameters):
     log.info("Constructing the prompt...")
     prompt = (f"Rewrite the following text in {parameters['dialect']} English, using a {parameters['formality']} tone "
@@ -18,16 +25,64 @@ def construct_prompt(parameters):
     log.info("Prompt construction completed.")
     return prompt
 
-def make_api_call(parameters, prompt, num_outputs_to_generate):
-    data = {
+def build_request_data(parameters, prompt, num_outputs_to_generate):
+    return {
         "model": "gpt-4",
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 300,
+        "max_tokens": plan_max_tokens(parameters),
         "n": num_outputs_to_generate,
         "temperature": parameters['creativity'],
     }
+
+def get_cache_key(parameters, prompt):
+    data = build_request_data(parameters, prompt, parameters['num_outputs'])
+    settings = {k: v for k, v in data.items() if k != 'messages'}
+    settings['processing'] = plan_key(parameters)
+    return make_cache_key(prompt, settings)
+
+def lookup_cached_outputs(parameters, prompt):
+    cache = get_response_cache()
+    if cache is None:
+        return None, None
+    if parameters.get('cache_bypass'):
+        log.info("Response cache bypassed for this request.")
+        cache.record_bypass()
+        return None, None
+    cache_key = get_cache_key(parameters, prompt)
+    output_texts = cache.get(cache_key)
+    if output_texts is not None:
+        log.info("Serving outputs from the response cache.")
+    return cache_key, output_texts
+
+def store_cached_outputs(cache_key, output_texts, complete):
+    cache = get_response_cache()
+    if cache is None or cache_key is None or not complete:
+        return
+    cache.set(cache_key, list(output_texts))
+
+def make_api_call(parameters, prompt, num_outputs_to_generate):
+    data = build_request_data(parameters, prompt, num_outputs_to_generate)
     return make_openai_request(
-        "https://api.openai.com/v1/chat/completions",
+        openai_url("chat/completions"),
+        parameters['api_key'],
+        method="POST",
+        data=data
+    )
+
+async def make_async_api_call(parameters, prompt, num_outputs_to_generate):
+    data = build_request_data(parameters, prompt, num_outputs_to_generate)
+    return await make_async_openai_request(
+        openai_url("chat/completions"),
+        parameters['api_key'],
+        method="POST",
+        data=data
+    )
+
+def make_streaming_api_call(parameters, prompt, num_outputs_to_generate):
+    data = build_request_data(parameters, prompt, num_outputs_to_generate)
+    data.update({"stream": True, "stream_options": {"include_usage": True}})
+    return make_openai_stream_request(
+        openai_url("chat/completions"),
         parameters['api_key'],
         method="POST",
         data=data
@@ -35,26 +90,33 @@ def make_api_call(parameters, prompt, num_outputs_to_generate):
 
 def process_api_response(api_response):
     log.info("Processing API response...")
-    log.debug(f"Full API response: {api_response}")
+    log.debug("Full API response: %s", api_response)
     try:
         output_texts = [response['message']['content'].strip() for response in api_response['choices']]
+        output_texts = [
+            drop_unfinished_sentence(text) if response.get('finish_reason') == 'length' else text
+            for text, response in zip(output_texts, api_response['choices'])
+        ]
         log.info("Extracted output texts successfully.")
         total_completion_tokens = api_response.get('usage', {}).get('completion_tokens', 0)
         tokens_per_output = [response.get('usage', {}).get('completion_tokens', 0) for response in api_response['choices']]
-        log.debug(f"Initial tokens per output: {tokens_per_output}")
+        log.debug("Initial tokens per output: %s", tokens_per_output)
         tokens_per_output = distribute_tokens(tokens_per_output, total_completion_tokens)
-        log.debug(f"Tokens after distribution: {tokens_per_output}")
+        log.debug("Tokens after distribution: %s", tokens_per_output)
         return output_texts, tokens_per_output
     except KeyError as e:
-        log.error(f"KeyError while processing API response: {str(e)}")
+        log.error("KeyError while processing API response: %s", e)
         raise RuntimeError("There was an issue processing the model's response. Please try again later.")
     except Exception as e:
-        log.error(f"Unexpected error while processing API response: {str(e)}")
+        log.error("Unexpected error while processing API response: %s", e)
         raise RuntimeError("An unexpected error occurred while generating the response. Please try again later.")
 
 def handle_generation_error(parameters, output_texts, total_tokens_used, total_estimated_cost, errors, exception):
     error_message = str(exception)
-    if "connectivity" in error_message:
+    if "Rate limit budget" in error_message:
+        # Raised by our own rate limiter, and already worded for the user
+        pass
+    elif "connectivity" in error_message:
         error_message = "The OpenAI service is currently experiencing connectivity issues. Please try again later."
     elif "processing" in error_message:
         error_message = "There was an issue processing the model's response. Please try again later."
@@ -66,41 +128,80 @@ def handle_generation_error(parameters, output_texts, total_tokens_used, total_e
         'total_tokens_used': total_tokens_used,
         'total_estimated_cost': total_estimated_cost,
         'tokens_used': [],
-        'estimated_cost': [0.0] * len(output_texts)
+        'estimated_cost': [0.0] * len(output_texts),
+        'output_statuses': [],
     })
     errors.append(error_message)
 
-def generate_output_text(parameters):
+def record_generation_metrics(attempts, slot_statuses):
+    if attempts:
+        observe('rewriter_generation_attempts', attempts)
+    for status in slot_statuses:
+        inc('rewriter_output_slots_total', {'status': status})
+
+def get_generation_settings():
+    return {
+        'speculative_outputs': current_app.config.get('SPECULATIVE_OUTPUTS', 0),
+        'batch_size': current_app.config.get('GENERATION_BATCH_SIZE'),
+        'max_concurrency': current_app.config.get('GENERATION_MAX_CONCURRENCY', 4),
+    }
+
+def generation_steps(parameters, speculative_outputs=0):
+    """
+    Runs one generation without doing any I/O itself.
+
+    Whenever candidates are needed it yields (prompt, num_outputs_to_generate) and
+    expects the caller to send back (outputs, tokens_per_output), or to throw the
+    request's exception into it. This lets the same retry, uniqueness and costing
+    logic be driven by blocking calls or by an event loop.
+
+    Returns:
+        tuple: (parameters, output_texts, errors), as generate_output_text does.
+    """
     uniqueness_attempts = parameters.get('uniqueness_attempts', 5)
     max_retries = uniqueness_attempts if uniqueness_attempts != 'unlimited' else 5
     output_texts = [''] * parameters['num_outputs']
     tokens_tracker = [0] * parameters['num_outputs']
-    unique_outputs = set()
-    non_unique_indices = list(range(parameters['num_outputs']))
+    unique_outputs = create_uniqueness_index()
+    slot_statuses = [SLOT_PENDING] * parameters['num_outputs']
+    failing_indices = list(range(parameters['num_outputs']))
     errors = []
     total_tokens_used = 0
     total_estimated_cost = 0.0
+    attempts_made = 0
     try:
         log.info("Generating output text...")
         prompt = construct_prompt(parameters)
+        cache_key, cached_outputs = lookup_cached_outputs(parameters, prompt)
+        if cached_outputs is not None:
+            output_texts, cache_key = list(cached_outputs), None
+            slot_statuses = [SLOT_ACCEPTED] * len(output_texts)
+            failing_indices = []
         for attempt in range(max_retries):
-            if not non_unique_indices:
+            if not failing_indices:
                 break
-            num_outputs_to_generate = len(non_unique_indices)
-            log.info(f"Attempt {attempt + 1}/{max_retries}: Requesting {num_outputs_to_generate} outputs.")
-            api_response = make_api_call(parameters, prompt, num_outputs_to_generate)
-            new_outputs, tokens_per_output = process_api_response(api_response)
-            processed_outputs = [process_output_text(output, parameters) for output in new_outputs]
-            non_unique_indices = check_and_update_uniqueness(
-                processed_outputs, tokens_per_output, non_unique_indices, output_texts, tokens_tracker, unique_outputs, parameters
+            # Every failing slot, whatever the reason, is regenerated in one combined request.
+            # Extra candidates only help when there is something to collide with.
+            extra_outputs = speculative_outputs if len(unique_outputs) + len(failing_indices) > 1 else 0
+            num_outputs_to_generate = len(failing_indices) + extra_outputs
+            log.info("Attempt %s/%s: Requesting %s outputs (%s speculative) for slots %s.", attempt + 1, max_retries, num_outputs_to_generate, extra_outputs, failing_indices)
+            attempts_made = attempt + 1
+            new_outputs, tokens_per_output = yield prompt, num_outputs_to_generate
+            processed_outputs = [
+                trim_to_sentence_limit(output_text, parameters['sentence_limit'])
+                for output_text in process_output_texts(new_outputs, parameters)
+            ]
+            failing_indices = fill_unique_slots(
+                processed_outputs, tokens_per_output, failing_indices, output_texts, tokens_tracker, unique_outputs,
+                slot_statuses, parameters['sentence_limit']
             )
-            if not non_unique_indices:
-                log.info(f"All outputs are unique after {attempt + 1} attempts.")
+            if not failing_indices:
+                log.info("All outputs were accepted after %s attempts.", attempt + 1)
                 break
-        remaining_non_unique = len(non_unique_indices)
-        if remaining_non_unique > 0:
-            log.warning(f"Failed to generate entirely unique outputs after {max_retries} attempts. {remaining_non_unique} non-unique outputs exist.")
-        validation_errors = validate_output_texts(output_texts, parameters)
+        if failing_indices:
+            log.warning("Failed to fill %s output slots after %s attempts: %s", len(failing_indices), max_retries, [slot_statuses[slot] for slot in failing_indices])
+        store_cached_outputs(cache_key, output_texts, not failing_indices)
+        record_generation_metrics(attempts_made, slot_statuses)
         estimated_cost = calculate_individual_cost(tokens_tracker)
         total_tokens_used, total_estimated_cost = calculate_total_cost(tokens_tracker, estimated_cost)
         parameters.update({
@@ -108,9 +209,158 @@ def generate_output_text(parameters):
             'total_tokens_used': total_tokens_used,
             'total_estimated_cost': total_estimated_cost,
             'tokens_used': tokens_tracker,
-            'estimated_cost': estimated_cost
+            'estimated_cost': estimated_cost,
+            'output_statuses': slot_statuses,
         })
-        return parameters, output_texts, errors if validation_errors is None else [validation_errors]
+        return parameters, output_texts, errors
     except Exception as e:
         handle_generation_error(parameters, output_texts, total_tokens_used, total_estimated_cost, errors, e)
-        return parameters, output_texts, errors
\ No newline at end of file
+        return parameters, output_texts, errors
+
+def generate_output_text(parameters, settings=None):
+    settings = settings or get_generation_settings()
+
+    def fetch(prompt, num_outputs_to_generate):
+        def request_batch(batch_size):
+            return process_api_response(make_api_call(parameters, prompt, batch_size))
+        return fan_out(request_batch, num_outputs_to_generate, settings['batch_size'], settings['max_concurrency'])
+
+    with generation_slot():
+        steps = generation_steps(parameters, settings['speculative_outputs'])
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = fetch(*request)
+                except Exception as e:
+                    request = steps.throw(e)
+                    continue
+                request = steps.send(result)
+        except StopIteration as finished:
+            return finished.value
+
+async def generate_output_text_async(parameters, settings=None):
+    """
+    The asyncio counterpart of generate_output_text. Like it, this needs an app
+    context, since post-processing reads mapping files from the app's static folder.
+    settings (see get_generation_settings) default to the app's configuration.
+    """
+    settings = settings or get_generation_settings()
+
+    async def fetch(prompt, num_outputs_to_generate):
+        async def request_batch(batch_size):
+            return process_api_response(await make_async_api_call(parameters, prompt, batch_size))
+        return await async_fan_out(request_batch, num_outputs_to_generate, settings['batch_size'], settings['max_concurrency'])
+
+    async with async_generation_slot():
+        steps = generation_steps(parameters, settings['speculative_outputs'])
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    result = await fetch(*request)
+                except Exception as e:
+                    request = steps.throw(e)
+                    continue
+                request = steps.send(result)
+        except StopIteration as finished:
+            return finished.value
+
+def stream_output_text(parameters):
+    with generation_slot():
+        yield from _stream_output_text(parameters)
+
+def _stream_output_text(parameters):
+    """
+    Streams generation events for each output slot as the model produces them.
+
+    Yields dicts with an 'event' key:
+        start:  a slot is being (re)generated; clears any previous text for it.
+        delta:  a fragment of raw model text for a slot.
+        output: a slot finished; carries the processed text and its status (accepted,
+                duplicate, over-limit or empty); rejected slots are retried together.
+                Slots whose choice never finished get an 'empty' output after the
+                last attempt, so every slot ends with one.
+        error:  generation failed; carries a user-facing message.
+        done:   final outputs, per-slot statuses, token counts, costs and errors.
+    """
+    uniqueness_attempts = parameters.get('uniqueness_attempts', 5)
+    max_retries = uniqueness_attempts if uniqueness_attempts != 'unlimited' else 5
+    output_texts = [''] * parameters['num_outputs']
+    tokens_tracker = [0] * parameters['num_outputs']
+    unique_outputs = create_uniqueness_index()
+    slot_statuses = [SLOT_PENDING] * parameters['num_outputs']
+    failing_indices = list(range(parameters['num_outputs']))
+    errors = []
+    attempts_made = 0
+    try:
+        log.info("Streaming output text...")
+        prompt = construct_prompt(parameters)
+        cache_key, cached_outputs = lookup_cached_outputs(parameters, prompt)
+        if cached_outputs is not None:
+            output_texts, cache_key = list(cached_outputs), None
+            slot_statuses = [SLOT_ACCEPTED] * len(output_texts)
+            failing_indices = []
+            for slot, output_text in enumerate(output_texts):
+                yield {'event': 'output', 'slot': slot, 'text': output_text, 'unique': True, 'status': SLOT_ACCEPTED}
+        for attempt in range(max_retries):
+            if not failing_indices:
+                break
+            pending_indices = failing_indices
+            log.info("Attempt %s/%s: Streaming %s outputs.", attempt + 1, max_retries, len(pending_indices))
+            attempts_made = attempt + 1
+            buffers = [[] for _ in pending_indices]
+            accepted = set()
+            completion_tokens = 0
+            for chunk in make_streaming_api_call(parameters, prompt, len(pending_indices)):
+                usage = chunk.get('usage')
+                if usage:
+                    completion_tokens = usage.get('completion_tokens', 0)
+                for choice in chunk.get('choices', []):
+                    choice_index = choice['index']
+                    slot = pending_indices[choice_index]
+                    content = choice.get('delta', {}).get('content')
+                    if content:
+                        if not buffers[choice_index]:
+                            yield {'event': 'start', 'slot': slot, 'attempt': attempt + 1}
+                        buffers[choice_index].append(content)
+                        yield {'event': 'delta', 'slot': slot, 'content': content}
+                    if choice.get('finish_reason'):
+                        output_text = ''.join(buffers[choice_index]).strip()
+                        if choice['finish_reason'] == 'length':
+                            output_text = drop_unfinished_sentence(output_text)
+                        output_text = trim_to_sentence_limit(process_output_text(output_text, parameters), parameters['sentence_limit'])
+                        rejected = check_and_update_uniqueness(
+                            [output_text], [0], [slot], output_texts, tokens_tracker, unique_outputs, parameters, slot_statuses
+                        )
+                        if not rejected:
+                            accepted.add(choice_index)
+                        yield {'event': 'output', 'slot': slot, 'text': output_text, 'unique': not rejected, 'status': slot_statuses[slot]}
+            tokens_per_output = distribute_tokens([0] * len(pending_indices), completion_tokens)
+            for choice_index, slot in enumerate(pending_indices):
+                increment_tokens(tokens_tracker, slot, tokens_per_output[choice_index])
+            failing_indices = [slot for choice_index, slot in enumerate(pending_indices) if choice_index not in accepted]
+        for slot in failing_indices:
+            # The stream ended before this slot's choice finished on every attempt
+            if slot_statuses[slot] == SLOT_PENDING:
+                slot_statuses[slot] = SLOT_EMPTY
+                yield {'event': 'output', 'slot': slot, 'text': output_texts[slot], 'unique': False, 'status': SLOT_EMPTY}
+        if failing_indices:
+            log.warning("Failed to fill %s output slots after %s attempts: %s", len(failing_indices), max_retries, [slot_statuses[slot] for slot in failing_indices])
+        store_cached_outputs(cache_key, output_texts, not failing_indices)
+        record_generation_metrics(attempts_made, slot_statuses)
+        estimated_cost = calculate_individual_cost(tokens_tracker)
+        total_tokens_used, total_estimated_cost = calculate_total_cost(tokens_tracker, estimated_cost)
+        yield {
+            'event': 'done',
+            'output_texts': output_texts,
+            'tokens_used': tokens_tracker,
+            'estimated_cost': estimated_cost,
+            'total_tokens_used': total_tokens_used,
+            'total_estimated_cost': total_estimated_cost,
+            'output_statuses': slot_statuses,
+            'errors': errors
+        }
+    except Exception as e:
+        handle_generation_error(parameters, output_texts, 0, 0.0, errors, e)
+        yield {'event': 'error', 'message': errors[-1]}
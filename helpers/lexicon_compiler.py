@@ -0,0 +1,55 @@
+"""
+Compiles the dialect mapping files into the binary lexicons map_words reads.
+
+Usage:
+    python -m helpers.lexicon_compiler
+
+Each lexicon in helpers.processors._lexicon.LEXICONS is written to static/lexicon/,
+expanded with inflected forms when LEXICON_INFLECTIONS is true (or --inflections is
+given). Run it whenever a mapping file changes, with the setting the app uses;
+until then, map_words builds the same tables in memory in every worker.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from helpers.processors._lexicon import LEXICONS, merge_mappings, read_sources, sources_digest, write_lexicon
+
+log = logging.getLogger(__name__)
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+def compile_lexicons(static_folder=STATIC_FOLDER, inflect=False):
+    """
+    Args:
+        static_folder (str): Folder holding json/; lexicons go into its lexicon/.
+        inflect (bool): Whether to add inflected forms of the table entries.
+
+    Returns:
+        dict: Lexicon path -> number of phrases written.
+    """
+    written = {}
+    for lexicon_path, sources in LEXICONS.items():
+        contents = read_sources(static_folder, sources)
+        entries = merge_mappings([json.loads(content) for content in contents], inflect=inflect)
+        path = os.path.join(static_folder, lexicon_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written[lexicon_path] = write_lexicon(path, entries, sources_digest(contents, inflect))
+        log.info("Compiled %s: %s phrases from %s.", lexicon_path, written[lexicon_path], ', '.join(sources))
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the dialect mapping files into binary lexicons.")
+    parser.add_argument('--static-folder', default=STATIC_FOLDER, help="Folder holding json/; lexicons go into its lexicon/.")
+    parser.add_argument('--inflections', action='store_true',
+                        default=os.getenv('LEXICON_INFLECTIONS', 'false').lower() == 'true',
+                        help="Add inflected forms of the table entries (default: LEXICON_INFLECTIONS).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    written = compile_lexicons(args.static_folder, args.inflections)
+    print(f"Compiled {len(written)} lexicons into {os.path.join(args.static_folder, 'lexicon')}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
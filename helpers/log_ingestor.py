@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warn': logging.WARNING,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+class ClientLogIngestor:
+    """
+    Accepts batches of client-side log entries and writes them from a background
+    thread, so the /log request returns as soon as the batch is queued.
+
+    Args:
+        max_queue_size (int): Entries held for the writer before new ones are dropped.
+        max_batch_entries (int): Entries accepted from a single request.
+        max_message_length (int): Characters kept per message.
+        sample_rate (float): Fraction of clients whose debug and info entries are kept.
+                             Warnings and errors are always kept.
+    """
+
+    def __init__(self, max_queue_size=10000, max_batch_entries=100, max_message_length=2000, sample_rate=1.0):
+        self.max_batch_entries = max_batch_entries
+        self.max_message_length = max_message_length
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {'received': 0, 'queued': 0, 'sampled_out': 0, 'truncated': 0, 'dropped': 0, 'written': 0}
+        self._worker = threading.Thread(target=self._drain, name='client-log-ingestor', daemon=True)
+        self._worker.start()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def is_client_sampled(self, client_id):
+        # Sample whole clients rather than single entries so kept sessions stay complete
+        if self.sample_rate >= 1:
+            return True
+        bucket = int(hashlib.sha256(client_id.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+    def submit(self, entries, client_id):
+        """
+        Validates, samples and queues a batch of entries.
+
+        Args:
+            entries (list | dict): One entry or a list of entries with 'level' and 'message'.
+            client_id (str): A stable identifier for the sending client.
+
+        Returns:
+            int: The number of entries queued.
+        """
+        if isinstance(entries, dict):
+            entries = [entries]
+        if not isinstance(entries, list):
+            raise ValueError("Log payload must be an entry or a list of entries.")
+        if len(entries) > self.max_batch_entries:
+            self._count('truncated', len(entries) - self.max_batch_entries)
+            entries = entries[:self.max_batch_entries]
+
+        sampled = self.is_client_sampled(client_id)
+        queued = 0
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            level = LEVELS.get(str(entry.get('level', 'info')).lower())
+            message = str(entry.get('message', 'No message provided'))[:self.max_message_length]
+            if level is None:
+                level, message = logging.INFO, f"Unknown log level '{entry.get('level')}': {message}"
+            if level < logging.WARNING and not sampled:
+                self._count('sampled_out')
+                continue
+            try:
+                self._queue.put_nowait((level, message))
+                queued += 1
+            except queue.Full:
+                self._count('dropped')
+        self._count('received', len(entries))
+        self._count('queued', queued)
+        return queued
+
+    def _drain(self):
+        while True:
+            level, message = self._queue.get()
+            try:
+                log.log(level, message)
+                self._count('written')
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,390 @@
+import bisect
+import glob
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import abort, g, request, before_render_template, template_rendered
+from helpers.tracing import enter_span, exit_span
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (10, 25, 50, 100, 150, 200, 300, 500, 1000)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 10)
+
+# name: (type, help, buckets)
+METRICS = {
+    'rewriter_http_request_duration_seconds': ('histogram', "Request latency by route, method and status.", LATENCY_BUCKETS),
+    'rewriter_stage_duration_seconds': ('histogram', "Time spent in each stage of handling a rewrite.", LATENCY_BUCKETS),
+    'rewriter_upstream_responses_total': ('counter', "OpenAI responses by HTTP status ('error' when no response arrived).", None),
+    'rewriter_upstream_retries_total': ('counter', "OpenAI calls retried after a 429 or 5xx, by status.", None),
+    'rewriter_output_tokens': ('histogram', "Completion tokens charged to each output slot.", TOKEN_BUCKETS),
+    'rewriter_generation_attempts': ('histogram', "Upstream attempts needed to fill every output slot.", ATTEMPT_BUCKETS),
+    'rewriter_output_slots_total': ('counter', "Final output slot statuses.", None),
+}
+
+# Networks allowed to scrape /metrics without a token
+DEFAULT_ALLOWED_NETWORKS = '127.0.0.0/8,::1/128'
+
+def escape_label_value(value):
+    """
+    Escapes a label value as the Prometheus text format requires, putting a
+    backslash before backslashes and double quotes and writing line feeds as \\n.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return ','.join(f'{key}="{escape_label_value(value)}"' for key, value in sorted(labels.items()))
+
+class MetricsRegistry:
+    """
+    Counters and histograms for one process, plus collectors that report existing
+    stats dicts (caches, HTTP pool, rate limiter) at scrape time.
+
+    Every update takes one short lock around a dict update, so recording costs
+    about a microsecond.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, format_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        buckets = METRICS[name][2]
+        key = (name, format_labels(labels))
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def register_collector(self, prefix, get_stats, gauges=()):
+        """
+        Reports get_stats() at scrape time as {prefix}_{key} series. Keys listed in
+        gauges are point-in-time values; the rest are treated as counters.
+        """
+        self._collectors.append((prefix, get_stats, frozenset(gauges)))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """
+        Returns this process's series in a JSON-serialisable form that
+        merge_snapshots can combine with other workers' snapshots.
+        """
+        with self._lock:
+            counters = [[name, labels, value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, labels, list(series)] for (name, labels), series in self._histograms.items()]
+        collected = []
+        for prefix, get_stats, gauges in self._collectors:
+            try:
+                stats = get_stats() or {}
+            except Exception as e:
+                log.error("Metrics collector %s failed: %s", prefix, e)
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    kind = 'gauge' if key in gauges else 'counter'
+                    collected.append([f"{prefix}_{key}", kind, value])
+        return {'pid': os.getpid(), 'time': time.time(), 'counters': counters, 'histograms': histograms, 'collected': collected}
+
+_registry = MetricsRegistry()
+_metrics_dir = None
+_flush_interval = 5.0
+_flusher = None
+_access = {'token': '', 'networks': ()}
+
+def get_registry():
+    return _registry
+
+def inc(name, labels=None, amount=1):
+    _registry.inc(name, labels, amount)
+
+def observe(name, value, labels=None):
+    _registry.observe(name, value, labels)
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Records the block's duration as rewriter_stage_duration_seconds{stage=...}, and
+    as a span when the request is being traced.
+    """
+    span = enter_span(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe('rewriter_stage_duration_seconds', time.perf_counter() - start, {'stage': stage})
+        exit_span(span)
+
+def timed_stage(stage):
+    """
+    Decorator form of stage_timer.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            span = enter_span(stage)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _registry.observe('rewriter_stage_duration_seconds', time.perf_counter() - start, {'stage': stage})
+                exit_span(span)
+        return wrapper
+    return decorator
+
+def _snapshot_path(pid):
+    return os.path.join(_metrics_dir, f"metrics-{pid}.json")
+
+def flush_snapshot():
+    """
+    Writes this worker's snapshot to the shared metrics directory, if one is configured.
+    """
+    if not _metrics_dir:
+        return
+    path = _snapshot_path(os.getpid())
+    temporary_path = f"{path}.tmp"
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(_registry.snapshot(), file)
+        os.replace(temporary_path, path)
+    except OSError as e:
+        log.error("Failed to write metrics snapshot to %s: %s", path, e)
+
+def _flush_periodically():
+    while True:
+        time.sleep(_flush_interval)
+        flush_snapshot()
+
+def _start_flusher():
+    global _flusher
+    if _metrics_dir and (_flusher is None or not _flusher.is_alive()):
+        _flusher = threading.Thread(target=_flush_periodically, name='metrics-flusher', daemon=True)
+        _flusher.start()
+
+def _after_fork():
+    # A forked worker starts with its own empty series and flusher thread
+    global _flusher
+    _registry.reset()
+    _flusher = None
+    _start_flusher()
+
+def configure_metrics(metrics_dir=None, flush_interval=None, token=None, allowed_networks=None):
+    """
+    Configures cross-worker aggregation and who may scrape /metrics, reading unset
+    options from METRICS_DIR, METRICS_FLUSH_INTERVAL, METRICS_TOKEN and
+    METRICS_ALLOWED_NETWORKS. Without a directory only the serving process is reported.
+
+    Args:
+        token (str): Bearer token that grants access from any address; none when empty.
+        allowed_networks (str): Comma-separated networks allowed without a token.
+    """
+    global _metrics_dir, _flush_interval
+    _metrics_dir = metrics_dir if metrics_dir is not None else os.getenv('METRICS_DIR', '')
+    _flush_interval = flush_interval or float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+    _access['token'] = token if token is not None else os.getenv('METRICS_TOKEN', '')
+    if allowed_networks is None:
+        allowed_networks = os.getenv('METRICS_ALLOWED_NETWORKS', DEFAULT_ALLOWED_NETWORKS)
+    _access['networks'] = tuple(ipaddress.ip_network(network.strip(), strict=False)
+                                for network in allowed_networks.split(',') if network.strip())
+    log.info("Metrics can be scraped from %s%s.", ', '.join(map(str, _access['networks'])) or 'no address',
+             ' or with METRICS_TOKEN' if _access['token'] else '')
+    if _metrics_dir:
+        os.makedirs(_metrics_dir, exist_ok=True)
+        _start_flusher()
+        log.info("Metrics from every worker are aggregated through %s.", _metrics_dir)
+    else:
+        log.info("Metrics are reported per process; set METRICS_DIR to aggregate workers.")
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def clear_snapshots(metrics_dir=None):
+    """
+    Removes snapshots left by a previous run. Called from gunicorn's on_starting hook
+    so totals restart with the server instead of carrying over old workers.
+    """
+    metrics_dir = metrics_dir or os.getenv('METRICS_DIR', '')
+    if not metrics_dir:
+        return
+    for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json*')):
+        try:
+            os.remove(path)
+        except OSError as e:
+            log.warning("Could not remove stale metrics snapshot %s: %s", path, e)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def collect_snapshots():
+    """
+    Returns the snapshots of every worker: this process's live one, plus the files
+    written by the others when METRICS_DIR is set.
+    """
+    own = _registry.snapshot()
+    if not _metrics_dir:
+        return [own]
+    flush_snapshot()
+    snapshots = [own]
+    for path in glob.glob(os.path.join(_metrics_dir, 'metrics-*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if snapshot.get('pid') != own['pid']:
+            snapshots.append(snapshot)
+    return snapshots
+
+def merge_snapshots(snapshots):
+    """
+    Sums counters and histograms across workers. Counters from exited workers are
+    kept so totals never go backwards; gauges only come from live workers.
+    """
+    counters, histograms, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, labels)] = counters.get((name, labels), 0) + value
+        for name, labels, series in snapshot['histograms']:
+            merged = histograms.get((name, labels))
+            histograms[(name, labels)] = series if merged is None else [a + b for a, b in zip(merged, series)]
+        alive = _pid_alive(snapshot['pid'])
+        for name, kind, value in snapshot['collected']:
+            if kind == 'counter':
+                counters[(name, '')] = counters.get((name, ''), 0) + value
+            elif alive:
+                # Per-worker maxima combine as a maximum; other gauges add up
+                combine = max if '_max_' in name else sum
+                gauges[name] = combine((gauges.get(name, 0), value))
+    return counters, histograms, gauges
+
+def _hit_ratios(counters):
+    ratios = {}
+    for (name, labels), hits in counters.items():
+        if labels or not name.endswith('_hits'):
+            continue
+        prefix = name[:-len('_hits')]
+        hits += counters.get((f"{prefix}_disk_hits", ''), 0)
+        lookups = hits + counters.get((f"{prefix}_misses", ''), 0)
+        ratios[f"{prefix}_hit_ratio"] = hits / lookups if lookups else 0.0
+    return ratios
+
+def _scrape_allowed():
+    token = _access['token']
+    authorization = request.headers.get('Authorization', '')
+    if token and authorization.startswith('Bearer ') and hmac.compare_digest(authorization[len('Bearer '):], token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    address = getattr(address, 'ipv4_mapped', None) or address
+    return any(address in network for network in _access['networks'])
+
+def require_scrape_access():
+    """
+    Aborts with 403 unless the request comes from METRICS_ALLOWED_NETWORKS or
+    carries METRICS_TOKEN as a bearer token.
+    """
+    if not _scrape_allowed():
+        log.warning("Refused /metrics scrape from %s.", request.remote_addr)
+        abort(403)
+
+def _start_request_timer():
+    g.metrics_started_at = time.perf_counter()
+
+def _record_request(response):
+    started_at = g.pop('metrics_started_at', None)
+    if started_at is not None:
+        # Streamed bodies are still being produced here, so this is time to first byte
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe('rewriter_http_request_duration_seconds', time.perf_counter() - started_at, {
+            'route': route, 'method': request.method, 'status': response.status_code,
+        })
+    return response
+
+def _start_render_timer(sender, template, context, **extra):
+    g.metrics_render_started_at = time.perf_counter()
+
+def _record_render(sender, template, context, **extra):
+    started_at = g.pop('metrics_render_started_at', None)
+    if started_at is not None:
+        observe('rewriter_stage_duration_seconds', time.perf_counter() - started_at, {'stage': 'template_rendering'})
+
+def init_metrics(app):
+    """
+    Records request latency per route and template rendering time for app.
+    """
+    app.before_request(_start_request_timer)
+    app.after_request(_record_request)
+    before_render_template.connect(_start_render_timer, app)
+    template_rendered.connect(_record_render, app)
+
+def render_metrics():
+    """
+    Renders every worker's metrics in the Prometheus text exposition format.
+    """
+    counters, histograms, gauges = merge_snapshots(collect_snapshots())
+    gauges.update(_hit_ratios(counters))
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == 'counter':
+            series = [(labels, value) for (metric, labels), value in counters.items() if metric == name]
+            if series:
+                header(name, kind, help_text)
+                lines += [f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in sorted(series)]
+            continue
+        series = [(labels, values) for (metric, labels), values in histograms.items() if metric == name]
+        if not series:
+            continue
+        header(name, kind, help_text)
+        for labels, values in sorted(series):
+            separator = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], values):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {values[-2]}" if labels else f"{name}_sum {values[-2]}")
+            lines.append(f"{name}_count{{{labels}}} {values[-1]}" if labels else f"{name}_count {values[-1]}")
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in METRICS:
+            header(f"rewriter_{name}_total", 'counter', f"Cumulative {name.replace('_', ' ')}.")
+            lines.append(f"rewriter_{name}_total {value}")
+    for name, value in sorted(gauges.items()):
+        header(f"rewriter_{name}", 'gauge', f"Current {name.replace('_', ' ')}.")
+        lines.append(f"rewriter_{name} {value}")
+    return '\n'.join(lines) + '\n'
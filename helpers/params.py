@@ -28,33 +28,33 @@ def get_param_value(param_name, default_value=None):
     if param_name not in ['api_key', 'input_text', 'output_texts']:
         url_value = escape(request.args.get(param_name)) if request.args.get(param_name) else None
         if url_value:
-            log.debug(f"Parameter '{param_name}' found in URL: {url_value}")
+            log.debug("Parameter '%s' found in URL: %s", param_name, url_value)
             return url_value
 
     form_value = escape(request.form.get(param_name)) if request.form.get(param_name) else None
     if form_value:
-        log.debug(f"Parameter '{param_name}' found in form: {form_value}")
+        log.debug("Parameter '%s' found in form: %s", param_name, form_value)
         return form_value
 
     cookie_value = escape(request.cookies.get(param_name)) if request.cookies.get(param_name) else None
     if cookie_value:
-        log.debug(f"Parameter '{param_name}' found in cookie: {cookie_value}")
+        log.debug("Parameter '%s' found in cookie: %s", param_name, cookie_value)
         return cookie_value
 
-    log.debug(f"Parameter '{param_name}' not found, using default: {default_value}")
+    log.debug("Parameter '%s' not found, using default: %s", param_name, default_value)
     return default_value if default_value else ''
 
 def log_param_updates(params):
     global initial_params_logged, previous_params
 
     if not initial_params_logged:
-        log.info(f"Initial parameters: {params}")
+        log.debug("Initial parameters: %s", params)
         previous_params = params.copy()
         initial_params_logged = True
     else:
         updated_params = {k: v for k, v in params.items() if k not in previous_params or previous_params[k] != v}
         if updated_params:
-            log.info(f"Updated parameters: {updated_params}")
+            log.debug("Updated parameters: %s", updated_params)
             previous_params.update(updated_params)
 
 def get_params():
@@ -78,6 +78,13 @@ def get_params():
     
     return params
 
+def is_cache_bypassed():
+    # Honour an explicit no-cache request header or a 'cache=bypass' form/URL field.
+    cache_control = request.headers.get('Cache-Control', '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return True
+    return (request.form.get('cache') or request.args.get('cache')) == 'bypass'
+
 def get_flashes():
     flashes = {
         'api_key_messages': get_flashed_messages(category_filter=['api_key']),
@@ -91,6 +98,6 @@ def get_flashes():
     for category, messages in flashes.items():
         flashes[category] = [f"Error: {message}" if not message.startswith("Error:") else message for message in messages]
 
-    log.info(f"Flash messages retrieved: {flashes}")
+    log.debug("Flash messages retrieved: %s", flashes)
     return flashes
 
@@ -0,0 +1,95 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Bump when the rules change so compiled lexicons built with the old rules are rebuilt
+INFLECTION_RULES_VERSION = 1
+
+_VOWELS = 'aeiou'
+
+def plural(word):
+    if word.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        return word + 'es'
+    if word.endswith('y') and len(word) > 1 and word[-2] not in _VOWELS:
+        return word[:-1] + 'ies'
+    return word + 's'
+
+def past(word):
+    if word.endswith('e'):
+        return word + 'd'
+    if word.endswith('y') and len(word) > 1 and word[-2] not in _VOWELS:
+        return word[:-1] + 'ied'
+    return word + 'ed'
+
+def gerund(word):
+    if word.endswith('e') and not word.endswith(('ee', 'ye', 'oe')):
+        return word[:-1] + 'ing'
+    return word + 'ing'
+
+def agent(word):
+    return word + 'r' if word.endswith('e') else word + 'er'
+
+def agents(word):
+    return plural(agent(word))
+
+def nominal(word):
+    return word[:-1] + 'ation'
+
+def nominals(word):
+    return plural(nominal(word))
+
+def adjective(word):
+    return word + 'ful'
+
+# Forms generated for each (US ending, British ending) spelling pattern. The same
+# rule is applied to both sides, so "organize" -> "organise" yields
+# "organizing" -> "organising". Other entries only get a plural.
+SPELLING_PATTERNS = [
+    (('ize', 'ise'), (plural, past, gerund, agent, agents, nominal, nominals)),
+    (('yze', 'yse'), (plural, past, gerund, agent, agents)),
+    (('or', 'our'), (plural, past, gerund, adjective)),
+    (('er', 're'), (plural, past, gerund)),
+    (('og', 'ogue'), (plural, past, gerund)),
+]
+DEFAULT_FORMS = (plural,)
+
+# Keys that already look inflected, and values that are already plural or
+# uncountable ("candy" -> "sweets"), are left alone
+_INFLECTED_ENDINGS = ('s', 'ed', 'ing')
+
+# Words whose -s form is usually a verb or an unrelated sense ("he falls", "it fits")
+NO_PLURAL_WORDS = {
+    'aluminum', 'check', 'fall', 'fire', 'fit', 'honey', 'jello', 'line', 'mail',
+    'oatmeal', 'quit', 'sick', 'soccer', 'spit', 'trash',
+}
+
+def _forms_for(key, value):
+    for (us_ending, gb_ending), forms in SPELLING_PATTERNS:
+        if key.endswith(us_ending) and value.endswith(gb_ending):
+            return forms
+    if key.endswith(_INFLECTED_ENDINGS) or value.endswith('s') or key in NO_PLURAL_WORDS:
+        return ()
+    return DEFAULT_FORMS
+
+def inflect_mapping(mapping):
+    """
+    Generates inflected entries for a word/phrase mapping. For phrases, only
+    the last word is inflected.
+
+    Args:
+        mapping (dict): Lowercase word or phrase -> replacement.
+
+    Returns:
+        dict: Generated entries that the mapping does not already define.
+    """
+    generated = {}
+    for key, value in mapping.items():
+        key_head, _, key_word = key.rpartition(' ')
+        value_head, _, value_word = value.rpartition(' ')
+        for form in _forms_for(key_word, value_word):
+            inflected_key = f"{key_head} {form(key_word)}".lstrip()
+            inflected_value = f"{value_head} {form(value_word)}".lstrip()
+            if inflected_key != inflected_value and inflected_key not in mapping:
+                generated.setdefault(inflected_key, inflected_value)
+    log.debug("Generated %s inflected entries from %s.", len(generated), len(mapping))
+    return generated
@@ -0,0 +1,327 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from flask import current_app
+from helpers.processors._inflections import INFLECTION_RULES_VERSION, inflect_mapping
+from helpers.processors._mapping_file_loader import load_mapping_file, load_compiled_file
+
+log = logging.getLogger(__name__)
+
+# Compiled lexicons and the mapping files each one replaces, relative to the static
+# folder. A lexicon applies when map_words is given its sources consecutively, so an
+# overlay for a dialect gets a lexicon of its own, listed before the tables it sits on.
+LEXICONS = {
+    'lexicon/en_gb.lex': ('json/us_gb_spelling.json', 'json/us_gb_vocabulary.json'),
+}
+
+# File layout, little-endian:
+#   header   magic, format version, reserved, entry count, slot count, digest of the sources
+#   slots    slot_count x (crc32 of key, key offset, value offset, key length, value length, flags),
+#            an open-addressing table with linear probing; flags 0 marks an empty slot
+#   strings  UTF-8 keys, each followed by its value, in key order
+MAGIC = b'PRLX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHII32s')
+SLOT = struct.Struct('<IIIHHB3x')
+HAS_VALUE = 1
+HAS_LONGER = 2
+
+# Phrases whose resolved lookup each process remembers, so common words skip the
+# lexicon while the full tables stay in the shared page cache
+MAX_MEMO_ENTRIES = 4096
+# Seconds between checks of a lexicon and its sources for changes on disk
+CHECK_INTERVAL = 2.0
+
+_layers = {}
+_stacks = {}
+_layers_lock = threading.Lock()
+_stats = {'loads': 0, 'fallbacks': 0}
+_settings = {'inflections': False}
+
+class LexiconFormatError(ValueError):
+    pass
+
+def merge_mappings(mappings, inflect=False):
+    """
+    Merges mappings the way map_words applies them: the first mapping that defines
+    a key wins, and its value is passed through the later mappings. With inflect,
+    each mapping's inflected forms are added after every explicit entry.
+
+    Returns:
+        dict: Normalised phrase -> replacement.
+    """
+    # Each source with the mappings its values are passed through
+    sources = [(mapping, mappings[index + 1:]) for index, mapping in enumerate(mappings)]
+    if inflect:
+        sources += [(inflect_mapping(mapping), later_mappings) for mapping, later_mappings in sources]
+    merged = {}
+    for mapping, later_mappings in sources:
+        for key, value in mapping.items():
+            key = ' '.join(key.lower().split())
+            if key in merged:
+                continue
+            for later_mapping in later_mappings:
+                value = later_mapping.get(value, value)
+            merged[key] = value
+    return merged
+
+def phrase_index(entries):
+    """
+    Returns:
+        dict: Phrase -> (replacement or None, whether a longer phrase starts with it),
+        including the leading words of every phrase.
+    """
+    index = {key: (value, False) for key, value in entries.items()}
+    for key in entries:
+        words = key.split(' ')
+        for length in range(1, len(words)):
+            prefix = ' '.join(words[:length])
+            index[prefix] = (index.get(prefix, (None, False))[0], True)
+    return index
+
+def sources_digest(source_contents, inflect=False):
+    digest = hashlib.sha256(f"{FORMAT_VERSION}:{INFLECTION_RULES_VERSION if inflect else 0}".encode('utf-8'))
+    for content in source_contents:
+        digest.update(hashlib.sha256(content).digest())
+    return digest.digest()
+
+def write_lexicon(path, entries, digest):
+    """
+    Writes entries to path as a compiled lexicon. The file is replaced atomically,
+    so processes that have the old one mapped keep reading it until they reload.
+    """
+    index = phrase_index(entries)
+    keys = sorted(index, key=lambda key: key.encode('utf-8'))
+    slot_count = 8
+    while slot_count < len(keys) * 2:
+        slot_count *= 2
+    strings_offset = HEADER.size + slot_count * SLOT.size
+    slots = [None] * slot_count
+    strings = bytearray()
+    for key in keys:
+        value, has_longer = index[key]
+        key_bytes = key.encode('utf-8')
+        value_bytes = value.encode('utf-8') if value is not None else b''
+        key_offset = strings_offset + len(strings)
+        strings += key_bytes
+        value_offset = strings_offset + len(strings)
+        strings += value_bytes
+        flags = (HAS_VALUE if value is not None else 0) | (HAS_LONGER if has_longer else 0)
+        crc = zlib.crc32(key_bytes)
+        slot = crc & (slot_count - 1)
+        while slots[slot] is not None:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = SLOT.pack(crc, key_offset, value_offset, len(key_bytes), len(value_bytes), flags)
+    empty_slot = bytes(SLOT.size)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(keys), slot_count, digest))
+        file.write(b''.join(slot or empty_slot for slot in slots))
+        file.write(strings)
+    os.replace(temporary_path, path)
+    return len(keys)
+
+class Lexicon:
+    """
+    A compiled lexicon read through mmap, so every process that opens the file
+    shares one copy in the page cache. A lookup hashes the phrase and reads slots
+    until an empty one; key bytes are only compared when the hash matches.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map.size() < HEADER.size:
+            raise LexiconFormatError(f"{path} is too short to be a lexicon")
+        magic, version, _, self.entry_count, self.slot_count, self.digest = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise LexiconFormatError(f"{path} is not a version {FORMAT_VERSION} lexicon")
+        self._mask = self.slot_count - 1
+
+    @property
+    def size(self):
+        return self._map.size()
+
+    def find(self, phrase):
+        """
+        Returns:
+            tuple: (replacement or None, whether a longer phrase starts with this one),
+            or None when no entry starts with the phrase.
+        """
+        key = phrase.encode('utf-8')
+        crc = zlib.crc32(key)
+        slot = crc & self._mask
+        lexicon = self._map
+        while True:
+            slot_crc, key_offset, value_offset, key_length, value_length, flags = SLOT.unpack_from(
+                lexicon, HEADER.size + slot * SLOT.size)
+            if not flags:
+                return None
+            if slot_crc == crc and key_length == len(key) and lexicon[key_offset:key_offset + key_length] == key:
+                value = lexicon[value_offset:value_offset + value_length].decode('utf-8') if flags & HAS_VALUE else None
+                return value, bool(flags & HAS_LONGER)
+            slot = (slot + 1) & self._mask
+
+    def __repr__(self):
+        return f"Lexicon({self.path}, entries={self.entry_count})"
+
+class MappingLayer:
+    """
+    The in-memory equivalent of a Lexicon, for mapping files without a compiled
+    lexicon and for lexicons that have not been built.
+    """
+
+    def __init__(self, entries):
+        self._index = phrase_index(entries)
+        self.entry_count = len(self._index)
+
+    def find(self, phrase):
+        return self._index.get(phrase)
+
+class LexiconStack:
+    """
+    Lookup layers applied together, highest priority first.
+    """
+
+    def __init__(self, layers):
+        self.layers = tuple(layers)
+        self._memo = {}
+
+    def find(self, phrase):
+        """
+        Looks a phrase up in every layer. The first layer that maps it wins, and its
+        replacement is passed through the layers below, as separate passes would.
+
+        Returns:
+            tuple: (replacement or None, whether any layer has a longer phrase starting with it).
+        """
+        found = self._memo.get(phrase)
+        if found is not None:
+            return found
+        value = None
+        has_longer = False
+        for depth, layer in enumerate(self.layers):
+            result = layer.find(phrase)
+            if result is None:
+                continue
+            has_longer = has_longer or result[1]
+            if value is None and result[0] is not None:
+                value = result[0]
+                for later_layer in self.layers[depth + 1:]:
+                    later = later_layer.find(value)
+                    if later is not None and later[0] is not None:
+                        value = later[0]
+        found = (value, has_longer)
+        if len(self._memo) >= MAX_MEMO_ENTRIES:
+            self._memo.clear()
+        self._memo[phrase] = found
+        return found
+
+def configure_lexicons(inflections=None):
+    """
+    Sets whether lexicons include inflected forms of the table entries, reading
+    LEXICON_INFLECTIONS when unset. Inflections change the output ("organized"
+    becomes "organised"), so they are off unless asked for. The compiler must be
+    run with the same setting, or the lexicons are rebuilt in memory.
+    """
+    if inflections is None:
+        inflections = os.getenv('LEXICON_INFLECTIONS', 'false').lower() == 'true'
+    with _layers_lock:
+        _settings['inflections'] = inflections
+        _layers.clear()
+    log.info("Lexicon inflections %s.", 'enabled' if inflections else 'disabled')
+
+def _merge_sources(mapping_file_paths):
+    return merge_mappings([load_mapping_file(path) for path in mapping_file_paths], inflect=_settings['inflections'])
+
+def _mapping_layer(mapping):
+    return MappingLayer(merge_mappings([mapping]))
+
+def read_sources(static_folder, sources):
+    contents = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), 'rb') as file:
+            contents.append(file.read())
+    return contents
+
+def _open_lexicon(lexicon_path, sources):
+    # The files are only checked for changes every CHECK_INTERVAL seconds, so
+    # most calls skip the stat calls altogether
+    static_folder = current_app.static_folder
+    now = time.monotonic()
+    with _layers_lock:
+        cached = _layers.get(lexicon_path)
+        if cached is not None and cached[0] == static_folder and now < cached[1]:
+            return cached[3]
+    file_path = os.path.join(static_folder, lexicon_path)
+    try:
+        lexicon_version = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        lexicon_version = None
+    versions = (lexicon_version,) + tuple(os.stat(os.path.join(static_folder, source)).st_mtime_ns for source in sources)
+    with _layers_lock:
+        if cached is not None and cached[0] == static_folder and cached[2] == versions:
+            _layers[lexicon_path] = (static_folder, now + CHECK_INTERVAL, versions, cached[3])
+            return cached[3]
+    layer = None
+    if lexicon_version is not None:
+        try:
+            lexicon = Lexicon(file_path)
+            if lexicon.digest == sources_digest(read_sources(static_folder, sources), _settings['inflections']):
+                layer = lexicon
+                log.info("Mapped lexicon %s (%s entries, %s bytes).", lexicon_path, lexicon.entry_count, lexicon.size)
+            else:
+                log.warning("Lexicon %s is older than its sources; run python -m helpers.lexicon_compiler.", lexicon_path)
+        except (OSError, LexiconFormatError) as e:
+            log.error("Failed to open lexicon %s: %s", lexicon_path, e)
+    with _layers_lock:
+        _stats['loads'] += 1
+        _stats['fallbacks'] += layer is None
+    if layer is None:
+        log.info("Building lexicon %s in memory from %s.", lexicon_path, sources)
+        layer = MappingLayer(_merge_sources(sources))
+    with _layers_lock:
+        _layers[lexicon_path] = (static_folder, now + CHECK_INTERVAL, versions, layer)
+    return layer
+
+def get_lexicon_stack(mapping_file_paths):
+    """
+    Resolves mapping files into lookup layers. Runs of files that have a compiled
+    lexicon use it (or its in-memory equivalent when it has not been built); other
+    files are loaded as they are.
+
+    Args:
+        mapping_file_paths (tuple): Relative paths of the JSON mapping files, in priority order.
+
+    Returns:
+        LexiconStack: The layers, reused until one of them is reloaded.
+    """
+    layers = []
+    position = 0
+    while position < len(mapping_file_paths):
+        for lexicon_path, sources in LEXICONS.items():
+            if tuple(mapping_file_paths[position:position + len(sources)]) == sources:
+                layers.append(_open_lexicon(lexicon_path, sources))
+                position += len(sources)
+                break
+        else:
+            layers.append(load_compiled_file(mapping_file_paths[position], _mapping_layer))
+            position += 1
+    stack = _stacks.get(mapping_file_paths)
+    if stack is None or any(cached is not layer for cached, layer in zip(stack.layers, layers)):
+        stack = _stacks[mapping_file_paths] = LexiconStack(layers)
+    return stack
+
+def get_lexicon_stats():
+    with _layers_lock:
+        stats = dict(_stats)
+        lexicons = [cached[3] for cached in _layers.values() if isinstance(cached[3], Lexicon)]
+    stats['mapped_lexicons'] = len(lexicons)
+    stats['mapped_bytes'] = sum(lexicon.size for lexicon in lexicons)
+    return stats
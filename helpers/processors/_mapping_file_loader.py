@@ -1,23 +1,106 @@
 import os
 import json
 import logging
+import threading
 from flask import current_app
 
 log = logging.getLogger(__name__)
 
-def load_mapping_file(relative_path):
+# Process-wide cache of parsed (and optionally compiled) mapping files, keyed by
+# absolute path. Each entry remembers the file's mtime so edits are picked up.
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+def _resolve_path(relative_path):
     # Resolve the file path based on the static folder
-    file_path = os.path.join(current_app.static_folder, relative_path)
-    log.info(f"Loading mapping file from: {file_path}")
+    return os.path.join(current_app.static_folder, relative_path)
 
+def _read_mapping_file(file_path):
+    log.info("Loading mapping file from: %s", file_path)
     try:
         with open(file_path, 'r') as file:
             mapping = json.load(file)
-            log.info(f"Mapping file loaded successfully with {len(mapping)} entries.")
+            log.info("Mapping file loaded successfully with %s entries.", len(mapping))
             return mapping
     except FileNotFoundError:
-        log.error(f"Mapping file not found at: {file_path}")
+        log.error("Mapping file not found at: %s", file_path)
         raise
     except json.JSONDecodeError as e:
-        log.error(f"Error decoding mapping JSON from {file_path}: {e}")
+        log.error("Error decoding mapping JSON from %s: %s", file_path, e)
+        raise
+
+def _get_entry(file_path):
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        log.error("Mapping file not found at: %s", file_path)
         raise
+
+    with _cache_lock:
+        entry = _cache.get(file_path)
+        if entry is not None and entry['mtime'] == mtime:
+            _cache_stats['hits'] += 1
+            return entry
+        _cache_stats['misses'] += 1
+        if entry is not None:
+            _cache_stats['reloads'] += 1
+            log.info("Mapping file changed on disk, reloading: %s", file_path)
+
+    mapping = _read_mapping_file(file_path)
+    entry = {'mtime': mtime, 'data': mapping, 'compiled': {}}
+    with _cache_lock:
+        _cache[file_path] = entry
+    return entry
+
+def load_mapping_file(relative_path):
+    """
+    Loads a JSON mapping or pattern file from the static folder.
+
+    The parsed content is cached for the lifetime of the process and only
+    re-read when the file's modification time changes. Callers must treat the
+    returned object as read-only, since it is shared between requests.
+
+    Args:
+        relative_path (str): The path to the JSON file, relative to the static folder.
+
+    Returns:
+        dict | list: The parsed JSON content.
+    """
+    return _get_entry(_resolve_path(relative_path))['data']
+
+def load_compiled_file(relative_path, compiler):
+    """
+    Loads a JSON mapping or pattern file and returns a compiled form of it.
+
+    The compiler is called once per file version with the parsed content and
+    its result is cached alongside it, keyed by the compiler's qualified name.
+
+    Args:
+        relative_path (str): The path to the JSON file, relative to the static folder.
+        compiler (callable): Builds the compiled form from the parsed content.
+
+    Returns:
+        object: Whatever the compiler returns.
+    """
+    entry = _get_entry(_resolve_path(relative_path))
+    key = f"{compiler.__module__}.{compiler.__qualname__}"
+    compiled = entry['compiled'].get(key)
+    if compiled is None:
+        log.debug("Compiling '%s' with %s.", relative_path, key)
+        compiled = compiler(entry['data'])
+        entry['compiled'][key] = compiled
+    return compiled
+
+def get_cache_stats():
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats['entries'] = len(_cache)
+    return stats
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        for key in _cache_stats:
+            _cache_stats[key] = 0
+    log.info("Mapping file cache cleared.")
@@ -1,16 +1,83 @@
 import re
 import logging
-from helpers.processors._mapping_file_loader import load_mapping_file
+from functools import lru_cache
+from helpers.processors._mapping_file_loader import load_compiled_file
 
 log = logging.getLogger(__name__)
 
+_REGEX_METACHARACTERS = re.compile(r'[\\.^$*+?{}\[\]|()]')
+
+def _build_trie(phrases):
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+def _trie_to_regex(node):
+    is_end = '' in node
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    if len(branches) == 1 and not is_end:
+        return branches[0]
+    alternation = f"(?:{'|'.join(branches)})"
+    return f"{alternation}?" if is_end else alternation
+
+def compile_pattern_list(patterns):
+    """
+    Compiles a list of phrases into one word-bounded, case-insensitive matcher.
+
+    Literal phrases are folded into a character trie so the alternation shares
+    prefixes and the regex engine can reject a position after one character,
+    which keeps matching cost flat as the list grows. Entries containing regex
+    syntax are appended to the alternation as-is.
+
+    Args:
+        patterns (list): Phrases or regex fragments, e.g. the contents of greeting_patterns.json.
+
+    Returns:
+        re.Pattern | None: The combined matcher, or None if the list is empty.
+    """
+    literals = sorted({pattern.lower() for pattern in patterns if not _REGEX_METACHARACTERS.search(pattern)})
+    expressions = [pattern for pattern in patterns if _REGEX_METACHARACTERS.search(pattern)]
+    alternatives = ([_trie_to_regex(_build_trie(literals))] if literals else []) + expressions
+    if not alternatives:
+        return None
+    combined = re.compile(rf"\b(?:{'|'.join(alternatives)})\b", flags=re.IGNORECASE)
+    log.debug("Compiled %s patterns into a single matcher.", len(patterns))
+    return combined
+
+@lru_cache(maxsize=32)
+def compile_rule_list(rules):
+    """
+    Compiles (regex_pattern, replacement) rules once for repeated use.
+
+    The rules stay separate and are applied in order, since a rule may match
+    text produced by an earlier one, or text an earlier one removes; one
+    alternation over all of them would change the result.
+
+    Args:
+        rules (tuple): A tuple of (regex_pattern, replacement) tuples.
+
+    Returns:
+        tuple: (re.Pattern, replacement) pairs, in the order given.
+    """
+    return tuple((re.compile(pattern, flags=re.IGNORECASE), replacement) for pattern, replacement in rules)
+
 def remove_patterns(output_text, rules_source):
     """
     Removes text fragments matching regex patterns with specified replacements.
 
+    The phrases of a pattern file are combined into one compiled matcher and
+    removed in a single pass, as whole words. Rule lists are applied one rule
+    at a time, in order.
+
     Args:
         output_text (str): The text to process.
-        rules_source (str | list): A list of tuples (regex_pattern, replacement), 
+        rules_source (str | list): A list of tuples (regex_pattern, replacement),
                                    or the file path to a JSON file containing regex patterns.
 
     Returns:
@@ -18,24 +85,22 @@ def remove_patterns(output_text, rules_source):
     """
     log.info("Starting pattern removal...")
 
-    # Load patterns from a JSON file if a string (file path) is provided
+    # Load the combined matcher for a JSON pattern file, compiled once per file version
     if isinstance(rules_source, str):
-        log.info(f"Loading pattern rules from file: {rules_source}")
-        pattern_rules = load_mapping_file(rules_source)
-        # Transform JSON list into [(pattern, replacement)] format
-        rules_source = [(pattern, '') for pattern in pattern_rules]
+        log.info("Loading pattern rules from file: %s", rules_source)
+        matcher = load_compiled_file(rules_source, compile_pattern_list)
+        if matcher is not None:
+            output_text, count = matcher.subn('', output_text)
+            if count > 0:
+                log.info("Patterns from '%s' removed %s instance(s).", rules_source, count)
     else:
-        log.debug(f"Using provided pattern rules: {rules_source}")
-
-    # Apply each rule
-    for pattern, replacement in rules_source:
-        log.debug(f"Applying pattern rule: '{pattern}' -> '{replacement}'")
-        compiled_pattern = re.compile(pattern, flags=re.IGNORECASE)
-        output_text, count = compiled_pattern.subn(replacement, output_text)
-        if count > 0:
-            log.info(f"Pattern '{pattern}' removed {count} instance(s).")
+        log.debug("Using provided pattern rules: %s", rules_source)
+        for pattern, replacement in compile_rule_list(tuple(tuple(rule) for rule in rules_source)):
+            output_text, count = pattern.subn(replacement, output_text)
+            if count > 0:
+                log.info("Pattern '%s' removed %s instance(s).", pattern.pattern, count)
 
     output_text = output_text.strip()
-    log.debug(f"Final text after pattern removal: {output_text}")
+    log.debug("Final text after pattern removal: %s", output_text)
     log.info("Pattern removal completed.")
     return output_text
@@ -0,0 +1,92 @@
+import logging
+import time
+from functools import lru_cache, partial
+from helpers.processors._word_mapper import map_words
+from helpers.processors._text_processor import process_text, compile_rules
+from helpers.processors._pattern_remover import remove_patterns
+
+log = logging.getLogger(__name__)
+
+GREETING_PATTERNS = 'json/greeting_patterns.json'
+SIGNOFF_PATTERNS = 'json/signoff_patterns.json'
+DIALECT_MAPPINGS = ['json/us_gb_spelling.json', 'json/us_gb_vocabulary.json']
+SLANG_MAPPING = 'json/text_slang.json'
+
+CASUAL_PROCESSING_RULES = compile_rules([
+    (r"\b(\w+)'(\w+)\b", r'\1\2'),  # Remove contractions
+    (r'[;,]', ''),  # Remove commas and semicolons
+    (r'(\w)[\-\u2013\u2014](\w)|\s*[\-\u2013\u2014]\s*', r'\1 \2'),  # Handle dashes
+    (r"'(\w+)'", r'\1')  # Remove single quotes around words
+])
+
+CASUAL_PUNCTUATION_RULES = compile_rules([
+    (r'\s*([.!?])', r'\1'),  # Ensure no extra spaces before punctuation
+    (r'\s+', ' ')  # Replace multiple spaces with a single space
+])
+
+class ProcessingPlan:
+    """
+    A fixed sequence of named text-processing stages for one parameter combination.
+    """
+
+    def __init__(self, key, stages):
+        self.key = key
+        self.stages = tuple(stages)
+
+    def describe(self):
+        return [name for name, _ in self.stages]
+
+    def run(self, output_text, timings=None):
+        """
+        Runs every stage over a single text.
+
+        Args:
+            output_text (str): The text to process.
+            timings (dict, optional): If given, per-stage elapsed seconds are added to it.
+
+        Returns:
+            str: The processed text.
+        """
+        for name, stage in self.stages:
+            if timings is None:
+                output_text = stage(output_text)
+                continue
+            start = time.perf_counter()
+            output_text = stage(output_text)
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return output_text
+
+    def run_batch(self, output_texts, timings=None):
+        return [self.run(output_text, timings) for output_text in output_texts]
+
+    def __repr__(self):
+        return f"ProcessingPlan({self.key}, stages={self.describe()})"
+
+def plan_key(parameters):
+    return (parameters['greetings'], parameters['dialect'], parameters['formality'], parameters['channel'])
+
+@lru_cache(maxsize=64)
+def _compile_plan(greetings, dialect, formality, channel):
+    stages = []
+    if greetings == 'exclude':
+        stages.append(('remove_greetings', partial(remove_patterns, rules_source=GREETING_PATTERNS)))
+        stages.append(('remove_signoffs', partial(remove_patterns, rules_source=SIGNOFF_PATTERNS)))
+
+    if dialect in ['british', 'australian']:
+        # Runs before the casual rules, which split hyphenated words ("battle-axe")
+        # that the dialect tables map as a whole
+        stages.append(('map_dialect', partial(map_words, mapping_file_paths=DIALECT_MAPPINGS)))
+
+    if formality == 'casual' and channel == 'chat':
+        stages.append(('casual_rules', partial(process_text, rules=CASUAL_PROCESSING_RULES)))
+        stages.append(('casual_punctuation', partial(process_text, rules=CASUAL_PUNCTUATION_RULES, capitalize=True)))
+        stages.append(('map_slang', partial(map_words, mapping_file_paths=[SLANG_MAPPING])))
+        stages.append(('casual_remove_greetings', partial(remove_patterns, rules_source=GREETING_PATTERNS)))
+        stages.append(('casual_remove_signoffs', partial(remove_patterns, rules_source=SIGNOFF_PATTERNS)))
+
+    plan = ProcessingPlan((greetings, dialect, formality, channel), stages)
+    log.debug("Compiled processing plan: %s", plan)
+    return plan
+
+def get_processing_plan(parameters):
+    return _compile_plan(*plan_key(parameters))
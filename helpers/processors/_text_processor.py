@@ -3,6 +3,23 @@ import logging
 
 log = logging.getLogger(__name__)
 
+_SENTENCE_START = re.compile(r'(^\w)|([.!?]\s*\w)')
+
+def _capitalize_match(match):
+    return match.group(0).upper()
+
+def compile_rules(rules):
+    """
+    Precompiles a list of (regex_pattern, replacement) rules.
+
+    Args:
+        rules (list): A list of tuples (regex_pattern, replacement).
+
+    Returns:
+        list: A list of tuples (re.Pattern, replacement).
+    """
+    return [(re.compile(pattern), replacement) for pattern, replacement in rules]
+
 def process_text(output_text, rules, capitalize=False):
     """
     Processes text by applying a list of regex patterns with replacements.
@@ -10,7 +27,8 @@ def process_text(output_text, rules, capitalize=False):
 
     Args:
         output_text (str): The text to process.
-        rules (list): A list of tuples (regex_pattern, replacement).
+        rules (list): A list of tuples (regex_pattern, replacement). Patterns may be
+                      strings or precompiled with compile_rules.
         capitalize (bool): Whether to capitalize the first letter of sentences. Defaults to False.
 
     Returns:
@@ -21,13 +39,15 @@ def process_text(output_text, rules, capitalize=False):
 
     # Apply regex rules
     for pattern, replacement in rules:
-        log.debug(f"Applying processing rule: '{pattern}' -> '{replacement}'")
-        output_text = re.sub(pattern, replacement, output_text)
+        log.debug("Applying processing rule: '%s' -> '%s'", getattr(pattern, 'pattern', pattern), replacement)
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        output_text = pattern.sub(replacement, output_text)
 
     # Optionally capitalize sentences
     if capitalize:
-        output_text = re.sub(r'(^\w)|([.!?]\s*\w)', lambda match: match.group(0).upper(), output_text)
+        output_text = _SENTENCE_START.sub(_capitalize_match, output_text)
 
-    log.debug(f"Processed text from '{original_text}' to '{output_text}'")
+    log.debug("Processed text from '%s' to '%s'", original_text, output_text)
     log.info("Text processing completed.")
     return output_text
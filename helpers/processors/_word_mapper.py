@@ -1,32 +1,81 @@
+import re
 import logging
-from helpers.processors._mapping_file_loader import load_mapping_file
+from helpers.processors._lexicon import get_lexicon_stack
 
 log = logging.getLogger(__name__)
 
-def map_words(output_text, mapping_file_path):
+_WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+def _match_case(source, replacement):
+    if len(source) > 1 and source.isupper():
+        return replacement.upper()
+    if source[0].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+def map_words(output_text, mapping_file_paths):
     """
-    Maps words in the text using a JSON mapping file.
+    Maps words and phrases in the text using one or more JSON mapping files.
+
+    All mappings are applied in a single pass, preferring the longest phrase
+    that matches at each word. Punctuation, spacing and the capitalization of
+    the replaced words are preserved. Files covered by a compiled lexicon (see
+    helpers.processors._lexicon) are looked up in it, including inflected forms
+    when LEXICON_INFLECTIONS is on.
 
     Args:
         output_text (str): The text to process.
-        mapping_file_path (str): The relative path to the JSON mapping file.
+        mapping_file_paths (str | list): The relative path(s) to the JSON mapping file(s).
 
     Returns:
         str: The processed text.
     """
-    log.info(f"Starting word mapping using file: {mapping_file_path}")
+    if isinstance(mapping_file_paths, str):
+        mapping_file_paths = (mapping_file_paths,)
+    mapping_file_paths = tuple(mapping_file_paths)
+    log.info("Starting word mapping...")
+    log.debug("Word mapping files: %s", mapping_file_paths)
+
+    lexicon = get_lexicon_stack(mapping_file_paths)
+    tokens = list(_WORD_PATTERN.finditer(output_text))
+
+    pieces = []
+    last_end = 0
+    index = 0
+    while index < len(tokens):
+        match_value = None
+        match_last = index
+        position = index
+        phrase = None
+        while position < len(tokens):
+            word = tokens[position].group().lower()
+            if phrase is None:
+                phrase = word
+            else:
+                gap = output_text[tokens[position - 1].end():tokens[position].start()]
+                if not gap.isspace():
+                    break
+                phrase = f"{phrase} {word}"
+            value, has_longer = lexicon.find(phrase)
+            if value is not None:
+                match_value = value
+                match_last = position
+            if not has_longer:
+                break
+            position += 1
 
-    # Load mapping from JSON
-    mapping = load_mapping_file(mapping_file_path)
-    log.debug(f"Loaded mapping: {mapping}")
+        if match_value is None:
+            index += 1
+            continue
 
-    words = output_text.split()
-    mapped_words = [
-        mapping.get(word.lower(), word).capitalize() if word[0].isupper() else mapping.get(word.lower(), word)
-        for word in words
-    ]
+        start, end = tokens[index].start(), tokens[match_last].end()
+        pieces.append(output_text[last_end:start])
+        pieces.append(_match_case(output_text[start:end], match_value))
+        last_end = end
+        index = match_last + 1
 
-    output_text = ' '.join(mapped_words)
-    log.debug(f"Mapped words: {output_text}")
+    pieces.append(output_text[last_end:])
+    output_text = ''.join(pieces)
+    log.debug("Mapped words: %s", output_text)
     log.info("Word mapping completed.")
     return output_text
@@ -1,49 +1,28 @@
 import logging
-from helpers.processors._word_mapper import map_words
-from helpers.processors._text_processor import process_text
-from helpers.processors._pattern_remover import remove_patterns
+from helpers.processors._processing_plan import get_processing_plan
+from helpers.metrics import timed_stage
+from helpers.tracing import is_tracing, annotate
 
 log = logging.getLogger(__name__)
 
-def process_output_text(output_text, parameters):
+@timed_stage('post_processing')
+def process_output_text(output_text, parameters, timings=None):
     log.info("Processing output text...")
-    
-    if parameters['greetings'] == 'exclude':
-        output_text = remove_patterns(output_text, 'json/greeting_patterns.json')
-        log.debug(f"Text after removing greetings: '{output_text}'")
-        output_text = remove_patterns(output_text, 'json/signoff_patterns.json')
-        log.debug(f"Text after removing sign-offs: '{output_text}'")
-        
-    if parameters['dialect'] in ['british', 'australian']:
-        output_text = map_words(output_text, 'json/us_gb_spelling.json')
-        log.debug(f"Text after applying spelling mapping: {output_text}")
-        output_text = map_words(output_text, 'json/us_gb_vocabulary.json')
-        log.debug(f"Text after applying vocabulary mapping: {output_text}")
-
-    if parameters['formality'] == 'casual' and parameters['channel'] == 'chat':
-        log.info("Starting casual text formatting...")
-
-        processing_rules = [
-            (r"\b(\w+)'(\w+)\b", r'\1\2'),  # Remove contractions
-            (r'[;,]', ''),  # Remove commas and semicolons
-            (r'(\w)[\-\u2013\u2014](\w)|\s*[\-\u2013\u2014]\s*', r'\1 \2'),  # Handle dashes
-            (r"'(\w+)'", r'\1')  # Remove single quotes around words
-        ]
-        output_text = process_text(output_text, processing_rules)
-
-        punctuation_rules = [
-            (r'\s*([.!?])', r'\1'),  # Ensure no extra spaces before punctuation
-            (r'\s+', ' ')  # Replace multiple spaces with a single space
-        ]
-        output_text = process_text(output_text, punctuation_rules, capitalize=True)
-
-        output_text = map_words(output_text, 'json/text_slang.json')
-
-        output_text = remove_patterns(output_text, 'json/greeting_patterns.json')
-        output_text = remove_patterns(output_text, 'json/signoff_patterns.json')
-
-        log.debug(f"Formatted text: '{output_text}'")
-        log.info("Casual text formatting completed.")
-
+    if timings is None and is_tracing():
+        timings = {}
+    output_text = get_processing_plan(parameters).run(output_text, timings)
+    annotate(step_seconds=timings)
+    log.info("Output text processing completed.")
+    return output_text
+
+@timed_stage('post_processing')
+def process_output_texts(output_texts, parameters, timings=None):
+    log.info("Processing %s output texts...", len(output_texts))
+    plan = get_processing_plan(parameters)
+    log.debug("Using processing plan: %s", plan.describe())
+    if timings is None and is_tracing():
+        timings = {}
+    output_texts = plan.run_batch(output_texts, timings)
+    annotate(step_seconds=timings)
     log.info("Output text processing completed.")
-    return output_text
\ No newline at end of file
+    return output_texts
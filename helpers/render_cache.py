@@ -0,0 +1,78 @@
+import logging
+import os
+import tempfile
+import threading
+from flask import current_app, request, has_request_context
+from jinja2 import FileSystemBytecodeCache
+
+log = logging.getLogger(__name__)
+
+# Bounds the variants kept per fragment, since variant values can come from the URL
+MAX_VARIANTS_PER_FRAGMENT = 512
+
+_fragments = {}
+_variant_counts = {}
+_fragments_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'uncached': 0}
+
+def cached_fragment(template_name, **variant):
+    """
+    Renders template_name once per distinct set of variant values and reuses the result.
+    Use it as {% include cached_fragment('name.html', key=value) without context %}.
+
+    Only use it for templates whose output depends on nothing but the variant values
+    and url_for: the request's context is not passed in. Edited templates are
+    re-rendered when Jinja's auto-reload is on.
+
+    Returns:
+        Template: A constant template holding the rendered fragment.
+    """
+    env = current_app.jinja_env
+    script_root = request.script_root if has_request_context() else ''
+    key = (template_name, script_root, tuple(sorted(variant.items())) if variant else ())
+    entry = _fragments.get(key)
+    # Without auto-reload a template never changes, so skip the loader entirely
+    template = env.get_template(template_name) if entry is None or env.auto_reload else entry[0]
+    if entry is not None and entry[0] is template:
+        _stats['hits'] += 1
+        return entry[1]
+    # A constant template: including it yields the stored HTML without the copy
+    # that {{ }} output makes of every Markup value
+    fragment = env.from_string('{% raw %}' + template.render(**variant) + '{% endraw %}')
+    with _fragments_lock:
+        if entry is None and _variant_counts.get(template_name, 0) >= MAX_VARIANTS_PER_FRAGMENT:
+            _stats['uncached'] += 1
+            return fragment
+        if entry is None:
+            _variant_counts[template_name] = _variant_counts.get(template_name, 0) + 1
+        _fragments[key] = (template, fragment)
+        _stats['misses'] += 1
+    log.debug("Rendered fragment %s for %s.", template_name, variant)
+    return fragment
+
+def get_fragment_cache_stats():
+    with _fragments_lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_fragments)
+    return stats
+
+def clear_fragment_cache():
+    with _fragments_lock:
+        _fragments.clear()
+        _variant_counts.clear()
+
+def configure_template_cache(app, bytecode_cache_dir=None):
+    """
+    Adds cached_fragment to the template globals and stores compiled templates in
+    TEMPLATE_CACHE_DIR (a per-user temp directory by default; empty disables it),
+    so workers load bytecode instead of recompiling every template at startup.
+    """
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+    if bytecode_cache_dir is None:
+        bytecode_cache_dir = os.getenv('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), f"profile-rewriter-jinja-{os.getuid()}"))
+    if not bytecode_cache_dir:
+        log.info("Jinja bytecode cache disabled.")
+        return
+    os.makedirs(bytecode_cache_dir, mode=0o700, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+    log.info("Jinja bytecode cache stored in %s.", bytecode_cache_dir)
@@ -1,32 +1,97 @@
 import logging
 import json
-from urllib import error, request
+from urllib import error
+from helpers.requestors._http_client import get_http_client
 
 log = logging.getLogger(__name__)
 
-def make_api_request(url, api_key=None, method="GET", data=None, headers=None, timeout=10):
-    log.info(f"Initiating API request to {url} with method {method}.")
+def _raise_for_status(url, response):
+    if response.status >= 400:
+        body = response.read()
+        log.debug("Error response body: %s", body[:500])
+        raise error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+def make_api_request(url, api_key=None, method="GET", data=None, headers=None, timeout=None, response_hook=None):
+    log.info("Initiating API request to %s with method %s.", url, method)
     if headers is None:
         headers = {"Content-Type": "application/json"}
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
     
-    req = request.Request(url, headers=headers, method=method)
+    body = None
     if data:
-        req.data = json.dumps(data).encode("utf-8")
-        log.debug(f"Request payload: {data}")
+        body = json.dumps(data).encode("utf-8")
+        log.debug("Request payload: %s", data)
     try:
-        with request.urlopen(req, timeout=timeout) as response:
+        with get_http_client().request(method, url, body=body, headers=headers, read_timeout=timeout) as response:
+            if response_hook:
+                response_hook(response.headers)
+            _raise_for_status(url, response)
             response_data = json.loads(response.read())
             log.info("API request successful.")
-            log.debug(f"Response data: {response_data}")
+            log.debug("Response data: %s", response_data)
             return response_data
     except error.HTTPError as e:
-        log.error(f"HTTP error {e.code}: {e.reason}")
+        log.error("HTTP error %s: %s", e.code, e.reason)
+        raise
+    except error.URLError as e:
+        log.error("URL error: %s", e.reason)
+        raise
+    except Exception as e:
+        log.error("Unexpected error during API request: %s", e)
+        raise
+
+def make_api_stream_request(url, api_key=None, method="POST", data=None, headers=None, timeout=None, response_hook=None):
+    """
+    Makes a streaming API request and yields each Server-Sent Event payload as it arrives.
+
+    Args:
+        url (str): The endpoint to call.
+        api_key (str, optional): Sent as a bearer token if provided.
+        method (str): The HTTP method. Defaults to POST.
+        data (dict, optional): The JSON request body.
+        headers (dict, optional): Request headers. Defaults to JSON content type.
+        timeout (float, optional): Read timeout in seconds, applied to each read.
+                                   Defaults to the shared client's read timeout.
+        response_hook (callable, optional): Called with the response headers before the body is read.
+
+    Yields:
+        dict: The decoded JSON payload of each `data:` line, until `[DONE]`.
+    """
+    log.info("Initiating streaming API request to %s with method %s.", url, method)
+    if headers is None:
+        headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    headers["Accept"] = "text/event-stream"
+
+    body = None
+    if data:
+        body = json.dumps(data).encode("utf-8")
+        log.debug("Request payload: %s", data)
+    try:
+        with get_http_client().request(method, url, body=body, headers=headers, read_timeout=timeout) as response:
+            if response_hook:
+                response_hook(response.headers)
+            _raise_for_status(url, response)
+            # Keep reading past [DONE] so the connection can be returned to the pool
+            completed = False
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if completed or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    log.info("Streaming API request completed.")
+                    completed = True
+                    continue
+                yield json.loads(payload)
+    except error.HTTPError as e:
+        log.error("HTTP error %s: %s", e.code, e.reason)
         raise
     except error.URLError as e:
-        log.error(f"URL error: {e.reason}")
+        log.error("URL error: %s", e.reason)
         raise
     except Exception as e:
-        log.error(f"Unexpected error during API request: {str(e)}")
+        log.error("Unexpected error during streaming API request: %s", e)
         raise
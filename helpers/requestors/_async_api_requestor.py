@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import socket
+import ssl
+import weakref
+from email.message import Message
+from urllib import error
+from urllib.parse import urlsplit
+from helpers.requestors._http_client import get_http_client, may_resend
+
+log = logging.getLogger(__name__)
+
+_ssl_context = None
+# Idle keep-alive connections per event loop, by (scheme, host, port). Streams belong
+# to the loop that opened them, so each asyncio.run gets its own pool, which
+# close_async_connections empties before the loop ends.
+_pools = weakref.WeakKeyDictionary()
+# Errors that mean a pooled connection was closed by the server while idle
+_STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError)
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+def _loop_pool(pool_key):
+    return _pools.setdefault(asyncio.get_running_loop(), {}).setdefault(pool_key, [])
+
+async def _open_tunnel(proxy, host, port, ssl_context):
+    # Asks the proxy to CONNECT on a bare socket, then starts TLS with the target over it
+    proxy_host, proxy_port, proxy_headers = proxy
+    loop = asyncio.get_running_loop()
+    family, socket_type, protocol, _, address = (await loop.getaddrinfo(proxy_host, proxy_port, type=socket.SOCK_STREAM))[0]
+    sock = socket.socket(family, socket_type, protocol)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, address)
+        request_lines = [f"CONNECT {host}:{port} HTTP/1.1", f"Host: {host}:{port}"]
+        request_lines += [f"{name}: {value}" for name, value in proxy_headers.items()]
+        await loop.sock_sendall(sock, ('\r\n'.join(request_lines) + '\r\n\r\n').encode('utf-8'))
+        response = b''
+        while b'\r\n\r\n' not in response:
+            chunk = await loop.sock_recv(sock, 4096)
+            if not chunk:
+                raise OSError("Proxy closed the connection before answering CONNECT")
+            response += chunk
+        status_line = response.split(b'\r\n', 1)[0].decode('iso-8859-1')
+        if status_line.split(' ')[1:2] != ['200']:
+            raise OSError(f"Tunnel connection failed: {status_line}")
+        return await asyncio.open_connection(sock=sock, ssl=ssl_context, server_hostname=host)
+    except BaseException:
+        sock.close()
+        raise
+
+async def _open_connection(pool_key, client, proxy=None):
+    pool = _loop_pool(pool_key)
+    while pool:
+        reader, writer = pool.pop()
+        if not writer.is_closing() and not reader.at_eof():
+            client._count('reused')
+            return reader, writer, True
+        writer.close()
+        client._count('discarded')
+    scheme, host, port = pool_key
+    ssl_context = _get_ssl_context() if scheme == 'https' else None
+    if proxy is None:
+        connecting = asyncio.open_connection(host, port, ssl=ssl_context)
+    elif scheme == 'https':
+        connecting = _open_tunnel(proxy, host, port, ssl_context)
+    else:
+        connecting = asyncio.open_connection(proxy[0], proxy[1])
+    reader, writer = await asyncio.wait_for(connecting, client.connect_timeout)
+    client._count('handshakes')
+    log.debug("Opened new async connection to %s:%s.", host, port)
+    return reader, writer, False
+
+def _release_connection(pool_key, reader, writer, client, reusable):
+    pool = _loop_pool(pool_key)
+    if reusable and len(pool) < client.pool_size:
+        pool.append((reader, writer))
+        return
+    writer.close()
+    client._count('discarded')
+
+async def close_async_connections():
+    """
+    Closes the idle connections opened on the running event loop. Call before the
+    loop ends, or asyncio reports their transports as unclosed.
+    """
+    pools = _pools.pop(asyncio.get_running_loop(), {})
+    writers = [writer for pool in pools.values() for _, writer in pool]
+    for writer in writers:
+        writer.close()
+    for writer in writers:
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+async def _read_headers(reader, read_timeout):
+    headers = Message()
+    while True:
+        line = await asyncio.wait_for(reader.readline(), read_timeout)
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('iso-8859-1').partition(':')
+        headers[name.strip()] = value.strip()
+
+async def _read_body(reader, headers, read_timeout):
+    if headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), read_timeout)
+            size = int(size_line.split(b';')[0].strip(), 16)
+            if size == 0:
+                await asyncio.wait_for(reader.readline(), read_timeout)
+                return b''.join(chunks)
+            chunks.append(await asyncio.wait_for(reader.readexactly(size), read_timeout))
+            await asyncio.wait_for(reader.readexactly(2), read_timeout)
+    if headers.get('Content-Length'):
+        return await asyncio.wait_for(reader.readexactly(int(headers['Content-Length'])), read_timeout)
+    return await asyncio.wait_for(reader.read(), read_timeout)
+
+async def make_async_api_request(url, api_key=None, method="GET", data=None, headers=None, timeout=None, response_hook=None):
+    """
+    The asyncio counterpart of make_api_request, for callers running many requests on one event loop.
+
+    Connections are kept alive and reused by later requests on the same loop, and
+    counted in the shared HTTP client's stats. Connect and read timeouts, proxies and
+    the rule for sending a request again after a reused connection drops are that
+    client's. Errors are raised as urllib.error.HTTPError and URLError,
+    exactly as in make_api_request.
+    """
+    log.info("Initiating async API request to %s with method %s.", url, method)
+    if headers is None:
+        headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    client = get_http_client()
+    read_timeout = timeout or client.read_timeout
+
+    parts = urlsplit(url)
+    scheme = parts.scheme or 'https'
+    host = parts.hostname
+    pool_key = (scheme, host, parts.port or (443 if scheme == 'https' else 80))
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    proxy = client.proxy_for(scheme, host)
+    if proxy is not None and scheme == 'http':
+        path = url
+        headers = {**headers, **proxy[2]}
+    body = json.dumps(data).encode("utf-8") if data else b''
+    if data:
+        log.debug("Request payload: %s", data)
+
+    request_lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+    request_lines += [f"{name}: {value}" for name, value in headers.items()]
+    request_bytes = ('\r\n'.join(request_lines) + '\r\n\r\n').encode('utf-8') + body
+
+    client._count('requests')
+    while True:
+        writer = None
+        reused = False
+        # Unlike sendall, a failed drain does not tell how much of the request went
+        # out, so it counts as sent from the first write
+        request_sent = False
+        try:
+            reader, writer, reused = await _open_connection(pool_key, client, proxy)
+            request_sent = True
+            writer.write(request_bytes)
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), read_timeout)
+            if not status_line:
+                raise ConnectionResetError("Connection closed before a response was received")
+            break
+        except _STALE_CONNECTION_ERRORS as e:
+            if writer is not None:
+                writer.close()
+            if reused and may_resend(method, request_sent):
+                client._count('stale_retries')
+                log.debug("Pooled async connection to %s was stale, retrying on a new one.", host)
+                continue
+            log.error("URL error: %s", e)
+            raise error.URLError(e)
+        except (OSError, asyncio.TimeoutError, ValueError) as e:
+            if writer is not None:
+                writer.close()
+            log.error("URL error: %s", e)
+            raise error.URLError(e)
+        except BaseException:
+            # Cancelled mid-request: the connection is in an unknown state
+            if writer is not None:
+                writer.close()
+            raise
+
+    reusable = False
+    try:
+        _, status, reason = (status_line.decode('iso-8859-1').strip().split(' ', 2) + [''])[:3]
+        response_headers = await _read_headers(reader, read_timeout)
+        response_body = await _read_body(reader, response_headers, read_timeout)
+        # Bodies without a length are read to the end of the connection
+        reusable = (response_headers.get('Connection', '').lower() != 'close' and (
+            'Content-Length' in response_headers or response_headers.get('Transfer-Encoding', '').lower() == 'chunked'))
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+        log.error("URL error: %s", e)
+        raise error.URLError(e)
+    finally:
+        _release_connection(pool_key, reader, writer, client, reusable)
+
+    if response_hook:
+        response_hook(response_headers)
+    if int(status) >= 400:
+        log.error("HTTP error %s: %s", status, reason)
+        raise error.HTTPError(url, int(status), reason, response_headers, None)
+    response_data = json.loads(response_body)
+    log.info("Async API request successful.")
+    log.debug("Response data: %s", response_data)
+    return response_data
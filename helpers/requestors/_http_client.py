@@ -0,0 +1,280 @@
+import base64
+import http.client
+import logging
+import os
+import select
+import threading
+from urllib import error, request as urllib_request
+from urllib.parse import unquote, urlsplit
+
+log = logging.getLogger(__name__)
+
+# Errors raised when a pooled keep-alive connection was closed by the server while idle.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+# Methods that are safe to send again when a connection drops before the response.
+# Others, like the POSTs to OpenAI, may already have been processed and charged.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+def may_resend(method, request_sent):
+    """
+    Whether a request that failed on a reused connection can be sent again.
+
+    Args:
+        method (str): The HTTP method.
+        request_sent (bool): Whether the whole request may have reached the server.
+    """
+    return not request_sent or method.upper() in IDEMPOTENT_METHODS
+
+def parse_proxy(proxy_url):
+    """
+    Parses an HTTP_PROXY/HTTPS_PROXY value.
+
+    Returns:
+        tuple: (host, port, headers to send the proxy), with Proxy-Authorization
+        when the URL carries credentials.
+
+    Raises:
+        ValueError: If the proxy is not a plain http:// proxy.
+    """
+    parts = urlsplit(proxy_url if '://' in proxy_url else f"http://{proxy_url}")
+    if parts.scheme != 'http' or not parts.hostname:
+        raise ValueError(f"Unsupported proxy {parts.scheme}://{parts.hostname}; only http:// proxies are supported")
+    headers = {}
+    if parts.username:
+        credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}".encode('utf-8')
+        headers['Proxy-Authorization'] = f"Basic {base64.b64encode(credentials).decode('ascii')}"
+    return parts.hostname, parts.port or 80, headers
+
+def _is_dropped(connection):
+    # An idle keep-alive socket has nothing to read unless the server closed it
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+class PooledResponse:
+    """
+    Wraps an http.client response and returns its connection to the pool once the
+    body has been fully read, or closes it if the body was abandoned.
+    """
+
+    def __init__(self, client, pool_key, connection, response):
+        self._client = client
+        self._pool_key = pool_key
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self):
+        try:
+            return self._response.read()
+        finally:
+            self.close()
+
+    def __iter__(self):
+        try:
+            while True:
+                line = self._response.readline()
+                if not line:
+                    break
+                yield line
+        finally:
+            self.close()
+
+    def close(self):
+        if self._connection is None:
+            return
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._client._release(self._pool_key, self._connection, reusable)
+        self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class HTTPClient:
+    """
+    A thread-safe HTTP/1.1 client that keeps idle connections per host alive for reuse.
+
+    Args:
+        pool_size (int): Maximum idle connections kept per host.
+        connect_timeout (float): Seconds allowed for the TCP and TLS handshake.
+        read_timeout (float): Seconds allowed between bytes once connected.
+        proxies (dict, optional): Scheme -> proxy URL, plus 'no' for hosts that bypass
+            them, as returned by urllib.request.getproxies(). Read from HTTP_PROXY,
+            HTTPS_PROXY and NO_PROXY when unset. HTTPS requests are tunnelled with CONNECT.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5, read_timeout=30, proxies=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._proxy_settings = urllib_request.getproxies() if proxies is None else proxies
+        self.proxies = {scheme: parse_proxy(url) for scheme, url in self._proxy_settings.items() if scheme in ('http', 'https')}
+        self._bypassed_hosts = {}
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'handshakes': 0, 'reused': 0, 'stale_retries': 0, 'discarded': 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def proxy_for(self, scheme, host):
+        """
+        Returns:
+            tuple | None: (host, port, headers) of the proxy for requests to host, or
+            None when they go direct.
+        """
+        proxy = self.proxies.get(scheme)
+        if proxy is None:
+            return None
+        bypassed = self._bypassed_hosts.get(host)
+        if bypassed is None:
+            bypassed = self._bypassed_hosts[host] = bool(urllib_request.proxy_bypass_environment(host, self._proxy_settings))
+        return None if bypassed else proxy
+
+    def _acquire(self, pool_key, proxy=None):
+        with self._lock:
+            pool = self._pools.get(pool_key)
+            while pool:
+                connection = pool.pop()
+                if not _is_dropped(connection):
+                    self._stats['reused'] += 1
+                    return connection, True
+                connection.close()
+                self._stats['discarded'] += 1
+        scheme, host, port = pool_key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        if proxy is None:
+            connection = connection_class(host, port, timeout=self.connect_timeout)
+        else:
+            proxy_host, proxy_port, proxy_headers = proxy
+            connection = connection_class(proxy_host, proxy_port, timeout=self.connect_timeout)
+            if scheme == 'https':
+                connection.set_tunnel(host, port, headers=proxy_headers)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        self._count('handshakes')
+        log.debug("Opened new connection to %s:%s.", host, port)
+        return connection, False
+
+    def _release(self, pool_key, connection, reusable):
+        if reusable:
+            with self._lock:
+                pool = self._pools.setdefault(pool_key, [])
+                if len(pool) < self.pool_size:
+                    pool.append(connection)
+                    return
+        connection.close()
+        self._count('discarded')
+
+    def request(self, method, url, body=None, headers=None, read_timeout=None):
+        """
+        Sends a request over a pooled connection. If a reused connection turns out
+        to be closed, the request is sent again on a new one, unless it was sent in
+        full and its method is not idempotent.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The absolute URL.
+            body (bytes, optional): The request body.
+            headers (dict, optional): Request headers.
+            read_timeout (float, optional): Overrides the client's read timeout for this request.
+
+        Returns:
+            PooledResponse: The response; read or iterate it to release the connection.
+
+        Raises:
+            urllib.error.URLError: If the connection could not be established or was lost.
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'https'
+        pool_key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        headers = headers or {}
+        proxy = self.proxy_for(scheme, parts.hostname)
+        if proxy is not None and scheme == 'http':
+            # Plain HTTP goes to the proxy with the full URL instead of through a tunnel
+            path = url
+            headers = {**headers, **proxy[2]}
+        self._count('requests')
+
+        while True:
+            try:
+                connection, reused = self._acquire(pool_key, proxy)
+            except OSError as e:
+                raise error.URLError(e)
+            if read_timeout is not None:
+                connection.sock.settimeout(read_timeout)
+            # sendall either delivers the whole request or raises, so a failure while
+            # sending means the server cannot have acted on it
+            request_sent = False
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                request_sent = True
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS as e:
+                connection.close()
+                if reused and may_resend(method, request_sent):
+                    self._count('stale_retries')
+                    log.debug("Pooled connection to %s was stale, retrying on a new one.", pool_key[1])
+                    continue
+                raise error.URLError(e)
+            except OSError as e:
+                connection.close()
+                raise error.URLError(e)
+            if read_timeout is not None:
+                connection.sock.settimeout(self.read_timeout)
+            return PooledResponse(self, pool_key, connection, response)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_connections'] = sum(len(pool) for pool in self._pools.values())
+        return stats
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for connection in pool:
+                connection.close()
+
+_client = None
+_client_lock = threading.RLock()
+
+def configure_http_client(pool_size=None, connect_timeout=None, read_timeout=None):
+    """
+    Replaces the shared client, reading unset options from HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT and HTTP_READ_TIMEOUT, and proxies from HTTP_PROXY,
+    HTTPS_PROXY and NO_PROXY. A proxy the client cannot use raises ValueError here,
+    at startup, rather than failing each request.
+    """
+    global _client
+    client = HTTPClient(
+        pool_size=pool_size or int(os.getenv('HTTP_POOL_SIZE', 10)),
+        connect_timeout=connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+        read_timeout=read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', 30)),
+    )
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None:
+        previous.close()
+    log.info("HTTP client configured with pool size %s, connect timeout %ss, read timeout %ss.", client.pool_size, client.connect_timeout, client.read_timeout)
+    for scheme, (proxy_host, proxy_port, _) in sorted(client.proxies.items()):
+        log.info("%s requests go through the proxy at %s:%s, except for NO_PROXY hosts.", scheme.upper(), proxy_host, proxy_port)
+    return client
+
+def get_http_client():
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                configure_http_client()
+    return _client
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_SECONDS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+# A budget left idle this long has refilled completely, so it can be dropped and
+# recreated on the key's next call; limits read from headers are relearned from the
+# next response
+BUDGET_IDLE_SECONDS = 60
+
+def parse_duration(value):
+    """
+    Parses OpenAI reset durations such as '1s', '6m0s' or '20ms' into seconds.
+
+    Returns:
+        float | None: The duration in seconds, or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+def estimate_request_tokens(data):
+    """
+    Estimates the tokens a chat completion request will consume: roughly four
+    characters per prompt token plus the completion budget for every choice.
+    """
+    if not data:
+        return 1
+    prompt_chars = sum(len(message.get('content', '')) for message in data.get('messages', []))
+    return prompt_chars // 4 + data.get('max_tokens', 0) * data.get('n', 1)
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def wait_time(self, cost):
+        # Requests larger than the whole bucket are let through once it is full
+        needed = min(cost, self.capacity) - self.level
+        return max(0.0, needed * 60 / self.capacity)
+
+class _KeyBudget:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self.last_used = time.monotonic()
+        # Calls waiting on this budget, which must not see it replaced
+        self.waiters = 0
+
+    def is_idle(self, now):
+        return not self.waiters and self.blocked_until <= now and now - self.last_used > BUDGET_IDLE_SECONDS
+
+class RateLimiter:
+    """
+    Tracks requests-per-minute and tokens-per-minute budgets per API key and makes
+    callers wait until their request fits, instead of letting them hit HTTP 429.
+
+    Budgets start from the configured limits and are corrected from the
+    x-ratelimit-* headers OpenAI returns. A 429 pauses every caller on that key
+    until Retry-After (or the reported reset) has passed.
+
+    Args:
+        requests_per_minute (int): Default request budget per key.
+        tokens_per_minute (int): Default token budget per key.
+        max_retries (int): Retries for 429 and 5xx responses.
+        base_delay (float): First backoff delay in seconds, doubled per retry.
+        max_delay (float): Upper bound on a single backoff delay.
+        max_wait (float): Longest a call may queue before giving up.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=10000, max_retries=3, base_delay=1.0, max_delay=20.0, max_wait=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        # Least recently used first, so idle budgets are evicted from the front
+        self._budgets = OrderedDict()
+        self._condition = threading.Condition()
+        self._stats = {
+            'queue_depth': 0, 'max_queue_depth': 0, 'queued_calls': 0, 'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0, 'rate_limited': 0, 'retries': 0,
+        }
+
+    @staticmethod
+    def _budget_key(api_key):
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+    def _evict_idle(self, now):
+        while self._budgets:
+            key, budget = next(iter(self._budgets.items()))
+            if not budget.is_idle(now):
+                break
+            del self._budgets[key]
+            log.debug("Dropped the idle rate limit budget for key %s.", key)
+
+    def _budget(self, api_key):
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = self._budget_key(api_key)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = _KeyBudget(self.requests_per_minute, self.tokens_per_minute)
+        else:
+            self._budgets.move_to_end(key)
+        budget.last_used = now
+        return budget
+
+    def acquire(self, api_key, tokens):
+        """
+        Blocks until the key has budget for one request of the given size, then spends it.
+
+        Raises:
+            TimeoutError: If the call would have to wait longer than max_wait.
+        """
+        started_at = time.monotonic()
+        queued = False
+        with self._condition:
+            budget = self._budget(api_key)
+            budget.waiters += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    budget.requests.refill(now)
+                    budget.tokens.refill(now)
+                    wait = max(budget.blocked_until - now, budget.requests.wait_time(1), budget.tokens.wait_time(tokens))
+                    if wait <= 0:
+                        break
+                    if now - started_at + wait > self.max_wait:
+                        raise TimeoutError("Rate limit budget for this API key is exhausted. Please try again shortly.")
+                    if not queued:
+                        queued = True
+                        self._stats['queue_depth'] += 1
+                        self._stats['queued_calls'] += 1
+                        self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._stats['queue_depth'])
+                        log.info("Queuing OpenAI request for %.2fs to stay within the rate limit.", wait)
+                    self._condition.wait(timeout=wait)
+                budget.requests.level -= 1
+                budget.tokens.level -= tokens
+            finally:
+                budget.waiters -= 1
+                budget.last_used = time.monotonic()
+                self._budgets.move_to_end(self._budget_key(api_key))
+                if queued:
+                    waited = time.monotonic() - started_at
+                    self._stats['queue_depth'] -= 1
+                    self._stats['total_wait_seconds'] += waited
+                    self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], waited)
+
+    def reconcile(self, api_key, estimated_tokens, actual_tokens):
+        # Refund (or charge) the difference once the real usage is known
+        with self._condition:
+            self._budget(api_key).tokens.level += estimated_tokens - actual_tokens
+            self._condition.notify_all()
+
+    def update_from_headers(self, api_key, headers):
+        if not headers:
+            return
+        with self._condition:
+            budget = self._budget(api_key)
+            now = time.monotonic()
+            for bucket, kind in ((budget.requests, 'requests'), (budget.tokens, 'tokens')):
+                limit = headers.get(f'x-ratelimit-limit-{kind}')
+                remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                if limit and limit.isdigit():
+                    bucket.capacity = int(limit)
+                if remaining and remaining.isdigit():
+                    bucket.refill(now)
+                    bucket.level = min(bucket.level, float(remaining))
+            self._condition.notify_all()
+
+    def backoff(self, api_key, attempt, status, headers=None):
+        """
+        Records a 429 or 5xx response and returns how long to wait before retrying.
+
+        Retry-After and x-ratelimit-reset-* are honoured when present; otherwise the
+        delay grows exponentially with full jitter. A 429 also pauses the whole key.
+        """
+        headers = headers or {}
+        delay = parse_duration(headers.get('retry-after'))
+        if delay is None and status == 429:
+            resets = [parse_duration(headers.get(f'x-ratelimit-reset-{kind}')) for kind in ('requests', 'tokens')]
+            resets = [reset for reset in resets if reset is not None]
+            delay = max(resets) if resets else None
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        delay = min(delay, self.max_delay)
+        with self._condition:
+            self._stats['retries'] += 1
+            if status == 429:
+                self._stats['rate_limited'] += 1
+                budget = self._budget(api_key)
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + delay)
+        return delay
+
+    def get_stats(self):
+        with self._condition:
+            self._evict_idle(time.monotonic())
+            stats = dict(self._stats)
+            stats['tracked_keys'] = len(self._budgets)
+        return stats
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def configure_rate_limiter(**options):
+    """
+    Replaces the shared rate limiter, reading unset options from OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT, OPENAI_MAX_RETRIES and OPENAI_MAX_QUEUE_WAIT.
+    """
+    global _limiter
+    options.setdefault('requests_per_minute', int(os.getenv('OPENAI_RPM_LIMIT', 500)))
+    options.setdefault('tokens_per_minute', int(os.getenv('OPENAI_TPM_LIMIT', 10000)))
+    options.setdefault('max_retries', int(os.getenv('OPENAI_MAX_RETRIES', 3)))
+    options.setdefault('max_wait', float(os.getenv('OPENAI_MAX_QUEUE_WAIT', 60)))
+    with _limiter_lock:
+        _limiter = RateLimiter(**options)
+    log.info("OpenAI rate limiter configured with %s RPM, %s TPM and %s retries.", _limiter.requests_per_minute, _limiter.tokens_per_minute, _limiter.max_retries)
+    return _limiter
+
+def get_rate_limiter():
+    if _limiter is None:
+        configure_rate_limiter()
+    return _limiter
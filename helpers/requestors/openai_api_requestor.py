@@ -1,16 +1,157 @@
-from helpers.requestors._api_requestor import make_api_request
+from functools import partial
+from urllib import error
+import asyncio
 import logging
+import os
+import time
+from helpers.requestors._api_requestor import make_api_request, make_api_stream_request
+from helpers.requestors._async_api_requestor import make_async_api_request
+from helpers.requestors._rate_limiter import get_rate_limiter, estimate_request_tokens
+from helpers.metrics import inc, stage_timer
 
 log = logging.getLogger(__name__)
 
+# Upstream statuses worth retrying after a backoff.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+_base_url = DEFAULT_OPENAI_BASE_URL
+
+def configure_openai_base_url(base_url=None):
+    """
+    Points every OpenAI call at base_url, or at OPENAI_BASE_URL if unset, e.g. the
+    local stand-in in loadtest/openai_stub.py.
+    """
+    global _base_url
+    _base_url = (base_url or os.getenv('OPENAI_BASE_URL') or DEFAULT_OPENAI_BASE_URL).rstrip('/')
+    if _base_url != DEFAULT_OPENAI_BASE_URL:
+        log.warning("OpenAI requests are sent to %s instead of the OpenAI API.", _base_url)
+    return _base_url
+
+def openai_url(path):
+    return f"{_base_url}/{path.lstrip('/')}"
+
+def _record_outcome(exception=None):
+    status = 200 if exception is None else getattr(exception, 'code', 'error')
+    inc('rewriter_upstream_responses_total', {'status': status})
+
+def _should_retry(exception, attempt, limiter):
+    _record_outcome(exception)
+    retry = isinstance(exception, error.HTTPError) and exception.code in RETRYABLE_STATUS_CODES and attempt < limiter.max_retries
+    if retry:
+        inc('rewriter_upstream_retries_total', {'status': exception.code})
+    return retry
+
+def _acquire_budget(limiter, api_key, estimated_tokens):
+    # Our own limiter's message is meant for the user, unlike the upstream failures below
+    try:
+        limiter.acquire(api_key, estimated_tokens)
+    except TimeoutError as e:
+        log.warning("Not calling OpenAI: %s", e)
+        raise RuntimeError(str(e))
+
+def _wait_before_retry(limiter, api_key, attempt, exception):
+    delay = limiter.backoff(api_key, attempt, exception.code, exception.headers)
+    log.warning("OpenAI returned HTTP %s, retrying in %.2fs (retry %s/%s).", exception.code, delay, attempt + 1, limiter.max_retries)
+    time.sleep(delay)
+
 def make_openai_request(url, api_key, method="POST", data=None):
     log.info("Preparing OpenAI API request...")
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_request_tokens(data)
+    attempt = 0
+    while True:
+        _acquire_budget(limiter, api_key, estimated_tokens)
+        try:
+            with stage_timer('upstream_call'):
+                response = make_api_request(
+                    url, None, method, data, headers=headers, response_hook=partial(limiter.update_from_headers, api_key)
+                )
+            _record_outcome()
+            actual_tokens = response.get('usage', {}).get('total_tokens') if isinstance(response, dict) else None
+            if actual_tokens is not None:
+                limiter.reconcile(api_key, estimated_tokens, actual_tokens)
+            return response
+        except Exception as e:
+            # A failed attempt reports no usage, so give back what it was charged
+            limiter.reconcile(api_key, estimated_tokens, 0)
+            if _should_retry(e, attempt, limiter):
+                _wait_before_retry(limiter, api_key, attempt, e)
+                attempt += 1
+                continue
+            log.error("OpenAI API request failed: %s", e)
+            raise RuntimeError("The OpenAI service is experiencing issues. Please try again later.")
+
+async def make_async_openai_request(url, api_key, method="POST", data=None):
+    log.info("Preparing async OpenAI API request...")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_request_tokens(data)
+    attempt = 0
+    while True:
+        # The limiter blocks while queuing, so wait for it off the event loop
+        await asyncio.to_thread(_acquire_budget, limiter, api_key, estimated_tokens)
+        try:
+            with stage_timer('upstream_call'):
+                response = await make_async_api_request(
+                    url, None, method, data, headers=headers, response_hook=partial(limiter.update_from_headers, api_key)
+                )
+            _record_outcome()
+            actual_tokens = response.get('usage', {}).get('total_tokens') if isinstance(response, dict) else None
+            if actual_tokens is not None:
+                limiter.reconcile(api_key, estimated_tokens, actual_tokens)
+            return response
+        except Exception as e:
+            limiter.reconcile(api_key, estimated_tokens, 0)
+            if _should_retry(e, attempt, limiter):
+                delay = limiter.backoff(api_key, attempt, e.code, e.headers)
+                log.warning("OpenAI returned HTTP %s, retrying in %.2fs (retry %s/%s).", e.code, delay, attempt + 1, limiter.max_retries)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            log.error("Async OpenAI API request failed: %s", e)
+            raise RuntimeError("The OpenAI service is experiencing issues. Please try again later.")
+
+def make_openai_stream_request(url, api_key, method="POST", data=None):
+    log.info("Preparing streaming OpenAI API request...")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_request_tokens(data)
+    attempt = 0
+    while True:
+        # Retries are only possible until the first event has been relayed
+        _acquire_budget(limiter, api_key, estimated_tokens)
+        try:
+            with stage_timer('upstream_first_event'):
+                stream = make_api_stream_request(
+                    url, None, method, data, headers=headers, response_hook=partial(limiter.update_from_headers, api_key)
+                )
+                first_event = next(stream, None)
+            _record_outcome()
+        except Exception as e:
+            limiter.reconcile(api_key, estimated_tokens, 0)
+            if _should_retry(e, attempt, limiter):
+                _wait_before_retry(limiter, api_key, attempt, e)
+                attempt += 1
+                continue
+            log.error("Streaming OpenAI API request failed: %s", e)
+            raise RuntimeError("The OpenAI service is experiencing issues. Please try again later.")
+        break
+    if first_event is None:
+        return
     try:
-        return make_api_request(url, None, method, data, headers=headers)
+        yield first_event
+        yield from stream
     except Exception as e:
-        log.error(f"OpenAI API request failed: {str(e)}")
+        log.error("Streaming OpenAI API request failed: %s", e)
         raise RuntimeError("The OpenAI service is experiencing issues. Please try again later.")
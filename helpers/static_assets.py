@@ -0,0 +1,412 @@
+"""
+Bundles, minifies, fingerprints and precompresses the files in static/.
+
+Usage:
+    python -m helpers.static_assets
+
+The build writes static/dist/ and its manifest.json, which maps each source path
+(as passed to url_for('static', filename=...)) to its fingerprinted copy. Run it
+whenever a file in static/ changes; the Dockerfile and render.yml run it on deploy.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import sys
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+DIST_DIRECTORY = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Files in each bundle, in the order the pages loaded them
+BUNDLES = {
+    'js/app.js': [
+        'js/logger.js',
+        'js/textarea_manager.js',
+        'js/button_manager.js',
+        'js/form_navigation_manager.js',
+        'js/stream_manager.js',
+        'js/loading_manager.js',
+        'js/form_manager.js',
+        'js/init.js',
+    ],
+    'css/app.css': [
+        'css/utils.css',
+        'css/containers.css',
+        'css/forms.css',
+        'css/textareas.css',
+        'css/typography.css',
+    ],
+}
+
+# Read by the server from disk rather than requested by browsers
+UNPUBLISHED_DIRECTORIES = ('json', 'lexicon', DIST_DIRECTORY)
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.svg', '.json', '.webmanifest', '.ico', '.txt', '.html')
+# Pages are left uncompressed: they echo form values next to the session's API key,
+# which would let compressed sizes leak the key (BREACH)
+COMPRESSIBLE_MIMETYPES = ('text/plain', 'text/css', 'application/json', 'application/javascript')
+IMMUTABLE_MAX_AGE = 31536000
+
+_JS_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new', 'delete', 'void', 'throw', 'yield', 'await'}
+# Spaces next to these never separate two tokens that would otherwise merge
+_JS_TIGHT = set('{}()[];,:=<>!?&|')
+# A line break after or before these cannot end a statement through automatic semicolon insertion
+_JS_JOINS_AFTER = set('{([,;')
+_JS_JOINS_BEFORE = set('})],.;')
+_CSS_TIGHT = set('{};,>')
+
+_settings = {'bundles_enabled': False, 'compression_enabled': True, 'min_size': 500}
+_manifest = {}
+
+def _scan_quoted(source, start):
+    quote = source[start]
+    position = start + 1
+    while position < len(source) and source[position] != quote:
+        position += 2 if source[position] == '\\' else 1
+    return position + 1
+
+def _scan_template(source, start):
+    position = start + 1
+    while position < len(source) and source[position] != '`':
+        if source[position] == '\\':
+            position += 2
+        elif source.startswith('${', position):
+            depth = 1
+            position += 2
+            while position < len(source) and depth:
+                char = source[position]
+                if char in '\'"':
+                    position = _scan_quoted(source, position)
+                    continue
+                if char == '`':
+                    position = _scan_template(source, position)
+                    continue
+                depth += {'{': 1, '}': -1}.get(char, 0)
+                position += 1
+        else:
+            position += 1
+    return position + 1
+
+def _scan_regex(source, start):
+    position = start + 1
+    in_class = False
+    while position < len(source):
+        char = source[position]
+        if char == '\\':
+            position += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            position += 1
+            break
+        position += 1
+    while position < len(source) and source[position].isalpha():
+        position += 1
+    return position
+
+def _starts_regex(code):
+    stripped = code.rstrip()
+    if not stripped or stripped[-1] in _JS_REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[A-Za-z_$][\w$]*$', stripped)
+    return word is not None and word.group() in _JS_REGEX_KEYWORDS
+
+def minify_js(source):
+    """
+    Removes comments, indentation and the whitespace around punctuation.
+    Line breaks that could end a statement are kept, so the code does not
+    depend on the semicolons the source happens to have.
+    """
+    pieces = []
+    whitespace = ''
+    position = 0
+
+    def flush_whitespace(next_char):
+        previous = pieces[-1][-1] if pieces else ''
+        if not previous or not whitespace:
+            return
+        if '\n' in whitespace:
+            joins = previous in _JS_JOINS_AFTER or (next_char in _JS_JOINS_BEFORE and not (next_char == '.' and previous.isdigit()))
+            if not joins:
+                pieces.append('\n')
+        elif previous not in _JS_TIGHT and next_char not in _JS_TIGHT:
+            pieces.append(' ')
+
+    while position < len(source):
+        char = source[position]
+        if char.isspace():
+            whitespace += char
+            position += 1
+            continue
+        if source.startswith('//', position):
+            end = source.find('\n', position)
+            position = len(source) if end == -1 else end
+            continue
+        if source.startswith('/*', position):
+            end = source.find('*/', position + 2)
+            end = len(source) if end == -1 else end + 2
+            whitespace += '\n' if '\n' in source[position:end] else ' '
+            position = end
+            continue
+        flush_whitespace(char)
+        whitespace = ''
+        if char in '\'"':
+            end = _scan_quoted(source, position)
+        elif char == '`':
+            end = _scan_template(source, position)
+        elif char == '/' and _starts_regex(''.join(pieces[-12:])):
+            end = _scan_regex(source, position)
+        else:
+            end = position + 1
+        pieces.append(source[position:end])
+        position = end
+    return ''.join(pieces) + '\n'
+
+def minify_css(source):
+    """
+    Removes comments and collapses whitespace, leaving quoted strings untouched.
+    """
+    pieces = []
+    whitespace = False
+    position = 0
+    while position < len(source):
+        char = source[position]
+        if char.isspace():
+            whitespace = True
+            position += 1
+            continue
+        if source.startswith('/*', position):
+            end = source.find('*/', position + 2)
+            position = len(source) if end == -1 else end + 2
+            whitespace = True
+            continue
+        previous = pieces[-1][-1] if pieces else ''
+        if whitespace and previous and previous not in _CSS_TIGHT and previous != ':' and char not in _CSS_TIGHT:
+            pieces.append(' ')
+        whitespace = False
+        if char == '}' and previous == ';':
+            pieces.pop()
+        end = _scan_quoted(source, position) if char in '\'"' else position + 1
+        pieces.append(source[position:end])
+        position = end
+    return ''.join(pieces) + '\n'
+
+MINIFIERS = {'.js': minify_js, '.css': minify_css}
+
+def _fingerprinted_name(filename, content):
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+
+def _write_compressed(path, content):
+    # Variants that do not save at least a tenth are not worth negotiating
+    written = []
+    variants = [('.gz', lambda: gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(content, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        if len(compressed) <= len(content) * 0.9:
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            written.append(suffix)
+    return written
+
+def _published_files(static_folder):
+    bundled = {source for sources in BUNDLES.values() for source in sources}
+    for directory, subdirectories, files in os.walk(static_folder):
+        relative_directory = os.path.relpath(directory, static_folder)
+        if relative_directory == '.':
+            subdirectories[:] = [name for name in subdirectories if name not in UNPUBLISHED_DIRECTORIES]
+        for name in sorted(files):
+            filename = os.path.normpath(os.path.join(relative_directory, name)).replace(os.sep, '/')
+            if not name.startswith('.') and filename not in bundled:
+                yield filename
+
+def _js_bundle_sources(bundle, sources, parts):
+    """
+    Returns the line that opens a JS bundle by declaring BUNDLE_SOURCES, the first
+    line of each file in it, which logger.js uses to name the file a log call came from.
+    """
+    lines = []
+    line = 2
+    for source, part in zip(sources, parts):
+        lines.append([line, os.path.basename(source)])
+        line += part.count('\n')
+    bundle_sources = {'bundle': os.path.splitext(os.path.basename(bundle))[0], 'lines': lines}
+    return f"const BUNDLE_SOURCES={json.dumps(bundle_sources, separators=(',', ':'))};\n"
+
+def build_assets(static_folder=STATIC_FOLDER):
+    """
+    Rebuilds static/dist: one minified file per bundle plus a fingerprinted copy of
+    every other published file, each with gzip (and brotli, when installed) variants.
+
+    Returns:
+        dict: The manifest, mapping source paths to paths under static/.
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIRECTORY)
+    shutil.rmtree(dist_folder, ignore_errors=True)
+    outputs = {}
+    for bundle, sources in BUNDLES.items():
+        minify = MINIFIERS[os.path.splitext(bundle)[1]]
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), 'r', encoding='utf-8') as file:
+                parts.append(minify(file.read()))
+        if bundle.endswith('.js'):
+            # A separator keeps one file's last statement from running into the next file
+            outputs[bundle] = (_js_bundle_sources(bundle, sources, parts) + ';'.join(parts)).encode('utf-8')
+        else:
+            outputs[bundle] = ''.join(parts).encode('utf-8')
+    for filename in _published_files(static_folder):
+        with open(os.path.join(static_folder, filename), 'rb') as file:
+            outputs[filename] = file.read()
+    manifest = {}
+    for filename, content in outputs.items():
+        target = f"{DIST_DIRECTORY}/{_fingerprinted_name(filename, content)}"
+        path = os.path.join(static_folder, target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        variants = _write_compressed(path, content) if filename.endswith(COMPRESSIBLE_EXTENSIONS) else []
+        manifest[filename] = target
+        log.info("Built %s (%s bytes, variants: %s).", target, len(content), variants or 'none')
+    with open(os.path.join(dist_folder, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIRECTORY, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        log.error("Failed to read static asset manifest %s: %s", path, e)
+        return None
+
+def asset_bundle(bundle):
+    """
+    Returns the files a page should load for a bundle: the bundle itself once it
+    has been built, otherwise its source files.
+    """
+    return [bundle] if bundle in _manifest else BUNDLES[bundle]
+
+def _fingerprint_static_url(endpoint, values):
+    if endpoint == 'static' and values.get('filename') in _manifest:
+        values['filename'] = _manifest[values['filename']]
+
+def _preferred_encoding(available):
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if suffix in available and accepted[encoding]:
+            return encoding, suffix
+    return None, ''
+
+def _make_static_view(app, default_view):
+    dist_folder = os.path.join(app.static_folder, DIST_DIRECTORY)
+    # The variants written next to each file, looked up once rather than per request
+    variants = {}
+    for target in _manifest.values():
+        path = os.path.join(app.static_folder, target)
+        variants[target] = {suffix for suffix in ('.br', '.gz') if os.path.exists(path + suffix)}
+
+    def static(filename):
+        if filename not in variants:
+            return default_view(filename=filename)
+        encoding, suffix = _preferred_encoding(variants[filename])
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(dist_folder, filename[len(DIST_DIRECTORY) + 1:] + suffix, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if variants[filename]:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    return static
+
+def _compress_response(response):
+    if (
+        not _settings['compression_enabled']
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < _settings['min_size']:
+        return response
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def init_static_assets(app, bundles_enabled=None, compression_enabled=None, min_size=None):
+    """
+    Serves the build from static/dist, reading unset options from STATIC_BUNDLES_ENABLED,
+    RESPONSE_COMPRESSION_ENABLED and RESPONSE_COMPRESSION_MIN_SIZE.
+
+    With bundles enabled and a manifest present, url_for('static', ...) links to the
+    fingerprinted copies, which are served precompressed with an immutable Cache-Control.
+    Without a build, pages load the source files as before.
+    """
+    global _manifest
+    _settings.update({
+        'bundles_enabled': bundles_enabled if bundles_enabled is not None else os.getenv(
+            'STATIC_BUNDLES_ENABLED', 'true' if app.config['ENVIRONMENT'] == 'production' else 'false').lower() == 'true',
+        'compression_enabled': compression_enabled if compression_enabled is not None else os.getenv(
+            'RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true',
+        'min_size': min_size if min_size is not None else int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 500)),
+    })
+    app.jinja_env.globals['asset_bundle'] = asset_bundle
+    app.after_request(_compress_response)
+    _manifest = {}
+    if not _settings['bundles_enabled']:
+        log.info("Static bundles disabled; serving source files.")
+        return
+    manifest = load_manifest(app.static_folder)
+    if manifest is None:
+        log.warning("No static build found in %s; serving source files. Run python -m helpers.static_assets.", app.static_folder)
+        return
+    _manifest = manifest
+    app.url_defaults(_fingerprint_static_url)
+    app.view_functions['static'] = _make_static_view(app, app.view_functions['static'])
+    log.info("Serving %s fingerprinted static files.", len(_manifest))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bundle, fingerprint and precompress the files in static/.")
+    parser.add_argument('--static-folder', default=STATIC_FOLDER, help="Folder to build from; the build goes into its dist/.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if brotli is None:
+        log.warning("brotli is not installed; only gzip variants are written.")
+    manifest = build_assets(args.static_folder)
+    print(f"Built {len(manifest)} files into {os.path.join(args.static_folder, DIST_DIRECTORY)}.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import partial
+from flask import g, request, before_render_template, template_rendered
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from helpers.generators._generation_scheduler import threads_are_greenlets
+
+log = logging.getLogger(__name__)
+
+TRACE_TOKEN_HEADER = 'X-Trace-Token'
+TRACE_RESPONSE_HEADER = 'X-Trace'
+TRACE_TOKEN_SALT = 'request-trace'
+MAX_HEADER_LENGTH = 4000
+MAX_STACK_DEPTH = 64
+
+_current_span = ContextVar('trace_span', default=None)
+_settings = {
+    'sample_rate': 0.0, 'profile_sampled': False, 'profile_interval': 0.005, 'trace_dir': '',
+    'token_max_age': 3600, 'serializer': None,
+}
+
+class Span:
+    __slots__ = ('name', 'attributes', 'start', 'end', 'children')
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        span = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+        }
+        if self.attributes:
+            span['attributes'] = self.attributes
+        if self.children:
+            span['children'] = [child.to_dict(origin) for child in list(self.children)]
+        return span
+
+    def stage_totals(self, totals=None):
+        totals = {} if totals is None else totals
+        for child in list(self.children):
+            end = child.end if child.end is not None else time.perf_counter()
+            totals[child.name] = round(totals.get(child.name, 0.0) + (end - child.start) * 1000, 3)
+            child.stage_totals(totals)
+        return totals
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack at a fixed interval from a background thread
+    and counts collapsed stacks, ready for flamegraph tools.
+
+    Only the request thread is sampled; batches fanned out to worker threads show
+    up as time waiting on their futures. Under gevent's monkey patching, threads are
+    greenlets that sys._current_frames does not see, so profiles are not recorded
+    there (see profiling_available).
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {'interval_ms': self.interval * 1000, 'samples': self.samples, 'stacks': dict(self.stacks.most_common())}
+
+def profiling_available():
+    """
+    Returns:
+        bool: False when gevent has patched threading, as in gunicorn's gevent worker.
+            The profiler's thread would then only run while the request is waiting
+            on I/O, and the request's greenlet has no entry in sys._current_frames.
+    """
+    return not threads_are_greenlets()
+
+class Trace:
+    def __init__(self, request_id, method, path, reason, profile=False):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.status = None
+        self.root = Span('request', {'method': method, 'path': path})
+        self.profiler = SamplingProfiler(threading.get_ident(), _settings['profile_interval']).start() if profile else None
+
+    def finish(self):
+        self.root.finish()
+        profile = self.profiler.stop() if self.profiler is not None else None
+        trace = {
+            'request_id': self.request_id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'reason': self.reason,
+            'stage_totals_ms': self.root.stage_totals(),
+            'spans': self.root.to_dict(self.root.start),
+        }
+        if profile is not None:
+            trace['profile'] = profile
+        return trace
+
+    def header_value(self):
+        # The full tree when it fits, otherwise time per stage name
+        spans = json.dumps(self.root.to_dict(self.root.start), separators=(',', ':'))
+        if len(spans) <= MAX_HEADER_LENGTH:
+            return spans
+        return json.dumps({'stage_totals_ms': self.root.stage_totals()}, separators=(',', ':'))
+
+def is_tracing():
+    return _current_span.get() is not None
+
+def enter_span(name, **attributes):
+    """
+    Starts a child of the current span and makes it current.
+
+    Returns:
+        tuple: A handle for exit_span, or None when the request is not traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    span = Span(name, attributes)
+    parent.children.append(span)
+    _current_span.set(span)
+    return span, parent
+
+def exit_span(handle):
+    if handle is None:
+        return
+    span, parent = handle
+    span.finish()
+    _current_span.set(parent)
+
+def annotate(**attributes):
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+def make_trace_token(secret_key, profile=False):
+    """
+    Signs a token that, sent as X-Trace-Token, traces a request and returns its spans
+    in the X-Trace response header. Tokens expire after TRACE_TOKEN_MAX_AGE seconds.
+    """
+    return URLSafeTimedSerializer(secret_key, salt=TRACE_TOKEN_SALT).dumps({'profile': bool(profile)})
+
+def _verify_trace_token(token):
+    try:
+        return _settings['serializer'].loads(token, max_age=_settings['token_max_age'])
+    except BadSignature as e:
+        log.warning("Ignoring invalid trace token: %s", e)
+        return None
+
+def configure_tracing(secret_key, sample_rate=None, profile_sampled=None, profile_interval_ms=None, trace_dir=None, token_max_age=None):
+    """
+    Configures request tracing, reading unset options from TRACE_SAMPLE_RATE,
+    TRACE_PROFILE, TRACE_PROFILE_INTERVAL_MS, TRACE_DIR and TRACE_TOKEN_MAX_AGE.
+    """
+    _settings.update({
+        'sample_rate': sample_rate if sample_rate is not None else float(os.getenv('TRACE_SAMPLE_RATE', 0)),
+        'profile_sampled': profile_sampled if profile_sampled is not None else os.getenv('TRACE_PROFILE', 'false').lower() == 'true',
+        'profile_interval': (profile_interval_ms or float(os.getenv('TRACE_PROFILE_INTERVAL_MS', 5))) / 1000,
+        'trace_dir': trace_dir if trace_dir is not None else os.getenv('TRACE_DIR', ''),
+        'token_max_age': token_max_age or int(os.getenv('TRACE_TOKEN_MAX_AGE', 3600)),
+        'serializer': URLSafeTimedSerializer(secret_key, salt=TRACE_TOKEN_SALT),
+    })
+    if _settings['trace_dir']:
+        os.makedirs(_settings['trace_dir'], exist_ok=True)
+    log.info("Request tracing configured with sample rate %s, traces written to %s.", _settings['sample_rate'], _settings['trace_dir'] or 'the log')
+
+def _start_request_trace():
+    # Always clear first: a request that failed before after_request must not leak its trace
+    _current_span.set(None)
+    token = request.headers.get(TRACE_TOKEN_HEADER)
+    options = _verify_trace_token(token) if token else None
+    if options is not None:
+        reason, profile = 'token', options.get('profile', False)
+    elif _settings['sample_rate'] and random.random() < _settings['sample_rate']:
+        reason, profile = 'sampled', _settings['profile_sampled']
+    else:
+        return
+    if profile and not profiling_available():
+        log.warning("Sampling profiles are not available under gevent; tracing %s %s without one.", request.method, request.path)
+        profile = False
+    trace = g.trace = Trace(g.get('request_id'), request.method, request.path, reason, profile)
+    _current_span.set(trace.root)
+
+def _write_trace(trace):
+    finished = trace.finish()
+    _current_span.set(None)
+    if not _settings['trace_dir']:
+        log.info("Trace for %s %s: %s", trace.method, trace.path, finished['stage_totals_ms'])
+        return
+    path = os.path.join(_settings['trace_dir'], f"{time.strftime('%Y%m%dT%H%M%S')}-{trace.request_id}.json")
+    try:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(finished, file, indent=2)
+        log.info("Trace for %s %s written to %s.", trace.method, trace.path, path)
+    except OSError as e:
+        log.error("Failed to write trace to %s: %s", path, e)
+
+def _finish_request_trace(response):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return response
+    trace.status = response.status_code
+    if trace.reason == 'token':
+        # Streamed bodies are produced later, so their header only covers the spans so far
+        response.headers[TRACE_RESPONSE_HEADER] = trace.header_value()
+    # Written once the body has been sent so streamed generation is included
+    response.call_on_close(partial(_write_trace, trace))
+    return response
+
+def _start_render_span(sender, template, context, **extra):
+    if is_tracing():
+        g.trace_render_span = enter_span('template_rendering', template=template.name)
+
+def _end_render_span(sender, template, context, **extra):
+    exit_span(g.pop('trace_render_span', None))
+
+def init_tracing(app):
+    """
+    Registers the request hooks that start, return and write traces. Call after
+    the request ID hook so traces carry the request's ID.
+
+    A request is traced when it carries a valid X-Trace-Token (see make_trace_token)
+    or is picked by TRACE_SAMPLE_RATE. The stages timed by helpers.metrics become
+    spans of its tree; untraced requests pay one context variable lookup per stage.
+    """
+    configure_tracing(app.config['SECRET_KEY'])
+    app.before_request(_start_request_trace)
+    app.after_request(_finish_request_trace)
+    before_render_template.connect(_start_render_span, app)
+    template_rendered.connect(_end_render_span, app)
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    parser = argparse.ArgumentParser(description=f"Prints a signed {TRACE_TOKEN_HEADER} value for tracing one request.")
+    parser.add_argument('--profile', action='store_true', help="Also record a sampling profile of the request.")
+    args = parser.parse_args(argv)
+    load_dotenv()
+    print(make_trace_token(os.getenv('SECRET_KEY', 'your-secret-key'), profile=args.profile))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
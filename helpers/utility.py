@@ -1,6 +1,26 @@
 from dotenv import load_dotenv
+import atexit
+import copy
+import json
 import os
 import logging
+import queue
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from helpers.requestors._http_client import configure_http_client, get_http_client
+from helpers.requestors._rate_limiter import configure_rate_limiter, get_rate_limiter
+from helpers.requestors.openai_api_requestor import configure_openai_base_url
+from helpers.generators._response_cache import configure_response_cache, get_response_cache
+from helpers.generators._generation_scheduler import configure_inflight_limit
+from helpers.validators.api_key_validator_storer import configure_api_key_cache, get_api_key_cache
+from helpers.log_ingestor import ClientLogIngestor
+from helpers.metrics import configure_metrics, init_metrics, get_registry
+from helpers.tracing import init_tracing
+from helpers.render_cache import configure_template_cache, get_fragment_cache_stats
+from helpers.static_assets import init_static_assets
+from helpers.processors._mapping_file_loader import get_cache_stats
+from helpers.processors._lexicon import configure_lexicons, get_lexicon_stats
 
 class ColoredFormatter(logging.Formatter):
     COLORS = {
@@ -12,13 +32,45 @@ class ColoredFormatter(logging.Formatter):
     }
     RESET = '\033[0m'
 
+    def formatMessage(self, record):
+        if record.levelname == 'ERROR' and not record.message.startswith("Error:"):
+            # Work on a copy so other handlers see the record unchanged
+            record = logging.makeLogRecord({**record.__dict__, 'message': f"Error: {record.message}"})
+        return super().formatMessage(record)
+
     def format(self, record):
-        if record.levelname == 'ERROR' and not record.msg.startswith("Error:"):
-            record.msg = f"Error: {record.msg}"
         log_color = self.COLORS.get(record.levelname, self.RESET)
         log_msg = super().format(record)
         return f"{log_color}{log_msg}{self.RESET}"
 
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as single-line JSON with the per-request fields, truncating long
+    messages so a stray payload dump cannot flood production logs.
+    """
+
+    def __init__(self, max_message_length=1000):
+        super().__init__()
+        self.max_message_length = max_message_length
+
+    def format(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_message_length:
+            message = f"{message[:self.max_message_length]}... [{len(message) - self.max_message_length} chars truncated]"
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'message': message,
+            'request_id': getattr(record, 'request_id', '-'),
+            'method': getattr(record, 'method', '-'),
+            'path': getattr(record, 'path', '-'),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
 def utility_processor():
     log.debug("Registering utility processor for Jinja templates.")
     return dict(enumerate=enumerate)
@@ -30,23 +82,81 @@ class ExcludeMessageFilter(logging.Filter):
     def filter(self, record):
         return not any(exclude_message in record.getMessage() for exclude_message in self.exclude_messages)
 
-def init_logging(level=logging.INFO):
+class RequestContextFilter(logging.Filter):
+    # Runs on the calling thread, before the record is queued, while the Flask request is still available
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id', '-')
+            record.method = request.method
+            record.path = request.path
+        else:
+            record.request_id = record.method = record.path = '-'
+        return True
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records for the background listener without formatting them, so the
+    message is only built if a handler actually emits it.
+    """
+
+    def prepare(self, record):
+        # Snapshot mutable arguments, since they are formatted after the caller moves on
+        if isinstance(record.args, dict):
+            record.args = dict(record.args)
+        elif record.args:
+            record.args = tuple(copy.copy(arg) if isinstance(arg, (dict, list, set)) else arg for arg in record.args)
+        return record
+
+_log_listener = None
+
+def assign_request_id():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+
+def init_logging(level=logging.INFO, profile="development", max_message_length=1000):
+    global _log_listener
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
 
-    exclude_filter = ExcludeMessageFilter("POST /log HTTP/1.1")
+    exclude_filter = ExcludeMessageFilter("POST /log HTTP/1.1", "GET /metrics HTTP/1.1")
     
     if not root_logger.handlers:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.NOTSET)
         console_handler.addFilter(exclude_filter)
-        formatter = ColoredFormatter(
-            "%(asctime)s - %(levelname)s - %(filename)s - %(message)s"
-        )
+        if profile == "production":
+            formatter = JSONFormatter(max_message_length=max_message_length)
+        else:
+            formatter = ColoredFormatter(
+                "%(asctime)s - %(levelname)s - %(filename)s - [%(request_id)s] %(message)s"
+            )
         console_handler.setFormatter(formatter)
-        root_logger.addHandler(console_handler)
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(RequestContextFilter())
+        root_logger.addHandler(queue_handler)
+        _log_listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
     
-    root_logger.info("Logging is successfully initialized with color and error prefix support.")
+    root_logger.info("Logging is successfully initialized with the %s profile on a background listener.", profile)
+
+def _stats_of(get_component):
+    # Components can be disabled or replaced at runtime, so look them up on every scrape
+    def get_stats():
+        component = get_component()
+        return component.get_stats() if component is not None else {}
+    return get_stats
+
+def register_metric_collectors(app):
+    registry = get_registry()
+    registry.register_collector('response_cache', _stats_of(get_response_cache), gauges=('entries',))
+    registry.register_collector('api_key_cache', _stats_of(get_api_key_cache), gauges=('entries',))
+    registry.register_collector('mapping_file_cache', get_cache_stats, gauges=('entries',))
+    registry.register_collector('http_client', _stats_of(get_http_client), gauges=('idle_connections',))
+    registry.register_collector('rate_limiter', _stats_of(get_rate_limiter), gauges=('queue_depth', 'max_queue_depth', 'max_wait_seconds', 'tracked_keys'))
+    registry.register_collector('client_log', app.extensions['client_log_ingestor'].get_stats, gauges=('queue_depth',))
+    registry.register_collector('template_fragment_cache', get_fragment_cache_stats, gauges=('entries',))
+    registry.register_collector('lexicon', get_lexicon_stats, gauges=('mapped_lexicons', 'mapped_bytes'))
 
 def init_app(app):
     log.info("Starting application initialization...")
@@ -55,25 +165,69 @@ def init_app(app):
         load_dotenv()
         log.debug("Environment variables loaded successfully.")
     except Exception as e:
-        log.error(f"Failed to load environment variables: {e}")
+        log.error("Failed to load environment variables: %s", e)
     environment = os.getenv("ENVIRONMENT", "development")
-    log_level = logging.INFO if environment == "production" else logging.DEBUG
-    init_logging(level=log_level)
+    log_profile = os.getenv("LOG_PROFILE", "production" if environment == "production" else "development")
+    log_level = logging.INFO if log_profile == "production" else logging.DEBUG
+    init_logging(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "").upper(), log_level),
+        profile=log_profile,
+        max_message_length=int(os.getenv("LOG_MAX_MESSAGE_LENGTH", 1000)),
+    )
+    app.before_request(assign_request_id)
     log.info("Setting Flask configuration for environment and secret key...")
     app.config['ENVIRONMENT'] = environment
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
-    log.debug(f"Flask environment set to: {app.config['ENVIRONMENT']}")
+    log.debug("Flask environment set to: %s", app.config['ENVIRONMENT'])
     log.debug("Flask secret key configured.")
+    app.config['STREAMING_ENABLED'] = os.getenv('STREAMING_ENABLED', 'true').lower() == 'true'
+    log.debug("Streaming responses enabled: %s", app.config['STREAMING_ENABLED'])
+    app.config['GENERATION_BATCH_SIZE'] = int(os.getenv('GENERATION_BATCH_SIZE', 5))
+    app.config['GENERATION_MAX_CONCURRENCY'] = int(os.getenv('GENERATION_MAX_CONCURRENCY', 4))
+    app.config['SPECULATIVE_OUTPUTS'] = int(os.getenv('SPECULATIVE_OUTPUTS', 1))
+    configure_inflight_limit(int(os.getenv('GENERATION_MAX_INFLIGHT', 0)))
+    app.config['BATCH_MAX_JOBS'] = int(os.getenv('BATCH_MAX_JOBS', 50))
+    app.config['BATCH_MAX_CONCURRENCY'] = int(os.getenv('BATCH_MAX_CONCURRENCY', 4))
+    log.debug("Generation batch size: %s, max concurrency: %s, speculative outputs: %s", app.config['GENERATION_BATCH_SIZE'], app.config['GENERATION_MAX_CONCURRENCY'], app.config['SPECULATIVE_OUTPUTS'])
+    log.info("Configuring shared HTTP client...")
+    configure_http_client()
+    log.info("Configuring OpenAI base URL...")
+    configure_openai_base_url()
+    log.info("Configuring OpenAI rate limiter...")
+    configure_rate_limiter()
+    log.info("Configuring response cache...")
+    configure_response_cache()
+    log.info("Configuring dialect lexicons...")
+    configure_lexicons()
+    log.info("Configuring API key validation cache...")
+    configure_api_key_cache(salt=app.config['SECRET_KEY'])
+    log.info("Starting client log ingestor...")
+    app.extensions['client_log_ingestor'] = ClientLogIngestor(
+        max_queue_size=int(os.getenv('CLIENT_LOG_QUEUE_SIZE', 10000)),
+        max_batch_entries=int(os.getenv('CLIENT_LOG_MAX_BATCH', 100)),
+        max_message_length=int(os.getenv('CLIENT_LOG_MAX_MESSAGE_LENGTH', 2000)),
+        sample_rate=float(os.getenv('CLIENT_LOG_SAMPLE_RATE', 1.0 if environment != "production" else 0.1)),
+    )
+    log.info("Configuring metrics...")
+    configure_metrics()
+    init_metrics(app)
+    register_metric_collectors(app)
+    log.info("Configuring request tracing...")
+    init_tracing(app)
     log.info("Configuring Flask session settings...")
     app.config['SESSION_PERMANENT'] = True
     app.config['PERMANENT_SESSION_LIFETIME'] = 604800
     app.config['SESSION_TYPE'] = 'filesystem'
-    log.debug(f"Session permanent: {app.config['SESSION_PERMANENT']}")
-    log.debug(f"Session lifetime (seconds): {app.config['PERMANENT_SESSION_LIFETIME']}")
-    log.debug(f"Session type: {app.config['SESSION_TYPE']}")
+    log.debug("Session permanent: %s", app.config['SESSION_PERMANENT'])
+    log.debug("Session lifetime (seconds): %s", app.config['PERMANENT_SESSION_LIFETIME'])
+    log.debug("Session type: %s", app.config['SESSION_TYPE'])
     log.info("Adding utility processor to Flask's context processors...")
     app.context_processor(utility_processor)
     log.debug("Utility processor added successfully.")
+    log.info("Configuring template caches...")
+    configure_template_cache(app)
+    log.info("Configuring static assets and response compression...")
+    init_static_assets(app)
     log.info("Application initialization completed successfully.")
 
 log = logging.getLogger(__name__)
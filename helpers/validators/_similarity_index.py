@@ -0,0 +1,65 @@
+import bisect
+import logging
+from difflib import SequenceMatcher
+
+log = logging.getLogger(__name__)
+
+class SimilarityIndex:
+    """
+    Stores accepted texts and answers "is any stored text similar to this one?"
+    with the same result as comparing against every stored text with
+    SequenceMatcher(None, text, stored).ratio() > threshold.
+
+    Candidates are narrowed with exact upper bounds on the ratio, so no
+    similar pair is ever skipped:
+      1. a length window, since ratio <= 2 * min(len) / (len(a) + len(b)),
+      2. real_quick_ratio and quick_ratio, which only look at lengths and
+         character counts,
+    and only the survivors pay for the full ratio(). Each stored text keeps its
+    own SequenceMatcher so its lookup tables are built once, not per comparison.
+    """
+
+    def __init__(self, threshold=0.95):
+        self.threshold = threshold
+        self._texts = set()
+        self._lengths = []
+        self._matchers = []
+        self.stats = {'comparisons': 0, 'length_pruned': 0, 'quick_pruned': 0, 'full_ratios': 0}
+
+    def __contains__(self, text):
+        return text in self._texts
+
+    def __iter__(self):
+        return iter(self._texts)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, text):
+        if text in self._texts:
+            return
+        self._texts.add(text)
+        matcher = SequenceMatcher(None)
+        matcher.set_seq2(text)
+        position = bisect.bisect_right(self._lengths, len(text))
+        self._lengths.insert(position, len(text))
+        self._matchers.insert(position, matcher)
+
+    def _length_window(self, length):
+        lower = length * self.threshold / (2 - self.threshold)
+        upper = length * (2 - self.threshold) / self.threshold
+        return bisect.bisect_left(self._lengths, lower), bisect.bisect_right(self._lengths, upper)
+
+    def has_similar(self, text):
+        start, end = self._length_window(len(text))
+        self.stats['comparisons'] += len(self._matchers)
+        self.stats['length_pruned'] += len(self._matchers) - (end - start)
+        for matcher in self._matchers[start:end]:
+            matcher.set_seq1(text)
+            if matcher.real_quick_ratio() <= self.threshold or matcher.quick_ratio() <= self.threshold:
+                self.stats['quick_pruned'] += 1
+                continue
+            self.stats['full_ratios'] += 1
+            if matcher.ratio() > self.threshold:
+                return True
+        return False
@@ -1,9 +1,51 @@
+import hashlib
+import hmac
 import logging
+import os
+import threading
+from concurrent.futures import Future
+from urllib import error
 from flask import session
-from helpers.requestors.openai_api_requestor import make_api_request
+from helpers.requestors.openai_api_requestor import make_api_request, openai_url
+from helpers.generators._response_cache import ResponseCache
+from helpers.metrics import timed_stage
 
 log = logging.getLogger(__name__)
 
+# HTTP statuses that mean the key itself is bad, so the failure is worth remembering.
+DEFINITIVE_FAILURE_CODES = {401, 403, 404}
+
+_validation_cache = None
+_cache_salt = b''
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def configure_api_key_cache(salt, ttl=None, negative_ttl=None, db_path=None):
+    """
+    Configures the process-wide API key validation cache.
+
+    Keys are never stored: entries are addressed by an HMAC of the key using the
+    given salt. Unset options are read from API_KEY_CACHE_TTL,
+    API_KEY_CACHE_NEGATIVE_TTL and API_KEY_CACHE_PATH; a SQLite path lets every
+    worker on the host share results.
+    """
+    global _validation_cache, _cache_salt
+    _cache_salt = salt.encode('utf-8') if isinstance(salt, str) else salt
+    _validation_cache = ResponseCache(
+        max_entries=1024,
+        ttl=ttl or float(os.getenv('API_KEY_CACHE_TTL', 3600)),
+        db_path=db_path if db_path is not None else os.getenv('API_KEY_CACHE_PATH', ''),
+    )
+    _validation_cache.negative_ttl = negative_ttl or float(os.getenv('API_KEY_CACHE_NEGATIVE_TTL', 300))
+    log.info("API key validation cache configured with %ss TTL and %ss negative TTL.", _validation_cache.ttl, _validation_cache.negative_ttl)
+    return _validation_cache
+
+def get_api_key_cache():
+    return _validation_cache
+
+def hash_api_key(api_key):
+    return hmac.new(_cache_salt, api_key.encode('utf-8'), hashlib.sha256).hexdigest()
+
 def validate_store_api_key(api_key):
     log.info("Validating API key...")
 
@@ -11,30 +53,99 @@ def validate_store_api_key(api_key):
         log.info("API key already validated and stored in the session. No revalidation required.")
         return None
 
+    error_message = validate_api_key(api_key)
+    if error_message is None:
+        session['api_key'] = api_key
+        session['api_key_validated'] = True
+        log.info("API key stored in session and marked as validated.")
+    return error_message
+
+@timed_stage('key_validation')
+def validate_api_key(api_key):
+    """
+    Checks the key's format and then its validity with OpenAI (through the cache),
+    without touching the session.
+
+    Returns:
+        str: The validation error message, or None if the key is valid.
+    """
     from helpers.validators.form_validator import validate_api_key_format
     error_message = validate_api_key_format(api_key)
     if error_message:
-        log.error(f"API key format validation failed: {error_message}")
+        log.error("API key format validation failed: %s", error_message)
         return error_message
 
+    error_message = get_cached_validation(api_key)
+    if error_message is not None:
+        log.error("API key validation failed: %s", error_message)
+    return error_message
+
+def get_cached_validation(api_key):
+    """
+    Returns None if the key is valid, or the validation error message, consulting
+    the shared cache first and validating upstream at most once per key at a time.
+    """
+    if _validation_cache is None:
+        return validate_upstream(api_key)[0]
+
+    key_hash = f"api_key:{hash_api_key(api_key)}"
+    cached = _validation_cache.get(key_hash)
+    if cached is not None:
+        log.info("API key validation result served from cache.")
+        return cached['error']
+
+    # Concurrent requests for the same key wait on the first one's upstream check
+    with _inflight_lock:
+        future = _inflight.get(key_hash)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[key_hash] = Future()
+    if not is_owner:
+        log.info("Waiting for an in-flight validation of the same API key.")
+        return future.result()
+
+    try:
+        error_message, definitive = validate_upstream(api_key)
+        if error_message is None:
+            _validation_cache.set(key_hash, {'error': None})
+        elif definitive:
+            _validation_cache.set(key_hash, {'error': error_message}, ttl=_validation_cache.negative_ttl)
+        future.set_result(error_message)
+        return error_message
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key_hash, None)
+
+def validate_upstream(api_key):
+    """
+    Validates the key and GPT-4 access with OpenAI.
+
+    Returns:
+        tuple: (error_message or None, whether a failure is definitive and safe to cache).
+    """
     try:
         validate_openai(api_key)
-        check_model_access(api_key)
-        session['api_key'] = api_key
-        session['api_key_validated'] = True
-        log.info("API key stored in session and marked as validated.")
-        return None
+        return None, False
+    except error.HTTPError as e:
+        return str(e), e.code in DEFINITIVE_FAILURE_CODES
     except Exception as e:
-        error_message = f"{str(e)}"
-        log.error(f"API key validation failed: {error_message}")
-        return error_message
+        return str(e), False
 
 def validate_openai(api_key):
     log.info("Validating API key with OpenAI...")
-    make_api_request("https://api.openai.com/v1/models", api_key)
+    models = make_api_request(openai_url("models"), api_key)
     log.info("API key validated successfully.")
+    # The model list answers the access check too; only ask directly if GPT-4 is not listed
+    model_ids = {model.get('id') for model in models.get('data', [])}
+    if 'gpt-4' in model_ids:
+        log.info("GPT-4 model access verified from the model list.")
+    else:
+        check_model_access(api_key)
 
 def check_model_access(api_key):
     log.info("Checking access to GPT-4 model...")
-    make_api_request("https://api.openai.com/v1/models/gpt-4", api_key)
+    make_api_request(openai_url("models/gpt-4"), api_key)
     log.info("GPT-4 model access verified successfully.")
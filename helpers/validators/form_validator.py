@@ -1,9 +1,18 @@
 import logging
 import re
 from helpers.validators.api_key_validator_storer import validate_store_api_key
+from helpers.metrics import timed_stage
 
 log = logging.getLogger(__name__)
 
+STYLE_CHOICES = {
+    'dialect': ('american', 'british', 'australian'),
+    'formality': ('neutral', 'formal', 'casual'),
+    'tone': ('neutral', 'positive', 'negative'),
+    'channel': ('chat', 'email'),
+    'greetings': ('include', 'exclude'),
+}
+
 def is_input_gibberish(input_text):
     GIBBERISH_THRESHOLD = 0.5
     REPEATED_CHARS_THRESHOLD = 0.4
@@ -30,64 +39,65 @@ def is_name_gibberish(name):
     return False
 
 def validate_name(name):
-    log.info(f"Starting name validation: '{name}'...")
+    log.info("Starting name validation: '%s'...", name)
     cleaned_name = name.strip()
     if not cleaned_name:
         log.info("Responder name is empty, skipping validation.")
         return cleaned_name, None
     if not re.match(r"^[A-Za-z\s\-]+$", cleaned_name):
-        log.error(f"Invalid name format: '{name}'")
+        log.error("Invalid name format: '%s'", name)
         return None, "Invalid name format. Please provide a valid name with only letters, spaces, or hyphens."
     if len(cleaned_name) < 2:
-        log.error(f"Name is too short: '{name}'")
+        log.error("Name is too short: '%s'", name)
         return None, "Name is too short. Please provide a valid name."
     if is_name_gibberish(cleaned_name):
-        log.error(f"Name appears to be gibberish: '{name}'")
+        log.error("Name appears to be gibberish: '%s'", name)
         return None, "Name appears to contain nonsensical characters. Please provide a more meaningful name."
-    log.info(f"Name format is valid: '{name}'")
+    log.info("Name format is valid: '%s'", name)
     return cleaned_name, None
 
 def validate_num_outputs(num_outputs):
-    log.info(f"Starting num_outputs validation: '{num_outputs}'...")
+    log.info("Starting num_outputs validation: '%s'...", num_outputs)
     try:
         num_outputs = int(num_outputs)
         if num_outputs > 10:
-            log.warning(f"Number of outputs {num_outputs} exceeds the maximum allowed (10). Defaulting to 10.")
+            log.warning("Number of outputs %s exceeds the maximum allowed (10). Defaulting to 10.", num_outputs)
             return 10, "Number of responses exceeds the maximum allowed (10). Defaulting to 10."
         if num_outputs < 1:
-            log.error(f"Invalid num_outputs value: {num_outputs}, defaulting to 1.")
+            log.error("Invalid num_outputs value: %s, defaulting to 1.", num_outputs)
             return 1, "Invalid number of responses. Please provide a valid number (greater than 0). Defaulting to 1."
-        log.info(f"Number of outputs set to: {num_outputs}")
+        log.info("Number of outputs set to: %s", num_outputs)
         return num_outputs, None
     except ValueError:
-        log.error(f"Invalid num_outputs '{num_outputs}', defaulting to 1.")
+        log.error("Invalid num_outputs '%s', defaulting to 1.", num_outputs)
         return 1, "Invalid number of responses. Please provide a valid number (greater than 0). Defaulting to 1."
 
 def validate_sentence_limit(sentence_limit):
-    log.info(f"Starting sentence_limit validation: '{sentence_limit}'...")
+    log.info("Starting sentence_limit validation: '%s'...", sentence_limit)
     if not sentence_limit or sentence_limit.lower() == 'unlimited':
         log.info("Sentence limit is set to unlimited or not provided.")
         return '∞', None
     try:
         sentence_limit = int(sentence_limit)
         if sentence_limit < 1:
-            log.error(f"Invalid sentence_limit: {sentence_limit}. Defaulting to no limit.")
+            log.error("Invalid sentence_limit: %s. Defaulting to no limit.", sentence_limit)
             return 'None', "Sentence limit must be a positive integer. Defaulting to no limit (None)."
-        log.info(f"Sentence limit set to: {sentence_limit}")
+        log.info("Sentence limit set to: %s", sentence_limit)
         return sentence_limit, None
     except ValueError:
-        log.error(f"Invalid sentence_limit '{sentence_limit}'. Defaulting to no limit.")
+        log.error("Invalid sentence_limit '%s'. Defaulting to no limit.", sentence_limit)
         return '∞', None
 
 def validate_input_text(input_text):
-    log.info(f"Starting input_text validation: '{input_text}'...")
+    log.info("Starting input_text validation...")
+    log.debug("Input text: '%s'", input_text)
     if not input_text or not input_text.strip():
         log.error("Input text is empty or blank after stripping.")
         return None, "Input cannot be blank. Please try again."
     cleaned_input = input_text.strip()
     word_count = len(cleaned_input.split())
     if word_count < 2:
-        log.error(f"Input text contains less than 2 words: '{cleaned_input}'")
+        log.error("Input text contains less than 2 words: '%s'", cleaned_input)
         return None, "Input must contain at least two words. Please provide more detailed text."
     if is_input_gibberish(cleaned_input):
         log.error("Input text appears to be gibberish.")
@@ -96,45 +106,75 @@ def validate_input_text(input_text):
     return cleaned_input, None
 
 def validate_api_key_format(api_key):
-    log.info(f"Starting API key format validation: '{api_key}'...")
+    log.info("Starting API key format validation...")
     if not api_key:
         log.error("No API key provided.")
         return "An OpenAI API key is required to use this tool. Please provide your key and try again."
     if not re.match(r'^sk-[\w-]+$', api_key):
-        log.error(f"Invalid API key format: '{api_key}'")
+        log.error("Invalid API key format.")
         return "Invalid API key format. The key should start with 'sk-' followed by alphanumeric characters and hyphens."
     log.info("API key format is valid.")
     return None
 
 def validate_creativity(creativity):
-    log.info(f"Starting creativity validation: '{creativity}'...")
+    log.info("Starting creativity validation: '%s'...", creativity)
     creativity_mapping = {'low': 0.5, 'med': 0.7, 'high': 0.9}
     creativity_value = creativity_mapping.get(creativity, 0.7)
-    log.info(f"Creativity value set to: {creativity_value}")
+    log.info("Creativity value set to: %s", creativity_value)
     return creativity_value, None
 
 def validate_uniqueness_attempts(uniqueness_attempts):
-    log.info(f"Starting uniqueness_attempts validation: '{uniqueness_attempts}'...")
+    log.info("Starting uniqueness_attempts validation: '%s'...", uniqueness_attempts)
     try:
         uniqueness_attempts = int(uniqueness_attempts)
     except ValueError:
-        log.error(f"Invalid uniqueness_attempts '{uniqueness_attempts}', defaulting to 5.")
+        log.error("Invalid uniqueness_attempts '%s', defaulting to 5.", uniqueness_attempts)
         return 5, "Invalid uniqueness attempts. Please provide a valid number between 1 and 10. Defaulting to 5."
     if uniqueness_attempts > 10:
-        log.warning(f"Number of uniqueness attempts {uniqueness_attempts} exceeds the maximum allowed (10). Defaulting to 10.")
+        log.warning("Number of uniqueness attempts %s exceeds the maximum allowed (10). Defaulting to 10.", uniqueness_attempts)
         return 10, "Number of uniqueness attempts exceeds the maximum allowed (10). Defaulting to 10."
     if uniqueness_attempts < 1:
-        log.warning(f"Number of uniqueness attempts {uniqueness_attempts} is less than the minimum allowed (1). Defaulting to 1.")
+        log.warning("Number of uniqueness attempts %s is less than the minimum allowed (1). Defaulting to 1.", uniqueness_attempts)
         return 1, "Number of uniqueness attempts is less than the minimum allowed (1). Defaulting to 1."
-    log.info(f"Uniqueness attempts set to: {uniqueness_attempts}")
+    log.info("Uniqueness attempts set to: %s", uniqueness_attempts)
     return uniqueness_attempts, None
 
+@timed_stage('form_validation')
 def validate_form_params(parameters):
     log.info("Starting form parameter validation...")
     api_key_message = validate_store_api_key(parameters['api_key'])
     if api_key_message:
-        log.error(f"API key validation error: {api_key_message}")
+        log.error("API key validation error: %s", api_key_message)
         return parameters, {'api_key': api_key_message}
+    return validate_rewrite_params(parameters)
+
+def validate_choice(name, value, choices):
+    if value in choices:
+        return value, None
+    log.error("Invalid %s '%s'.", name, value)
+    return None, f"Invalid {name.replace('_', ' ')}. Choose one of: {', '.join(choices)}."
+
+def validate_style_choices(parameters):
+    """
+    Checks the select-box parameters, which the form constrains but API callers do not.
+
+    Returns:
+        dict: Error messages keyed by parameter, for invalid values only.
+    """
+    error_messages = {}
+    for name, choices in STYLE_CHOICES.items():
+        parameters[name], message = validate_choice(name, parameters[name], choices)
+        if message:
+            error_messages[name] = message
+    return error_messages
+
+def validate_rewrite_params(parameters):
+    """
+    Validates everything but the API key, which callers check once per session or batch.
+
+    Returns:
+        tuple: (parameters with cleaned values, error messages keyed by parameter).
+    """
     parameters['responder_name'], name_message = validate_name(parameters['responder_name'])
     parameters['creativity'], creativity_message = validate_creativity(parameters['creativity'])
     parameters['num_outputs'], num_outputs_message = validate_num_outputs(parameters['num_outputs'])
@@ -146,7 +186,6 @@ def validate_form_params(parameters):
         'sentence_limit': sentence_limit_message,
         'input_text': input_text_message,
         'responder_name': name_message,
-        'api_key': api_key_message,
         'creativity': creativity_message,
         'uniqueness_attempts': uniqueness_attempts_message
     }
@@ -2,64 +2,105 @@ import logging
 import re
 from difflib import SequenceMatcher
 from helpers.calculators.token_cost_estimator import increment_tokens
+from helpers.validators._similarity_index import SimilarityIndex
+from helpers.metrics import timed_stage
 
 log = logging.getLogger(__name__)
 
+SLOT_PENDING = 'pending'
+SLOT_ACCEPTED = 'accepted'
+SLOT_DUPLICATE = 'duplicate'
+SLOT_OVER_LIMIT = 'over-limit'
+SLOT_EMPTY = 'empty'
+
 def standardize_text(text):
     return re.sub(r'[.,!?;]*$', '', text.strip().lower())
 
 def are_texts_similar(text1, text2, threshold=0.95):
     return SequenceMatcher(None, text1, text2).ratio() > threshold
 
+def create_uniqueness_index(threshold=0.95):
+    return SimilarityIndex(threshold)
+
+def count_sentences(text):
+    sentences = re.split(r'[.!?](?:\s|$)', text)
+    return len([sentence for sentence in sentences if sentence.strip()])
+
+def classify_output(output_text, unique_outputs, sentence_limit='∞'):
+    """
+    Decides whether a candidate can fill an output slot.
+
+    Returns:
+        str: SLOT_ACCEPTED, or the reason it was rejected: SLOT_EMPTY,
+             SLOT_OVER_LIMIT or SLOT_DUPLICATE.
+    """
+    if not output_text.strip():
+        return SLOT_EMPTY
+    if sentence_limit != '∞' and count_sentences(output_text) > sentence_limit:
+        return SLOT_OVER_LIMIT
+    if standardize_text(output_text) in unique_outputs or unique_outputs.has_similar(output_text):
+        return SLOT_DUPLICATE
+    return SLOT_ACCEPTED
+
 def update_output(output_texts, index, new_text, unique_outputs):
     output_texts[index] = new_text
     unique_outputs.add(standardize_text(new_text))
-    log.debug(f"Updated output_texts[{index}]: {new_text}")
+    log.debug("Updated output_texts[%s]: %s", index, new_text)
 
-def check_and_update_uniqueness(new_outputs, tokens_per_output, non_unique_indices, output_texts, tokens_tracker, unique_outputs, parameters):
+@timed_stage('uniqueness')
+def check_and_update_uniqueness(new_outputs, tokens_per_output, non_unique_indices, output_texts, tokens_tracker, unique_outputs, parameters, slot_statuses=None):
     still_non_unique_indices = []
     for idx, non_unique_idx in enumerate(non_unique_indices):
         output_text = new_outputs[idx]
-        standardized_text = standardize_text(output_text)
         increment_tokens(tokens_tracker, non_unique_idx, tokens_per_output[idx])
-        if standardized_text not in unique_outputs:
-            if all(not are_texts_similar(output_text, existing_text) for existing_text in unique_outputs):
-                update_output(output_texts, non_unique_idx, output_text, unique_outputs)
-            else:
-                still_non_unique_indices.append(non_unique_idx)
+        status = classify_output(output_text, unique_outputs, parameters.get('sentence_limit', '∞'))
+        if slot_statuses is not None:
+            slot_statuses[non_unique_idx] = status
+        if status == SLOT_ACCEPTED:
+            update_output(output_texts, non_unique_idx, output_text, unique_outputs)
         else:
             still_non_unique_indices.append(non_unique_idx)
     return still_non_unique_indices
 
-def validate_sentence_limit(output_texts, sentence_limit):
-    log.info(f"Starting validation of sentence limit: {sentence_limit}...")
-    if sentence_limit == '∞':
-        log.info("No sentence limit provided or limit set to '∞', skipping validation.")
-        return None
-
-    def process_output_text(text, limit):
-        sentences = re.split(r'[.!?](?:\s|$)', text)
-        sentences = [sentence for sentence in sentences if sentence.strip()]
-        log.debug(f"Processed text into {len(sentences)} sentences: {sentences}")
-        return len(sentences) <= limit
+@timed_stage('uniqueness')
+def fill_unique_slots(candidates, tokens_per_candidate, pending_indices, output_texts, tokens_tracker, unique_outputs, slot_statuses=None, sentence_limit='∞'):
+    """
+    Fills pending output slots, in order, with the first candidates that are
+    non-empty, within the sentence limit and unique.
 
-    for index, text in enumerate(output_texts, start=1):
-        if not process_output_text(text, sentence_limit):
-            error_message = f"Output {index} exceeds the sentence limit of {sentence_limit}."
-            log.error(error_message)
-            return error_message
+    When slot_statuses is given, each pending slot records SLOT_ACCEPTED or the
+    reason a candidate tried for it was rejected, so only failing slots are retried.
+    Slots that no candidate reached take the last rejection reason (SLOT_DUPLICATE
+    when there were no candidates).
 
-    log.info(f"All generated texts adhere to the sentence limit of {sentence_limit}.")
-    return None
+    There may be more candidates than slots. An accepted candidate's tokens are
+    charged to the slot it fills, and rejected candidates are charged round-robin
+    across the slots still waiting; candidates left over once every slot is filled
+    are charged round-robin across the pending slots, so totals stay exact.
 
-def validate_output_texts(output_texts, parameters):
-    log.info("Starting validation of output texts...")
-    log.info(f"{len(output_texts)} outputs successfully validated for the expected {parameters['num_outputs']} outputs.")
-    if parameters['sentence_limit'] != '∞':
-        log.info(f"Validating sentence limit of {parameters['sentence_limit']}...")
-        error_message = validate_sentence_limit(output_texts, parameters['sentence_limit'])
-        if error_message:
-            log.error(f"Validation failed during sentence limit check: {error_message}")
-            return None, None, error_message
-    log.info("All output texts successfully passed validation.")
-    return None
+    Returns:
+        list: The slots that are still waiting for a unique output.
+    """
+    remaining_indices = list(pending_indices)
+    rejections = 0
+    last_rejection = SLOT_DUPLICATE
+    for idx, candidate in enumerate(candidates):
+        if not remaining_indices:
+            increment_tokens(tokens_tracker, pending_indices[idx % len(pending_indices)], tokens_per_candidate[idx])
+            continue
+        status = classify_output(candidate, unique_outputs, sentence_limit)
+        if status == SLOT_ACCEPTED:
+            slot = remaining_indices.pop(0)
+            update_output(output_texts, slot, candidate, unique_outputs)
+        else:
+            slot = remaining_indices[rejections % len(remaining_indices)]
+            rejections += 1
+            last_rejection = status
+        increment_tokens(tokens_tracker, slot, tokens_per_candidate[idx])
+        if slot_statuses is not None:
+            slot_statuses[slot] = status
+    if slot_statuses is not None:
+        for slot in remaining_indices:
+            if slot_statuses[slot] == SLOT_PENDING:
+                slot_statuses[slot] = last_rejection
+    return remaining_indices
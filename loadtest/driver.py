@@ -0,0 +1,225 @@
+"""
+Drives load against a running app, or against gunicorn instances it starts itself,
+and reports throughput and latency percentiles per route and concurrency level.
+
+Usage:
+    # Against an app that is already running (point it at the stub with OPENAI_BASE_URL)
+    python -m loadtest.driver --url http://127.0.0.1:5000 --concurrency 1,8,32
+
+    # Start the OpenAI stub and gunicorn with 1, 2 and 4 workers for each run
+    python -m loadtest.driver --spawn --workers 1,2,4 --concurrency 8,32 --duration 20
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from loadtest.openai_stub import StubConfig, create_server
+
+ROUTES = ['/', '/submit', '/log']
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INDEX_QUERY = urlencode({
+    'responder_name': 'Sam', 'dialect': 'british', 'formality': 'neutral', 'tone': 'positive', 'channel': 'email',
+    'greetings': 'include', 'creativity': 'med', 'sentence_limit': '3', 'num_outputs': '3', 'uniqueness_attempts': '3',
+})
+SUBMIT_FORM = {
+    'api_key': 'sk-loadtest', 'responder_name': 'Sam', 'dialect': 'british', 'formality': 'neutral', 'tone': 'positive',
+    'channel': 'email', 'greetings': 'include', 'creativity': 'med', 'sentence_limit': '3', 'num_outputs': '3',
+    'uniqueness_attempts': '3', 'input_text': 'Hi Sam, thanks for organizing the meeting about the new apartment color scheme.',
+}
+LOG_BATCH = {
+    'client_id': 'loadtest',
+    'entries': [{'level': 'debug', 'message': f"loadtest.js - entry {index}"} for index in range(20)],
+}
+
+def build_request(route, bypass_cache):
+    """
+    Returns (method, path, body, headers) for one request to route.
+    """
+    if route == '/':
+        return 'GET', f"/?{INDEX_QUERY}", None, {}
+    if route == '/submit':
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if bypass_cache:
+            headers['Cache-Control'] = 'no-cache'
+        return 'POST', '/submit', urlencode(SUBMIT_FORM).encode('utf-8'), headers
+    if route == '/log':
+        return 'POST', '/log', json.dumps(LOG_BATCH).encode('utf-8'), {'Content-Type': 'application/json'}
+    raise ValueError(f"Unknown route: {route}")
+
+def _worker(base_url, route, bypass_cache, deadline, latencies, errors, lock):
+    parts = urlsplit(base_url)
+    connection = None
+    method, path, body, headers = build_request(route, bypass_cache)
+    own_latencies, own_errors = [], 0
+    while time.monotonic() < deadline:
+        if connection is None:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                own_errors += 1
+            if response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException):
+            own_errors += 1
+            connection.close()
+            connection = None
+            continue
+        own_latencies.append(time.perf_counter() - start)
+    if connection is not None:
+        connection.close()
+    with lock:
+        latencies.extend(own_latencies)
+        errors[0] += own_errors
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def run_load(base_url, route, concurrency, duration, bypass_cache=True):
+    """
+    Runs concurrency closed-loop clients against one route for duration seconds.
+
+    Returns:
+        dict: Request and error counts, throughput and latency percentiles in milliseconds.
+    """
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=_worker, args=(base_url, route, bypass_cache, deadline, latencies, errors, lock), daemon=True)
+        for _ in range(concurrency)
+    ]
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started_at
+    latencies.sort()
+    return {
+        'route': route,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p95_ms': _percentile(latencies, 0.95) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else float('nan'),
+    }
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing is listening on port {port} after {timeout}s.")
+
+def start_gunicorn(workers, stub_url, worker_class=None):
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'GUNICORN_WORKERS': str(workers),
+        'OPENAI_BASE_URL': stub_url,
+        'ENVIRONMENT': env.get('ENVIRONMENT', 'production'),
+    })
+    if worker_class:
+        env['GUNICORN_WORKER_CLASS'] = worker_class
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app'], cwd=REPO_ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for_port(port)
+    except TimeoutError:
+        process.terminate()
+        raise
+    return process, f"http://127.0.0.1:{port}"
+
+def print_report(results):
+    print(f"\n{'workers':>7} {'route':<8} {'conc':>5} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        print(
+            f"{result.get('workers', '-'):>7} {result['route']:<8} {result['concurrency']:>5} {result['requests']:>9} "
+            f"{result['errors']:>7} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f}"
+        )
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load driver for /, /submit and /log.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Base URL of a running app (ignored with --spawn).")
+    parser.add_argument('--routes', default=','.join(ROUTES), help="Comma-separated routes to load.")
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 8, 32], help="Comma-separated client counts.")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per route and concurrency level.")
+    parser.add_argument('--allow-cache', action='store_true', help="Let /submit be served from the response cache.")
+    parser.add_argument('--spawn', action='store_true', help="Start the OpenAI stub and gunicorn for each worker count.")
+    parser.add_argument('--workers', type=_int_list, default=[2], help="Comma-separated gunicorn worker counts for --spawn.")
+    parser.add_argument('--worker-class', help="Overrides GUNICORN_WORKER_CLASS for --spawn.")
+    parser.add_argument('--stub-latency-ms', type=float, default=500, help="Median stub latency for --spawn.")
+    parser.add_argument('--stub-rate-limit-rate', type=float, default=0.0, help="Fraction of stub calls answered with 429.")
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help="Fraction of stub calls answered with 500.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args(argv)
+    routes = [route for route in args.routes.split(',') if route]
+
+    results = []
+    if not args.spawn:
+        for route in routes:
+            for concurrency in args.concurrency:
+                results.append(run_load(args.url, route, concurrency, args.duration, not args.allow_cache))
+                print_report(results[-1:])
+    else:
+        stub = create_server(port=0, config=StubConfig(
+            latency_ms=args.stub_latency_ms, rate_limit_rate=args.stub_rate_limit_rate, error_rate=args.stub_error_rate,
+        ))
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        stub_url = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+        try:
+            for workers in args.workers:
+                process, base_url = start_gunicorn(workers, stub_url, args.worker_class)
+                try:
+                    for route in routes:
+                        for concurrency in args.concurrency:
+                            result = run_load(base_url, route, concurrency, args.duration, not args.allow_cache)
+                            result['workers'] = workers
+                            results.append(result)
+                            print_report([result])
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+        finally:
+            stub.shutdown()
+            print(f"\nStub stats: {stub.RequestHandlerClass.config.stats}")
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
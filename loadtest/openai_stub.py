@@ -0,0 +1,299 @@
+"""
+A local stand-in for the OpenAI endpoints the app calls, for load tests that must
+not spend money or hit real rate limits.
+
+Usage:
+    python -m loadtest.openai_stub --port 8090 --latency-ms 800 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 gunicorn app:app
+
+Serves GET /v1/models, GET /v1/models/<id> and POST /v1/chat/completions,
+including streamed completions. Keys starting with 'sk-invalid' are rejected.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+MODELS = ['gpt-4', 'gpt-4o-mini', 'gpt-3.5-turbo']
+
+_SENTENCE_LIMIT = re.compile(r'Limit the output to (\d+) sentences')
+_INPUT_TEXT = re.compile(r'Text: (.*)$', re.DOTALL)
+_WORDS = [
+    'thanks', 'for', 'the', 'update', 'we', 'will', 'review', 'your', 'notes', 'and', 'follow', 'up',
+    'soon', 'with', 'a', 'clear', 'plan', 'that', 'works', 'for', 'everyone', 'on', 'the', 'team',
+]
+
+class StubConfig:
+    """
+    Behaviour of the stand-in server.
+
+    Args:
+        latency_ms (float): Typical time to first byte.
+        latency_distribution (str): 'fixed', 'uniform' (0 to 2x) or 'lognormal'.
+        latency_sigma (float): Spread of the lognormal distribution.
+        token_delay_ms (float): Delay between streamed chunks.
+        error_rate (float): Fraction of completion requests answered with HTTP 500.
+        rate_limit_rate (float): Fraction of completion requests answered with HTTP 429.
+        retry_after (float): Retry-After seconds sent with injected 429s.
+        completions (str): 'random', 'deterministic' (same prompt gives same outputs)
+                           or 'duplicates' (choices repeat at duplicate_rate).
+        duplicate_rate (float): Chance a choice repeats the previous one in 'duplicates' mode.
+        seed (int): Seed for latency, error and completion randomness.
+    """
+
+    def __init__(self, latency_ms=500, latency_distribution='lognormal', latency_sigma=0.5, token_delay_ms=20,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, completions='random', duplicate_rate=0.5, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.completions = completions
+        self.duplicate_rate = duplicate_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'completions': 0, 'streams': 0, 'injected_errors': 0, 'injected_429s': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def latency(self):
+        base = self.latency_ms / 1000
+        with self.lock:
+            if self.latency_distribution == 'fixed':
+                return base
+            if self.latency_distribution == 'uniform':
+                return self.random.uniform(0, 2 * base)
+            # Lognormal with the requested median, so a few requests are much slower
+            return self.random.lognormvariate(math.log(max(base, 1e-6)), self.latency_sigma)
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def build_completion(prompt, index, max_tokens, config, previous=None):
+    """
+    Builds one completion text and its finish reason for a prompt.
+
+    Returns:
+        tuple: (text, finish_reason, completion_tokens)
+    """
+    if config.completions == 'duplicates' and previous is not None and config.roll() < config.duplicate_rate:
+        return previous
+    if config.completions == 'deterministic':
+        seed = int(hashlib.sha256(f"{prompt}|{index}".encode('utf-8')).hexdigest()[:12], 16)
+        rng = random.Random(seed)
+    else:
+        with config.lock:
+            rng = random.Random(config.random.random())
+
+    limit_match = _SENTENCE_LIMIT.search(prompt)
+    sentences = int(limit_match.group(1)) if limit_match else 3
+    # Occasionally overshoot the limit, as real models do
+    if rng.random() < 0.2:
+        sentences += 1
+    input_match = _INPUT_TEXT.search(prompt)
+    subject = ' '.join((input_match.group(1) if input_match else '').split()[:4]) or 'your message'
+
+    parts = [f"Thanks for your note about {subject}."]
+    while len(parts) < sentences:
+        words = rng.sample(_WORDS, rng.randint(6, 12))
+        parts.append(' '.join(words).capitalize() + rng.choice(['.', '.', '!']))
+    text = ' '.join(parts[:sentences])
+
+    finish_reason = 'stop'
+    words = text.split(' ')
+    if _estimate_tokens(text) > max_tokens:
+        words = words[:max(1, max_tokens * 3 // 4)]
+        text, finish_reason = ' '.join(words), 'length'
+    return text, finish_reason, _estimate_tokens(text)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, error_type, headers=None):
+        self._send_json(status, {'error': {'message': message, 'type': error_type}}, headers)
+
+    def _authorized(self):
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer sk-') or authorization.startswith('Bearer sk-invalid'):
+            self._send_error(401, "Incorrect API key provided.", 'invalid_request_error')
+            return False
+        return True
+
+    def _rate_limit_headers(self):
+        return {
+            'x-ratelimit-limit-requests': '10000',
+            'x-ratelimit-remaining-requests': '9999',
+            'x-ratelimit-limit-tokens': '1000000',
+            'x-ratelimit-remaining-tokens': '999000',
+        }
+
+    def do_GET(self):
+        self.config.count('requests')
+        if not self._authorized():
+            return
+        if self.path.rstrip('/') == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model'} for model in MODELS]})
+        elif self.path.startswith('/v1/models/'):
+            model = self.path.rsplit('/', 1)[-1]
+            if model in MODELS:
+                self._send_json(200, {'id': model, 'object': 'model'})
+            else:
+                self._send_error(404, f"The model '{model}' does not exist.", 'invalid_request_error')
+        else:
+            self._send_error(404, "Not found.", 'invalid_request_error')
+
+    def do_POST(self):
+        self.config.count('requests')
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if not self._authorized():
+            return
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_error(404, "Not found.", 'invalid_request_error')
+            return
+        try:
+            data = json.loads(body)
+        except ValueError:
+            self._send_error(400, "Invalid JSON body.", 'invalid_request_error')
+            return
+
+        time.sleep(self.config.latency())
+        roll = self.config.roll()
+        if roll < self.config.rate_limit_rate:
+            self.config.count('injected_429s')
+            headers = {'retry-after': str(self.config.retry_after), **self._rate_limit_headers(),
+                       'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': f"{self.config.retry_after}s"}
+            self._send_error(429, "Rate limit reached for requests.", 'requests', headers)
+            return
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.config.count('injected_errors')
+            self._send_error(500, "The server had an error while processing your request.", 'server_error')
+            return
+
+        prompt = ' '.join(message.get('content', '') for message in data.get('messages', []))
+        max_tokens = data.get('max_tokens') or 300
+        choices = []
+        previous = None
+        for index in range(data.get('n', 1)):
+            previous = build_completion(prompt, index, max_tokens, self.config, previous)
+            choices.append(previous)
+        usage = {
+            'prompt_tokens': _estimate_tokens(prompt),
+            'completion_tokens': sum(tokens for _, _, tokens in choices),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if data.get('stream'):
+            self.config.count('streams')
+            self._stream(data, choices, usage)
+            return
+        self.config.count('completions')
+        self._send_json(200, {
+            'id': f"chatcmpl-stub-{time.time_ns()}",
+            'object': 'chat.completion',
+            'model': data.get('model', 'gpt-4'),
+            'choices': [
+                {'index': index, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': finish_reason}
+                for index, (text, finish_reason, _) in enumerate(choices)
+            ],
+            'usage': usage,
+        }, self._rate_limit_headers())
+
+    def _stream(self, data, choices, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        for name, value in self._rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def send_event(payload):
+            event = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(event):X}\r\n".encode('ascii') + event + b"\r\n")
+            self.wfile.flush()
+
+        words = [text.split(' ') for text, _, _ in choices]
+        for position in range(max(len(choice_words) for choice_words in words)):
+            for index, choice_words in enumerate(words):
+                if position < len(choice_words):
+                    content = choice_words[position] if position == 0 else f" {choice_words[position]}"
+                    send_event(json.dumps({'choices': [{'index': index, 'delta': {'content': content}, 'finish_reason': None}]}))
+            time.sleep(self.config.token_delay_ms / 1000)
+        for index, (_, finish_reason, _) in enumerate(choices):
+            send_event(json.dumps({'choices': [{'index': index, 'delta': {}, 'finish_reason': finish_reason}]}))
+        if data.get('stream_options', {}).get('include_usage'):
+            send_event(json.dumps({'choices': [], 'usage': usage}))
+        send_event('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def create_server(host='127.0.0.1', port=8090, config=None):
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'config': config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions and models endpoints.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--latency-distribution', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--token-delay-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--completions', choices=['random', 'deterministic', 'duplicates'], default='random')
+    parser.add_argument('--duplicate-rate', type=float, default=0.5)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    config = StubConfig(
+        latency_ms=args.latency_ms, latency_distribution=args.latency_distribution, latency_sigma=args.latency_sigma,
+        token_delay_ms=args.token_delay_ms, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, completions=args.completions, duplicate_rate=args.duplicate_rate, seed=args.seed,
+    )
+    server = create_server(args.host, args.port, config)
+    log.info("OpenAI stub listening on http://%s:%s/v1", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log.info("Stub stats: %s", config.stats)
+
+if __name__ == '__main__':
+    main()
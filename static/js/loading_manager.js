@@ -235,6 +235,12 @@ const LoadingManager = {
                 const numOutputs = Math.max(1, parseInt(numOutputsInput?.value, 10) || 1);
 
                 log.debug(`LoadingManager: Form submitted with ${numOutputs} output(s).`);
+                if (typeof StreamManager !== 'undefined' && StreamManager.isSupported(form)) {
+                    // Stream immediately; the loader is cleared when the first event arrives.
+                    this.showLoading(numOutputs, () => {});
+                    StreamManager.submit(form);
+                    return;
+                }
                 this.showLoading(numOutputs, submitForm);
             });
             log.debug('LoadingManager: Form submit event listener attached.');
@@ -1,21 +1,113 @@
 /**
  * Logger module to handle logging at various levels.
- * Logs messages to the server or console, detecting the original caller file.
+ * Logs messages to the console immediately and sends them to the server in batches,
+ * detecting the original caller file.
  */
 
 const LOGGING_ENDPOINT = '/log';
+const LOG_BATCH_SIZE = 20;
+const LOG_FLUSH_INTERVAL_MS = 2000;
+const LOG_MAX_BUFFER = 200;
+
+const LogBuffer = {
+    entries: [],
+    timer: null,
+    clientId: null,
+
+    getClientId() {
+        if (!this.clientId) {
+            try {
+                this.clientId = sessionStorage.getItem('logClientId');
+                if (!this.clientId) {
+                    this.clientId = Math.random().toString(36).slice(2);
+                    sessionStorage.setItem('logClientId', this.clientId);
+                }
+            } catch (error) {
+                this.clientId = 'anonymous';
+            }
+        }
+        return this.clientId;
+    },
+
+    add(entry) {
+        if (this.entries.length >= LOG_MAX_BUFFER) {
+            this.entries.shift(); // Drop the oldest entry rather than grow without bound
+        }
+        this.entries.push(entry);
+        if (this.entries.length >= LOG_BATCH_SIZE) {
+            this.flush();
+        } else if (!this.timer) {
+            this.timer = setTimeout(() => this.flush(), LOG_FLUSH_INTERVAL_MS);
+        }
+    },
+
+    takeBatch() {
+        clearTimeout(this.timer);
+        this.timer = null;
+        const batch = this.entries;
+        this.entries = [];
+        return JSON.stringify({ client_id: this.getClientId(), entries: batch });
+    },
+
+    flush() {
+        if (!this.entries.length) return;
+        const body = this.takeBatch();
+        fetch(LOGGING_ENDPOINT, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: body,
+            keepalive: true,
+        })
+            .then((response) => {
+                if (!response.ok) {
+                    console.error(`Failed to send log batch to server: ${response.statusText}`);
+                }
+            })
+            .catch((error) => {
+                console.error('Error sending log batch to server:', error);
+            });
+    },
+
+    flushOnUnload() {
+        if (!this.entries.length) return;
+        const body = this.takeBatch();
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon(LOGGING_ENDPOINT, new Blob([body], { type: 'application/json' }));
+        }
+    },
+};
+
+window.addEventListener('pagehide', () => LogBuffer.flushOnUnload());
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') LogBuffer.flushOnUnload();
+});
+
+// Bundles built by helpers/static_assets.py start by declaring BUNDLE_SOURCES, the
+// first line of each file they contain, so callers inside a bundle resolve to their source file
+function getSourceFile(filePath, lineNumber) {
+    const fileName = filePath.substring(filePath.lastIndexOf('/') + 1); // Extract only the file name
+    if (typeof BUNDLE_SOURCES === 'undefined' || !fileName.startsWith(`${BUNDLE_SOURCES.bundle}.`)) {
+        return fileName;
+    }
+    let sourceFile = fileName;
+    for (const [firstLine, source] of BUNDLE_SOURCES.lines) {
+        if (lineNumber >= firstLine) sourceFile = source;
+    }
+    return sourceFile;
+}
 
 function getOriginalCallerFile() {
     const error = new Error();
     const stackLines = error.stack.split('\n');
     // Find the first stack line outside `logger.js`
     for (let i = 2; i < stackLines.length; i++) {
-        const line = stackLines[i];
-        if (!line.includes('logger.js')) { // Skip any calls from this file
-            const matches = line.match(/at\s+(.*?):(\d+):(\d+)/); // Extract file path
-            if (matches) {
-                const filePath = matches[1];
-                return filePath.substring(filePath.lastIndexOf('/') + 1); // Extract only the file name
+        const matches = stackLines[i].match(/at\s+(.*?):(\d+):(\d+)/); // Extract file path and line
+        if (matches) {
+            const fileName = getSourceFile(matches[1], Number(matches[2]));
+            if (fileName !== 'logger.js') { // Skip any calls from this file
+                return fileName;
             }
         }
     }
@@ -25,36 +117,16 @@ function getOriginalCallerFile() {
 function log(level, message) {
     const fileName = getOriginalCallerFile(); // Detect the original caller
     const formattedMessage = `${fileName} - ${message}`;
-    const prefixedMessage = `JavaScript: ${formattedMessage}`;
-    const payload = {
-        level: level,
-        message: formattedMessage,
-        fileName: fileName,
-    };
 
     // Output to the console in the desired format
     console.log(`app-1  | ${level.toUpperCase()} - ${formattedMessage}`);
 
-    // Send log to server
-    fetch(LOGGING_ENDPOINT, {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(payload),
-    })
-        .then((response) => {
-            if (!response.ok) {
-                console.error(
-                    `Failed to send ${level} log to server: ${response.statusText}`
-                );
-            } else {
-                console.info(`Log (${level}) sent to server successfully.`);
-            }
-        })
-        .catch((error) => {
-            console.error(`Error sending ${level} log to server:`, error);
-        });
+    // Queue the log for the next batch sent to the server
+    LogBuffer.add({
+        level: level,
+        message: formattedMessage,
+        fileName: fileName,
+    });
 }
 
 // Helper functions for different levels of logging
@@ -62,4 +134,4 @@ log.debug = (message) => log('debug', message);
 log.info = (message) => log('info', message);
 log.warn = (message) => log('warn', message);
 log.error = (message) => log('error', message);
-log.critical = (message) => log('critical', message);
\ No newline at end of file
+log.critical = (message) => log('critical', message);
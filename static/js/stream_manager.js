@@ -0,0 +1,152 @@
+/**
+ * Parent Manager: StreamManager
+ * Submits the form to the streaming endpoint and renders outputs as tokens arrive.
+ * Falls back to a regular form submission when streaming is unavailable or rejected.
+ */
+const StreamManager = {
+    container: null,
+    firstEventReceived: false,
+
+    isSupported(form) {
+        return Boolean(form && form.dataset.streamUrl && window.fetch && window.ReadableStream && window.TextDecoder);
+    },
+
+    async submit(form) {
+        this.container = document.getElementById('streamOutputs');
+        this.firstEventReceived = false;
+        log.debug(`StreamManager: Submitting form to ${form.dataset.streamUrl}.`);
+
+        let response;
+        try {
+            response = await fetch(form.dataset.streamUrl, {
+                method: 'POST',
+                body: new FormData(form),
+                headers: { Accept: 'text/event-stream' },
+            });
+        } catch (error) {
+            log.error(`StreamManager: Streaming request failed, falling back to form submit: ${error}`);
+            form.submit();
+            return;
+        }
+
+        if (!response.ok || !response.body) {
+            log.warn(`StreamManager: Streaming rejected (${response.status}), falling back to form submit.`);
+            form.submit();
+            return;
+        }
+
+        this.prepareContainer(form);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                this.dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+        log.debug('StreamManager: Stream closed.');
+    },
+
+    dispatch(rawEvent) {
+        let type = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach((line) => {
+            if (line.startsWith('event:')) type = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        const payload = data ? JSON.parse(data) : {};
+
+        if (!this.firstEventReceived) {
+            this.firstEventReceived = true;
+            LoadingManager.reset();
+            this.container.style.display = 'block';
+        }
+
+        switch (type) {
+            case 'start':
+                this.getTextarea(payload.slot).value = '';
+                break;
+            case 'delta':
+                this.getTextarea(payload.slot).value += payload.content;
+                break;
+            case 'output':
+                this.getTextarea(payload.slot).value = payload.text;
+                break;
+            case 'done':
+                payload.output_texts.forEach((text, slot) => {
+                    this.getTextarea(slot).value = text;
+                });
+                (payload.output_statuses || []).forEach((status, slot) => {
+                    if (status !== 'accepted') this.showSlotError(slot, status);
+                });
+                this.showSummary(payload);
+                payload.errors.forEach((message) => this.showError(message));
+                break;
+            case 'error':
+                this.showError(payload.message);
+                break;
+            default:
+                log.warn(`StreamManager: Unknown event type "${type}".`);
+        }
+    },
+
+    prepareContainer(form) {
+        const numOutputs = Math.max(1, parseInt(form.querySelector('#num_outputs')?.value, 10) || 1);
+        this.container.innerHTML = '<h2>Generated Outputs</h2>';
+        for (let slot = 0; slot < numOutputs; slot++) {
+            this.getTextarea(slot);
+        }
+        log.debug(`StreamManager: Prepared ${numOutputs} output container(s).`);
+    },
+
+    getTextarea(slot) {
+        const id = `outputTextarea${slot + 1}`;
+        let textarea = this.container.querySelector(`#${id}`);
+        if (!textarea) {
+            const outputContainer = document.createElement('div');
+            outputContainer.className = 'output-container';
+            outputContainer.innerHTML = `<h3>Output ${slot + 1}</h3><div class="textarea-container">`
+                + `<textarea id="${id}" name="${id}" rows="9" readonly aria-label="Generated Output ${slot + 1}"></textarea></div>`;
+            this.container.appendChild(outputContainer);
+            textarea = outputContainer.querySelector('textarea');
+        }
+        return textarea;
+    },
+
+    showSummary(payload) {
+        const summary = document.createElement('div');
+        summary.className = 'total-tokens-cost-info';
+        summary.innerText = `${payload.total_tokens_used} Total Tokens · ~$${payload.total_estimated_cost.toFixed(6)}`;
+        this.container.appendChild(document.createElement('br'));
+        this.container.appendChild(summary);
+    },
+
+    showSlotError(slot, status) {
+        const messages = {
+            'over-limit': 'Failed to generate an output within the sentence limit.',
+            'empty': 'The model returned an empty output.',
+        };
+        const errorElement = document.createElement('div');
+        errorElement.className = 'error-message';
+        errorElement.innerHTML = '<p></p>';
+        errorElement.firstChild.innerText = `Error: ${messages[status] || 'Failed to generate a unique output.'}`;
+        this.getTextarea(slot).closest('.output-container').appendChild(errorElement);
+        log.debug(`StreamManager: Slot ${slot + 1} finished with status "${status}".`);
+    },
+
+    showError(message) {
+        const errorElement = document.getElementById('output-error');
+        if (errorElement) {
+            const paragraph = document.createElement('p');
+            paragraph.innerText = message.startsWith('Error:') ? message : `Error: ${message}`;
+            errorElement.appendChild(paragraph);
+        }
+        log.error(`StreamManager: ${message}`);
+    },
+};
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from importlib.util import find_spec
+import pytest
+from flask import Flask
+from helpers.generators.batch_generator import rewrite_batch
+from helpers.requestors._http_client import configure_http_client
+from helpers.requestors.openai_api_requestor import configure_openai_base_url
+from loadtest.openai_stub import StubConfig, create_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SETTINGS = {'speculative_outputs': 0, 'batch_size': 5, 'max_concurrency': 2}
+
+# Runs batches from concurrent greenlets in a gevent-patched process, as the
+# gevent worker does, while a heartbeat greenlet checks the hub is never blocked
+GEVENT_SCRIPT = r"""
+from gevent import monkey
+monkey.patch_all()
+import json, threading, time
+import gevent
+from flask import Flask
+from helpers.generators.batch_generator import rewrite_batch
+from helpers.requestors.openai_api_requestor import configure_openai_base_url
+from loadtest.openai_stub import StubConfig, create_server
+
+server = create_server('127.0.0.1', 0, StubConfig(latency_ms=200, latency_distribution='fixed', token_delay_ms=0))
+threading.Thread(target=server.serve_forever, daemon=True).start()
+configure_openai_base_url(f"http://127.0.0.1:{server.server_port}/v1")
+app = Flask(__name__, static_folder='static')
+settings = {'speculative_outputs': 0, 'batch_size': 5, 'max_concurrency': 2}
+
+def batch(number):
+    jobs = [{'input_text': f"Thanks for the update on venue {number}-{index}."} for index in range(2)]
+    with app.app_context():
+        return rewrite_batch(jobs, 'sk-test', settings, 2, cache_bypass=True)
+
+ticks = []
+heartbeat = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.01)) for _ in iter(int, 1)])
+started_at = time.monotonic()
+results = [greenlet.get(timeout=30) for greenlet in [gevent.spawn(batch, number) for number in range(3)]]
+elapsed = time.monotonic() - started_at
+heartbeat.kill()
+print(json.dumps({'statuses': [job['status'] for result in results for job in result['jobs']], 'ticks': len(ticks), 'elapsed': elapsed}))
+"""
+
+@pytest.fixture
+def stub_server():
+    server = create_server('127.0.0.1', 0, StubConfig(latency_ms=20, latency_distribution='fixed', token_delay_ms=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configure_openai_base_url(f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+    configure_openai_base_url()
+
+def test_rewrite_batch_reuses_connections(stub_server):
+    client = configure_http_client()
+    jobs = [{'input_text': f"Thanks for the update on venue {index}.", 'num_outputs': 2} for index in range(4)] + ['not a job']
+    with Flask(__name__, static_folder=os.path.join(ROOT, 'static')).app_context():
+        result = rewrite_batch(jobs, 'sk-test', SETTINGS, 2, cache_bypass=True)
+    assert [job['status'] for job in result['jobs']] == ['success'] * 4 + ['error']
+    assert all(len(job['outputs']) == 2 for job in result['jobs'][:4])
+    stats = client.get_stats()
+    assert stats['handshakes'] <= 2
+    assert stats['reused'] == stats['requests'] - stats['handshakes'] > 0
+
+@pytest.mark.skipif(find_spec('gevent') is None, reason="gevent is not installed")
+def test_rewrite_batch_from_concurrent_gevent_greenlets():
+    completed = subprocess.run([sys.executable, '-c', GEVENT_SCRIPT], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert result['statuses'] == ['success'] * 6
+    # Six 200ms jobs in three batches overlap instead of running one after another
+    assert result['elapsed'] < 1.0
+    assert result['ticks'] >= 10
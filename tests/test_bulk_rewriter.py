@@ -0,0 +1,94 @@
+import json
+import os
+import pytest
+from helpers import bulk_rewriter
+from helpers.bulk_rewriter import load_checkpoint, main, run_bulk_rewrite, save_checkpoint
+
+def write_results(output_path, results, checkpoint=True):
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        for result in results:
+            output_file.write(json.dumps(result) + '\n')
+        if checkpoint:
+            save_checkpoint(str(output_path), output_file, {'written': len(results)})
+
+def read_ids(output_path):
+    with open(output_path, 'r', encoding='utf-8') as file:
+        return [json.loads(line)['id'] for line in file]
+
+RESULTS = [{'id': '1', 'status': 'success'}, {'id': '2', 'status': 'error'}, {'id': '3', 'status': 'success'}]
+
+def test_resume_drops_results_after_the_checkpoint(tmp_path):
+    output_path = tmp_path / 'out.jsonl'
+    write_results(output_path, RESULTS)
+    with open(output_path, 'a', encoding='utf-8') as file:
+        file.write('{"id": "4", "status": "succ')
+    assert load_checkpoint(str(output_path)) == {'1', '2', '3'}
+    assert read_ids(output_path) == ['1', '2', '3']
+
+def test_retry_failed_removes_failed_results(tmp_path):
+    output_path = tmp_path / 'out.jsonl'
+    write_results(output_path, RESULTS)
+    assert load_checkpoint(str(output_path), retry_failed=True) == {'1', '3'}
+    assert read_ids(output_path) == ['1', '3']
+
+    # A retried record is appended once, and resuming again keeps everything
+    with open(output_path, 'a', encoding='utf-8') as output_file:
+        output_file.write(json.dumps({'id': '2', 'status': 'success'}) + '\n')
+        save_checkpoint(str(output_path), output_file, {})
+    assert load_checkpoint(str(output_path), retry_failed=True) == {'1', '2', '3'}
+    assert read_ids(output_path) == ['1', '3', '2']
+
+def test_retry_failed_survives_a_stop_before_the_checkpoint_update(tmp_path):
+    output_path = tmp_path / 'out.jsonl'
+    write_results(output_path, RESULTS)
+    # The output was rewritten without its failed result, but the checkpoint still has the old length
+    write_results(output_path, [RESULTS[0], RESULTS[2]], checkpoint=False)
+    assert load_checkpoint(str(output_path), retry_failed=True) == {'1', '3'}
+    assert read_ids(output_path) == ['1', '3']
+
+def test_resume_without_a_checkpoint_keeps_the_output(tmp_path, capsys):
+    output_path = tmp_path / 'out.jsonl'
+    write_results(output_path, RESULTS, checkpoint=False)
+    with pytest.raises(FileNotFoundError):
+        load_checkpoint(str(output_path))
+    assert main([str(tmp_path / 'in.jsonl'), str(output_path), '--resume']) == 2
+    assert 'No checkpoint' in capsys.readouterr().err
+    assert read_ids(output_path) == ['1', '2', '3']
+
+def test_api_key_can_come_from_the_env_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.setattr(bulk_rewriter, 'load_dotenv', lambda: monkeypatch.setenv('OPENAI_API_KEY', 'sk-from-env-file'))
+    monkeypatch.setattr(bulk_rewriter, 'init_logging', lambda level: None)
+    monkeypatch.setattr(bulk_rewriter, 'configure_http_client', lambda: None)
+    validated = []
+    monkeypatch.setattr(bulk_rewriter, 'validate_api_key', lambda api_key: validated.append(api_key) or "stop here")
+
+    assert main([str(tmp_path / 'in.jsonl'), str(tmp_path / 'out.jsonl')]) == 2
+    assert validated == ['sk-from-env-file']
+
+def rewrite_or_fail(chunk, *args):
+    # Runs in the pool's processes: record 2 raises, and record 3 kills its process
+    record_ids = [record_id for record_id, _ in chunk]
+    if '2' in record_ids:
+        raise ValueError("unexpected job")
+    if '3' in record_ids:
+        os._exit(1)
+    return [{'id': record_id, 'status': 'success', 'total_tokens_used': 1, 'total_estimated_cost': 0.0} for record_id in record_ids]
+
+def test_failed_chunks_are_written_as_failures(tmp_path, monkeypatch):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    input_path.write_text(''.join(json.dumps({'id': str(number), 'input_text': 'Hi'}) + '\n' for number in range(1, 7)))
+    monkeypatch.setattr(bulk_rewriter, 'rewrite_chunk', rewrite_or_fail)
+
+    stats = run_bulk_rewrite(str(input_path), str(output_path), 'sk-key', processes=1, chunk_size=1)
+
+    with open(output_path, 'r', encoding='utf-8') as file:
+        results = {result['id']: result for result in map(json.loads, file)}
+    assert sorted(results) == ['1', '2', '3', '4', '5', '6']
+    assert results['2']['errors'] == {'job': "Rewriting failed: unexpected job"}
+    assert results['3']['status'] == 'error'
+    # Records after the crash are rewritten by new processes
+    assert results['6']['status'] == 'success'
+    assert stats['written'] == 6 and stats['failed'] == sum(result['status'] != 'success' for result in results.values())
+    assert load_checkpoint(str(output_path), retry_failed=True) == {
+        record_id for record_id, result in results.items() if result['status'] == 'success'}
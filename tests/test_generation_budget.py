@@ -0,0 +1,37 @@
+from helpers.generators._generation_budget import (
+    MAX_TOKENS_CEILING, MIN_TOKENS_FLOOR, drop_unfinished_sentence, estimate_text_tokens, plan_max_tokens,
+    trim_to_sentence_limit
+)
+
+EXPANDED_SHORT_EMAIL = (
+    "Dear Ms Patel,\n\n"
+    "Thank you for getting back to me so quickly about the venue. "
+    "Tuesday afternoon suits me well, and I can come to your office if that is easier for you. "
+    "I will bring the revised floor plan and the catering quotes we discussed last week. "
+    "Please let me know if anyone else from your team would like to join us.\n\n"
+    "Kind regards,\nSam"
+)
+
+def test_expanded_short_email_fits_without_a_sentence_limit():
+    max_tokens = plan_max_tokens({'channel': 'email', 'sentence_limit': '∞', 'input_text': 'Tuesday works, see you then.'})
+    assert estimate_text_tokens(EXPANDED_SHORT_EMAIL) <= max_tokens
+
+def test_short_chat_without_a_sentence_limit_has_room_for_a_few_sentences():
+    max_tokens = plan_max_tokens({'channel': 'chat', 'sentence_limit': '∞', 'input_text': 'ok'})
+    assert max_tokens >= 4 * 30
+
+def test_long_input_is_capped():
+    max_tokens = plan_max_tokens({'channel': 'email', 'sentence_limit': '∞', 'input_text': 'word ' * 2000})
+    assert max_tokens == MAX_TOKENS_CEILING
+
+def test_sentence_limit_sets_the_budget():
+    assert plan_max_tokens({'channel': 'chat', 'sentence_limit': 1, 'input_text': 'word ' * 200}) == 67
+    assert plan_max_tokens({'channel': 'chat', 'sentence_limit': 0, 'input_text': ''}) == MIN_TOKENS_FLOOR
+
+def test_drop_unfinished_sentence():
+    assert drop_unfinished_sentence("First one. Second one is cut") == "First one."
+    assert drop_unfinished_sentence("No sentence end") == "No sentence end"
+
+def test_trim_to_sentence_limit():
+    assert trim_to_sentence_limit("One. Two! Three?", 2) == "One. Two!"
+    assert trim_to_sentence_limit("One. Two!", '∞') == "One. Two!"
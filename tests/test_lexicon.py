@@ -0,0 +1,77 @@
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from flask import Flask
+from helpers import lexicon_compiler
+from helpers.lexicon_compiler import compile_lexicons
+from helpers.processors import _lexicon
+from helpers.processors._lexicon import configure_lexicons, get_lexicon_stats
+from helpers.processors._word_mapper import map_words
+
+SPELLING = {'color': 'colour', 'organize': 'organise', 'center': 'centre'}
+VOCABULARY = {'candy': 'sweets', 'parking lot': 'car park'}
+OVERLAY = {'candy': 'lollies'}
+TEXT = "The Color of the candy at the parking lot center. We organized it."
+
+@pytest.fixture
+def static_folder(tmp_path, monkeypatch):
+    (tmp_path / 'json').mkdir()
+    for name, mapping in (('spelling', SPELLING), ('vocabulary', VOCABULARY), ('overlay', OVERLAY)):
+        (tmp_path / 'json' / f'{name}.json').write_text(json.dumps(mapping))
+    lexicons = {
+        'lexicon/overlay.lex': ('json/overlay.json',),
+        'lexicon/base.lex': ('json/spelling.json', 'json/vocabulary.json'),
+    }
+    monkeypatch.setattr(_lexicon, 'LEXICONS', lexicons)
+    monkeypatch.setattr(lexicon_compiler, 'LEXICONS', lexicons)
+    yield tmp_path
+    configure_lexicons(False)
+
+def mapped(static_folder, text, mapping_files, inflections=False):
+    configure_lexicons(inflections)
+    with Flask(__name__, static_folder=str(static_folder)).app_context():
+        return map_words(text, mapping_files)
+
+BASE = ['json/spelling.json', 'json/vocabulary.json']
+
+def test_compiled_lexicon_matches_the_in_memory_tables(static_folder):
+    for inflections in (False, True):
+        expected = mapped(static_folder, TEXT, BASE, inflections)
+        compile_lexicons(str(static_folder), inflect=inflections)
+        fallbacks = get_lexicon_stats()['fallbacks']
+        assert mapped(static_folder, TEXT, BASE, inflections) == expected
+        assert get_lexicon_stats()['fallbacks'] == fallbacks
+
+def test_inflections_are_opt_in(static_folder):
+    assert mapped(static_folder, TEXT, BASE) == "The Colour of the sweets at the car park centre. We organized it."
+    assert mapped(static_folder, TEXT, BASE, inflections=True) == "The Colour of the sweets at the car park centre. We organised it."
+
+def test_lexicon_compiled_with_other_settings_falls_back(static_folder):
+    compile_lexicons(str(static_folder), inflect=True)
+    fallbacks = get_lexicon_stats()['fallbacks']
+    assert mapped(static_folder, TEXT, BASE) == "The Colour of the sweets at the car park centre. We organized it."
+    assert get_lexicon_stats()['fallbacks'] == fallbacks + 1
+
+def test_overlay_takes_precedence(static_folder):
+    compile_lexicons(str(static_folder))
+    assert mapped(static_folder, "Some candy, and more candies.", ['json/overlay.json'] + BASE) == "Some lollies, and more candies."
+
+def test_files_are_checked_at_most_once_per_interval(static_folder, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(_lexicon, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+    compile_lexicons(str(static_folder))
+    assert mapped(static_folder, "candy", BASE) == "sweets"
+
+    vocabulary = static_folder / 'json' / 'vocabulary.json'
+    vocabulary.write_text(json.dumps({'candy': 'lollies'}))
+    os.utime(vocabulary, (clock[0] + 60, clock[0] + 60))
+    checked = []
+    stat = os.stat
+    monkeypatch.setattr(_lexicon.os, 'stat', lambda path: checked.append(path) or stat(path))
+    with Flask(__name__, static_folder=str(static_folder)).app_context():
+        assert map_words("candy", BASE) == "sweets"
+        assert not [path for path in checked if path.endswith('.lex')]
+
+        clock[0] += _lexicon.CHECK_INTERVAL
+        assert map_words("candy", BASE) == "lollies"
@@ -0,0 +1,58 @@
+import re
+import pytest
+from flask import Flask, Response
+from helpers import metrics
+from helpers.metrics import configure_metrics, format_labels, render_metrics, require_scrape_access
+
+# A sample line of the Prometheus text format, with label values escaped
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="([^"\\\n]|\\[\\"n])*",?)*\})? \S+$')
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, '_registry', registry)
+    monkeypatch.setattr(metrics, '_metrics_dir', '')
+    return registry
+
+def scrape_app(token='', allowed_networks=metrics.DEFAULT_ALLOWED_NETWORKS):
+    configure_metrics(metrics_dir='', token=token, allowed_networks=allowed_networks)
+    app = Flask(__name__)
+
+    @app.route('/metrics')
+    def scrape():
+        require_scrape_access()
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    return app
+
+def test_label_values_are_escaped(registry):
+    route = 'C:\\path "quoted"\nnext'
+    registry.inc('rewriter_upstream_responses_total', {'status': route})
+    registry.observe('rewriter_http_request_duration_seconds', 0.2, {'route': route, 'method': 'GET', 'status': 200})
+
+    lines = [line for line in render_metrics().splitlines() if not line.startswith('#')]
+
+    assert format_labels({'route': route}) == 'route="C:\\\\path \\"quoted\\"\\nnext"'
+    assert lines and all(SAMPLE_LINE.match(line) for line in lines), lines
+
+@pytest.mark.parametrize('remote_addr, headers, status', [
+    ('127.0.0.1', {}, 200),
+    ('::1', {}, 200),
+    ('::ffff:127.0.0.1', {}, 200),
+    ('203.0.113.9', {}, 403),
+    ('203.0.113.9', {'Authorization': 'Bearer wrong'}, 403),
+    ('203.0.113.9', {'Authorization': 'Bearer scrape-secret'}, 200),
+])
+def test_scrapes_need_an_allowed_address_or_the_token(registry, remote_addr, headers, status):
+    app = scrape_app(token='scrape-secret')
+
+    response = app.test_client().get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': remote_addr})
+
+    assert response.status_code == status
+
+def test_empty_token_never_matches(registry):
+    app = scrape_app(token='', allowed_networks='')
+
+    response = app.test_client().get('/metrics', headers={'Authorization': 'Bearer '}, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+
+    assert response.status_code == 403
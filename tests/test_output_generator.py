@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask
+from helpers.generators import output_generator
+from helpers.generators.batch_generator import validate_job
+from helpers.generators.output_generator import stream_output_text
+
+def choice_chunks(index, text, finished=True):
+    chunks = [{'choices': [{'index': index, 'delta': {'content': word + ' '}}]} for word in text.split()]
+    if finished:
+        chunks.append({'choices': [{'index': index, 'delta': {}, 'finish_reason': 'stop'}]})
+    return chunks
+
+@pytest.fixture
+def app_context():
+    with Flask(__name__, static_folder='../static').app_context():
+        yield
+
+def test_slots_whose_stream_never_finishes_end_empty(app_context, monkeypatch):
+    parameters, errors, _ = validate_job({'input_text': "Thanks for the update.", 'num_outputs': 2, 'uniqueness_attempts': 2},
+                                         'sk-test', cache_bypass=True)
+    assert not errors
+    attempts = []
+
+    def stream(parameters, prompt, num_outputs):
+        attempts.append(num_outputs)
+        # The second choice is cut off on every attempt
+        if len(attempts) == 1:
+            return choice_chunks(0, "Thank you for the update.") + choice_chunks(1, "Many thanks for", finished=False)
+        return choice_chunks(0, "Thanks a lot", finished=False)
+
+    monkeypatch.setattr(output_generator, 'make_streaming_api_call', stream)
+
+    events = list(stream_output_text(parameters))
+
+    outputs = [event for event in events if event['event'] == 'output']
+    assert [(event['slot'], event['status']) for event in outputs] == [(0, 'accepted'), (1, 'empty')]
+    assert outputs[1]['unique'] is False
+    assert attempts == [2, 1]
+    assert events[-1]['event'] == 'done'
+    assert events[-1]['output_statuses'] == ['accepted', 'empty']
@@ -0,0 +1,54 @@
+from helpers.validators.output_validator import (
+    SLOT_ACCEPTED, SLOT_DUPLICATE, SLOT_OVER_LIMIT, SLOT_PENDING, create_uniqueness_index, fill_unique_slots
+)
+
+def fill(candidates, tokens, pending_indices, num_outputs=3, existing=(), sentence_limit='∞'):
+    output_texts = [''] * num_outputs
+    tokens_tracker = [0] * num_outputs
+    unique_outputs = create_uniqueness_index()
+    for text in existing:
+        unique_outputs.add(text)
+    slot_statuses = [SLOT_PENDING] * num_outputs
+    remaining = fill_unique_slots(
+        candidates, tokens, pending_indices, output_texts, tokens_tracker, unique_outputs, slot_statuses, sentence_limit
+    )
+    return remaining, output_texts, tokens_tracker, slot_statuses
+
+def test_unique_candidates_fill_slots_in_order():
+    remaining, output_texts, tokens_tracker, slot_statuses = fill(
+        ['Thanks for the update.', 'See you at the venue.', 'Happy to help with that.'], [5, 6, 7], [0, 1, 2])
+    assert remaining == []
+    assert output_texts == ['Thanks for the update.', 'See you at the venue.', 'Happy to help with that.']
+    assert tokens_tracker == [5, 6, 7]
+    assert slot_statuses == [SLOT_ACCEPTED] * 3
+
+def test_slots_no_candidate_reached_take_the_last_rejection():
+    remaining, _, tokens_tracker, slot_statuses = fill(
+        ['Thanks for the update.', 'Thanks for the update!'], [4, 4], [0, 1, 2])
+    assert remaining == [1, 2]
+    assert slot_statuses == [SLOT_ACCEPTED, SLOT_DUPLICATE, SLOT_DUPLICATE]
+    assert tokens_tracker == [4, 4, 0]
+
+def test_every_candidate_rejected():
+    remaining, output_texts, tokens_tracker, slot_statuses = fill(
+        ['One. Two. Three.', 'Already sent.', 'One. Two. Three. Four.'], [3, 5, 7], [0, 1, 2],
+        existing=['already sent'], sentence_limit=2)
+    assert remaining == [0, 1, 2]
+    assert output_texts == ['', '', '']
+    assert slot_statuses == [SLOT_OVER_LIMIT, SLOT_DUPLICATE, SLOT_OVER_LIMIT]
+    assert tokens_tracker == [3, 5, 7]
+
+def test_rejections_are_charged_across_the_waiting_slots():
+    remaining, _, tokens_tracker, slot_statuses = fill(
+        ['Already sent.', 'Already sent!', 'Already sent?', 'Brand new text.'], [1, 2, 4, 8], [0, 1],
+        num_outputs=2, existing=['already sent'])
+    assert remaining == [1]
+    assert slot_statuses == [SLOT_ACCEPTED, SLOT_DUPLICATE]
+    assert sum(tokens_tracker) == 15
+    assert tokens_tracker == [1 + 4 + 8, 2]
+
+def test_no_candidates_marks_pending_slots_as_duplicates():
+    remaining, _, tokens_tracker, slot_statuses = fill([], [], [0, 1], num_outputs=2)
+    assert remaining == [0, 1]
+    assert slot_statuses == [SLOT_DUPLICATE, SLOT_DUPLICATE]
+    assert tokens_tracker == [0, 0]
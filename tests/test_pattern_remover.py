@@ -0,0 +1,22 @@
+import re
+import pytest
+from helpers.processors._pattern_remover import remove_patterns
+
+def apply_in_order(text, rules):
+    for pattern, replacement in rules:
+        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+    return text.strip()
+
+@pytest.mark.parametrize('text, rules', [
+    # A later rule matches what an earlier one produced
+    ("tea time", [(r'tea', 'coffee'), (r'coffee', 'water')]),
+    # A later rule matches across text an earlier one removed
+    ("good, morning all", [(r',', ''), (r'good morning', 'hello')]),
+    # Rules whose matches overlap
+    ("abcdef", [(r'cd', '-'), (r'bcde', '+')]),
+    # Anchors and group references
+    ("  Dear team, thanks  ", [(r'^\s*dear (\w+),', r'To \1:'), (r'(thanks)$', r'\1!')]),
+    ("nothing to do", []),
+])
+def test_rule_lists_apply_in_order(text, rules):
+    assert remove_patterns(text, rules) == apply_in_order(text, rules)
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from urllib import error
+import pytest
+from helpers.generators.output_generator import handle_generation_error
+from helpers.requestors import _rate_limiter, openai_api_requestor
+from helpers.requestors._rate_limiter import BUDGET_IDLE_SECONDS, RateLimiter
+from helpers.requestors.openai_api_requestor import make_async_openai_request, make_openai_request, make_openai_stream_request
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(_rate_limiter, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_idle_budgets_are_evicted(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    for index in range(3):
+        limiter.acquire(f'sk-key-{index}', 10)
+    assert limiter.get_stats()['tracked_keys'] == 3
+
+    clock[0] += BUDGET_IDLE_SECONDS / 2
+    limiter.acquire('sk-key-1', 10)
+    clock[0] += BUDGET_IDLE_SECONDS / 2 + 1
+    assert limiter.get_stats()['tracked_keys'] == 1
+
+    clock[0] += BUDGET_IDLE_SECONDS + 1
+    assert limiter.get_stats()['tracked_keys'] == 0
+
+def test_recreated_budget_matches_a_refilled_one(clock):
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=6000, max_wait=0)
+    limiter.acquire('sk-key', 10)
+    limiter.acquire('sk-key', 10)
+    with pytest.raises(TimeoutError):
+        limiter.acquire('sk-key', 10)
+    clock[0] += BUDGET_IDLE_SECONDS + 1
+    assert limiter.get_stats()['tracked_keys'] == 0
+    limiter.acquire('sk-key', 10)
+    limiter.acquire('sk-key', 10)
+    with pytest.raises(TimeoutError):
+        limiter.acquire('sk-key', 10)
+
+def test_blocked_budgets_are_kept(clock):
+    limiter = RateLimiter(max_delay=BUDGET_IDLE_SECONDS * 3)
+    limiter.acquire('sk-key', 10)
+    limiter.backoff('sk-key', 0, 429, {'retry-after': str(BUDGET_IDLE_SECONDS * 2)})
+    clock[0] += BUDGET_IDLE_SECONDS + 1
+    assert limiter.get_stats()['tracked_keys'] == 1
+    clock[0] += BUDGET_IDLE_SECONDS
+    assert limiter.get_stats()['tracked_keys'] == 0
+
+def test_waiting_budgets_are_kept():
+    limiter = RateLimiter(requests_per_minute=1, max_wait=120)
+    limiter.acquire('sk-key', 10)
+    errors = []
+    waiter = threading.Thread(target=lambda: errors.append(pytest.raises(TimeoutError, limiter.acquire, 'sk-key', 10)))
+    waiter.start()
+    budget = limiter._budgets[limiter._budget_key('sk-key')]
+    while not budget.waiters:
+        time.sleep(0.01)
+    budget.last_used -= BUDGET_IDLE_SECONDS + 1
+    assert limiter.get_stats()['tracked_keys'] == 1
+    with limiter._condition:
+        limiter.max_wait = 0
+        limiter._condition.notify_all()
+    waiter.join()
+    assert errors
+
+REQUEST = {'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 100, 'n': 1}
+ESTIMATED_TOKENS = 200
+
+def token_level(limiter):
+    return limiter._budgets[limiter._budget_key('sk-key')].tokens.level
+
+def always_failing(status):
+    def request(url, *args, **kwargs):
+        raise error.HTTPError(url, status, 'failed', {}, None)
+    return request
+
+async def async_always_failing(url, *args, **kwargs):
+    raise error.HTTPError(url, 503, 'failed', {}, None)
+
+def stream_always_failing(url, *args, **kwargs):
+    raise error.HTTPError(url, 503, 'failed', {}, None)
+    yield
+
+def call_sync(url):
+    return make_openai_request(url, 'sk-key', data=REQUEST)
+
+def call_async(url):
+    return asyncio.run(make_async_openai_request(url, 'sk-key', data=REQUEST))
+
+def call_stream(url):
+    return list(make_openai_stream_request(url, 'sk-key', data=REQUEST))
+
+@pytest.fixture
+def limiter(clock, monkeypatch):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_retries=2, base_delay=0, max_delay=0, max_wait=0)
+    monkeypatch.setattr(openai_api_requestor, 'get_rate_limiter', lambda: limiter)
+    monkeypatch.setattr(openai_api_requestor, 'make_api_request', always_failing(503))
+    monkeypatch.setattr(openai_api_requestor, 'make_async_api_request', async_always_failing)
+    monkeypatch.setattr(openai_api_requestor, 'make_api_stream_request', stream_always_failing)
+    return limiter
+
+@pytest.mark.parametrize('call', [call_sync, call_async, call_stream])
+def test_failed_attempts_give_back_their_estimate(limiter, call):
+    with pytest.raises(RuntimeError, match='experiencing issues'):
+        call('https://api.openai.com/v1/chat/completions')
+
+    assert limiter.get_stats()['retries'] == 2
+    assert token_level(limiter) == 1000
+
+@pytest.mark.parametrize('call', [call_sync, call_async, call_stream])
+def test_exhausted_budget_is_reported_as_our_rate_limit(limiter, call):
+    limiter._budget('sk-key').tokens.level = 0
+
+    with pytest.raises(RuntimeError, match='Rate limit budget') as raised:
+        call('https://api.openai.com/v1/chat/completions')
+
+    errors = []
+    handle_generation_error({}, [], 0, 0.0, errors, raised.value)
+    assert errors == ["Rate limit budget for this API key is exhausted. Please try again shortly."]
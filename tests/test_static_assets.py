@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import subprocess
+import pytest
+from helpers import static_assets
+from helpers.static_assets import BUNDLES, STATIC_FOLDER, build_assets, minify_js
+
+NODE = shutil.which('node')
+pytestmark = pytest.mark.skipif(NODE is None, reason="node is not installed")
+
+# Runs each script in one shared global scope, as script tags do, against a DOM
+# in which every element, property and call is a no-op stub. Fires the page
+# events and prints the log entries the scripts recorded.
+HARNESS = r"""
+const vm = require('vm');
+const fs = require('fs');
+const stub = new Proxy(function () {}, {
+    get(target, key) {
+        if (key === Symbol.toPrimitive) return () => '';
+        if (key === Symbol.iterator) return function* () {};
+        if (key === 'then') return undefined;
+        if (key === 'length') return 0;
+        return stub;
+    },
+    apply: () => stub,
+    construct: () => stub,
+});
+const listeners = [];
+const target = (name) => new Proxy({}, {
+    get(object, key) {
+        if (key === 'addEventListener') return (type, listener) => listeners.push([name, type, listener]);
+        if (key === 'visibilityState') return 'visible';
+        return stub;
+    },
+});
+const output = [];
+const context = vm.createContext({
+    window: target('window'),
+    document: target('document'),
+    sessionStorage: { getItem: () => 'client', setItem() {} },
+    navigator: {},
+    fetch: () => Promise.resolve({ ok: true }),
+    setTimeout: () => 0,
+    clearTimeout() {},
+    setInterval: () => 0,
+    clearInterval() {},
+    console: { log: (line) => output.push(line), error() {}, warn() {} },
+    Math, JSON, Date, Promise, Error, URL, URLSearchParams,
+});
+for (const [filename, path] of JSON.parse(process.argv[1])) {
+    new vm.Script(fs.readFileSync(path, 'utf8'), { filename }).runInContext(context);
+}
+for (const [name, type, listener] of listeners) {
+    if (name === 'window' && type === 'DOMContentLoaded') listener({});
+}
+const entries = vm.runInContext('LogBuffer.entries', context);
+console.log(JSON.stringify({ listeners: listeners.map(([name, type]) => `${name}:${type}`), output, entries }));
+"""
+
+def run_scripts(scripts):
+    """
+    Args:
+        scripts (list): (URL the script is served from, path on disk) pairs, in load order.
+    """
+    result = subprocess.run([NODE, '-e', HARNESS, json.dumps(scripts)], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def source_scripts(static_folder, sources):
+    return [(f"http://localhost/static/{source}", os.path.join(static_folder, source)) for source in sources]
+
+def built_bundle(static_folder, manifest, bundle):
+    return [(f"http://localhost/static/{manifest[bundle]}", os.path.join(static_folder, manifest[bundle]))]
+
+def test_bundle_behaves_like_its_sources(tmp_path):
+    static_folder = str(tmp_path / 'static')
+    shutil.copytree(STATIC_FOLDER, static_folder, ignore=shutil.ignore_patterns('dist', 'lexicon'))
+    manifest = build_assets(static_folder)
+
+    expected = run_scripts(source_scripts(static_folder, BUNDLES['js/app.js']))
+    actual = run_scripts(built_bundle(static_folder, manifest, 'js/app.js'))
+
+    assert expected['output'], "the page scripts should log while initializing"
+    assert actual == expected
+
+def test_bundled_log_calls_name_their_source_file(tmp_path, monkeypatch):
+    static_folder = tmp_path / 'static'
+    (static_folder / 'js').mkdir(parents=True)
+    shutil.copy(os.path.join(STATIC_FOLDER, 'js', 'logger.js'), static_folder / 'js' / 'logger.js')
+    (static_folder / 'js' / 'first.js').write_text("function first() {\n    log.info('one');\n}\n")
+    (static_folder / 'js' / 'second.js').write_text(
+        "window.addEventListener('DOMContentLoaded', () => {\n    first();\n    log.info('two');\n});\n")
+    sources = ['js/logger.js', 'js/first.js', 'js/second.js']
+    monkeypatch.setattr(static_assets, 'BUNDLES', {'js/app.js': sources})
+    manifest = build_assets(str(static_folder))
+
+    for scripts in (source_scripts(str(static_folder), sources), built_bundle(str(static_folder), manifest, 'js/app.js')):
+        entries = run_scripts(scripts)['entries']
+        assert [entry['fileName'] for entry in entries] == ['first.js', 'second.js']
+
+@pytest.mark.parametrize('source', [
+    "const pattern = /at\\s+(.*?):(\\d+)/; console.log(JSON.stringify('at a:1'.match(pattern)));",
+    "const a = 10, g = 2; console.log(a / g / 1, a /g/ 1);",
+    "const name = 'x'; console.log(`${name} // not a comment ${`nested ${name}`}`);",
+    "console.log('/* not a comment */', \"it's\");",
+    "let value = 1\nlet other = value\n++value\nconsole.log(value, other);",
+    "function f() {\n    return\n        1;\n}\nconsole.log(f());",
+    "const a = 1, b = 2; console.log(a - -b, a + +b, a+ ++[b][0]);",
+    "console.log(typeof /x/.test, [1, 2].map((n) => n * 2).join(','));",
+])
+def test_minify_js_preserves_behaviour(tmp_path, source):
+    results = []
+    for code in (source, minify_js(source)):
+        path = tmp_path / 'script.js'
+        path.write_text(code)
+        results.append(subprocess.run([NODE, str(path)], capture_output=True, text=True, check=True).stdout)
+    assert results[0] == results[1]
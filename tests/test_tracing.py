@@ -0,0 +1,44 @@
+import sys
+import time
+from types import SimpleNamespace
+import pytest
+from flask import Flask
+from helpers.tracing import init_tracing, make_trace_token, profiling_available
+
+@pytest.fixture
+def traces(monkeypatch):
+    written = []
+    monkeypatch.setattr('helpers.tracing._write_trace', lambda trace: written.append(trace.finish()))
+    return written
+
+def traced_app():
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test-secret'
+    init_tracing(app)
+
+    @app.route('/work')
+    def work():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return 'done'
+
+    return app
+
+def request_with_profile(app):
+    with app.test_client() as client:
+        response = client.get('/work', headers={'X-Trace-Token': make_trace_token('test-secret', profile=True)})
+        response.close()
+    return response
+
+def test_profile_is_recorded_with_threads(traces):
+    assert profiling_available()
+    request_with_profile(traced_app())
+    assert traces[0]['profile']['samples'] > 0
+
+def test_profile_is_skipped_when_gevent_patched_threading(traces, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'gevent.monkey', SimpleNamespace(is_module_patched=lambda name: name == 'threading'))
+    assert not profiling_available()
+    response = request_with_profile(traced_app())
+    assert response.headers['X-Trace']
+    assert 'profile' not in traces[0]